@@ -1,103 +1,289 @@
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
-from controllers.user_controller import create_user, get_users, get_user_by_username
-from controllers.product_controller import create_product, get_all_products, get_product_by_id, get_products_by_category
-from controllers.category_controller import get_categories
-from utils.db import connection_pool
-from models.category import Category
-from models.product import Product
-from models.user import User
-import stripe
-import os
-
-app = Flask(__name__, static_folder='static', static_url_path='/static')
-CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}})
-
-UPLOAD_FOLDER = 'uploads/images' 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}  
-
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Max file size (16 MB)
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-
-def initialize_database():
-    """Create tables and seed initial data."""
-    with connection_pool.getconn() as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(Category.create_table())
-            cursor.execute(Category.seed_categories())
-            cursor.execute(Product.create_table())
-            cursor.execute(User.create_table())
-            conn.commit()
-
-@app.route('/api/users', methods=['POST'])
-def user_creation():
-    return create_user()
-
-@app.route('/api/users', methods=['GET'])
-def list_users():
-    return get_users()
-
-@app.route('/api/users/<username>', methods=['GET'])
-def user_details(username):
-    return get_user_by_username(username)
-
-@app.route('/api/products', methods=['POST'])
-def product_creation():
-    return create_product()
-
-@app.route('/api/products', methods=['GET'])
-def list_products():
-    return get_all_products()
-
-@app.route('/api/products/category/<int:category_id>', methods=['GET'])
-def products_by_category(category_id):
-    return get_products_by_category(category_id)
-
-@app.route('/api/products/<int:product_id>', methods=['GET'])
-def product_details(product_id):
-    return get_product_by_id(product_id)
-
-@app.route('/api/categories', methods=['GET'])
-def categories_list():
-    return get_categories()
-
-@app.route('/images/<filename>')
-def serve_image(filename):
-    try:
-        return send_from_directory(UPLOAD_FOLDER, filename)
-    except Exception as e:
-        return {'message': f'Error: {str(e)}'}, 500
-    
-@app.route('/api/create-payment-intent', methods=['POST'])
-def create_payment_intent():
-    """
-    Creates a Stripe PaymentIntent for the specified amount.
-    """
-    try:
-        data = request.json
-        amount = int(data['amount'])  # Amount in cents (e.g., $10.00 -> 1000)
-        email = data.get('email', None)
-
-        payment_intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency="usd",
-            receipt_email=email,
-        )
-        return jsonify({"clientSecret": payment_intent.client_secret})
-    except Exception as e:
-        print(f"Error creating PaymentIntent: {e}")
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == '__main__':
-    initialize_database()
-    app.run(host='0.0.0.0', port=4000)
+import time
+from utils.startup import STARTED  # First, so the import time covers everything below
+from flask import Blueprint, Flask, current_app, request
+from flask_cors import CORS
+from controllers.user_controller import create_user, create_users, get_users, get_user_by_username
+from controllers.product_controller import create_product, get_all_products, get_product_by_id, get_products_batch, get_products_by_category, search_products
+from controllers.category_controller import get_categories
+from controllers.job_controller import get_job_status
+from controllers.payment_controller import create_cart_payment_intent
+from utils.db import pool_stats
+from utils.metrics import metrics_response, record_request_metrics, register_stats, start_request_timer
+from utils import migrate
+from utils.cache import catalog_cache
+from utils.hashing import password_hasher
+from utils.images import DEFAULT_IMAGE_SIZE, IMAGE_SIZES, find_original, is_image_hash, select_variant
+from utils.jobs import run_workers
+from utils.http_cache import conditional_catalog
+from utils.json_provider import FastJSONProvider
+from utils.compression import compress_response, precompress_directory, send_static
+from utils.file_delivery import send_stored_file, stat_cache
+from utils.rate_limit import (RATE_LIMIT_BULK_SIGNUP, RATE_LIMIT_EXPORT, RATE_LIMIT_PAYMENT, RATE_LIMIT_SIGNUP,
+                              limiter, not_export, retry_after_seconds, shed_load, shedding_stats)
+from utils.snapshots import generate_snapshot
+from utils.warmup import WARM_UP, warm_up
+import os
+import click
+import logging
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+CORS_ORIGIN = "http://localhost:5173"
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'Link']
+
+UPLOAD_FOLDER = 'uploads/images' 
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}  
+# Browsers and the CDN may reuse an image for this long without revalidating
+IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 7 * 24 * 3600))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Routes and CLI commands; create_app() registers them on an application
+api = Blueprint('api', __name__, cli_group=None)
+
+# Seconds spent importing this module, building the app and warming it up
+startup_times = {}
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def initialize_database():
+    """Apply pending schema migrations (a single version check when up to date)."""
+    for migration in migrate.upgrade():
+        logger.info(f"Applied migration {migration.version:04d}_{migration.name}")
+
+@api.app_errorhandler(429)
+def rate_limited(e):
+    return {'message': f'Too many requests: {e.description}'}, 429, {'Retry-After': str(retry_after_seconds())}
+
+@api.route('/api/users', methods=['POST'])
+@limiter.limit(RATE_LIMIT_SIGNUP)
+def user_creation():
+    return create_user()
+
+@api.route('/api/users/bulk', methods=['POST'])
+@limiter.limit(RATE_LIMIT_BULK_SIGNUP)
+def bulk_user_creation():
+    return create_users()
+
+@api.route('/api/users', methods=['GET'])
+@limiter.limit(RATE_LIMIT_EXPORT, exempt_when=not_export)
+def list_users():
+    return get_users()
+
+@api.route('/api/users/<username>', methods=['GET'])
+def user_details(username):
+    return get_user_by_username(username)
+
+@api.route('/api/products', methods=['POST'])
+def product_creation():
+    return create_product()
+
+@api.route('/api/products', methods=['GET'])
+@limiter.limit(RATE_LIMIT_EXPORT, exempt_when=not_export)
+@conditional_catalog
+def list_products():
+    return get_all_products()
+
+@api.route('/api/products/search', methods=['GET'])
+@conditional_catalog
+def product_search():
+    return search_products()
+
+@api.route('/api/products/category/<int:category_id>', methods=['GET'])
+@limiter.limit(RATE_LIMIT_EXPORT, exempt_when=not_export)
+@conditional_catalog
+def products_by_category(category_id):
+    return get_products_by_category(category_id)
+
+@api.route('/api/products/<int:product_id>', methods=['GET'])
+@conditional_catalog
+def product_details(product_id):
+    return get_product_by_id(product_id)
+
+@api.route('/api/products/batch', methods=['POST'])
+def products_batch():
+    return get_products_batch()
+
+@api.route('/api/categories', methods=['GET'])
+@conditional_catalog
+def categories_list():
+    return get_categories()
+
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+def job_details(job_id):
+    return get_job_status(job_id)
+
+@api.route('/api/db/pool', methods=['GET'])
+def db_pool_stats():
+    return pool_stats(), 200
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return catalog_cache.stats(), 200
+
+@api.route('/api/hashing/stats', methods=['GET'])
+def hashing_stats():
+    return password_hasher.stats(), 200
+
+@api.route('/api/load/stats', methods=['GET'])
+def load_stats():
+    return {'shed': shedding_stats()}, 200
+
+@api.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    return metrics_response()
+
+@api.route('/images/<filename>')
+@limiter.exempt
+def serve_image(filename):
+    if is_image_hash(filename):
+        return serve_image_variant(filename)
+    # Uploads stored under their original names, before content addressing
+    response = send_stored_file(UPLOAD_FOLDER, filename, max_age=IMAGE_CACHE_MAX_AGE)
+    if response is None:
+        return {'message': 'Image not found'}, 404
+    return response
+
+def serve_image_variant(image_hash):
+    """Serve a resized variant of a content-addressed upload (``?size=thumb|card|full``)."""
+    size = request.args.get('size', DEFAULT_IMAGE_SIZE)
+    if size not in IMAGE_SIZES:
+        return {'message': f'Unknown image size: {size}'}, 400
+
+    variant = select_variant(image_hash, size, request.accept_mimetypes)
+    if variant is None:
+        # Variants are built by a background job. The original still carries
+        # its EXIF data (GPS position, camera serial), so it is never sent.
+        if find_original(image_hash) is not None:
+            return ({'message': 'Image is still being processed'}, 202,
+                    {'Retry-After': '2', 'Cache-Control': 'no-store'})
+        return {'message': 'Image not found'}, 404
+
+    variant_name = variant[1]
+    # Content-addressed, so the bytes behind this URL never change
+    response = send_stored_file(UPLOAD_FOLDER, f'{image_hash}/{variant_name}', max_age=IMMUTABLE_MAX_AGE,
+                                etag=f'{image_hash}-{variant_name}')
+    if response is None:
+        return {'message': 'Image not found'}, 404
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    response.vary.add('Accept')
+    return response
+
+@api.route('/api/create-payment-intent', methods=['POST'])
+@limiter.limit(RATE_LIMIT_PAYMENT)
+def create_payment_intent():
+    return create_cart_payment_intent()
+
+@limiter.exempt
+def static_file(filename):
+    return send_static(current_app.static_folder, filename, max_age=current_app.get_send_file_max_age(filename))
+
+@api.cli.command('precompress')
+def precompress_command():
+    """Write .br/.gz copies of the compressible files in static/."""
+    written = precompress_directory(current_app.static_folder)
+    click.echo(f"Wrote {len(written)} precompressed file(s).")
+
+@api.cli.command('snapshot')
+@click.option('--every', type=float, help='Keep running and write a new snapshot every SECONDS.')
+def snapshot_command(every):
+    """Write a catalog snapshot and make it current."""
+    while True:
+        click.echo(f"Catalog snapshot {generate_snapshot()} is current.")
+        if not every:
+            return
+        time.sleep(every)
+
+@api.cli.command('worker')
+@click.option('--processes', default=1, show_default=True, help='Number of worker processes.')
+def worker_command(processes):
+    """Run background job workers."""
+    run_workers(processes)
+
+@api.cli.group('db')
+def db_command():
+    """Manage the database schema."""
+
+@db_command.command('upgrade')
+def db_upgrade_command():
+    """Apply pending migrations."""
+    initialize_database()
+
+@db_command.command('status')
+def db_status_command():
+    """List migrations and whether they have been applied."""
+    for migration, applied in migrate.status():
+        click.echo(f"[{'x' if applied else ' '}] {migration.version:04d}_{migration.name}")
+
+def create_app(warm=False):
+    """Build the application. Nothing here touches the database unless ``warm`` is set."""
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder='static', static_url_path='/static')
+    app.json = FastJSONProvider(app)
+    # Registered first: the timer starts before, and is recorded after, every other hook
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.after_request(compress_response)
+    limiter.init_app(app)
+    app.before_request(shed_load)
+    CORS(app, resources={r"/*": {"origins": CORS_ORIGIN}}, expose_headers=CORS_EXPOSE_HEADERS)
+
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Max file size (16 MB)
+
+    app.register_blueprint(api)
+    # Replace Flask's static view so precompressed .br/.gz copies are used
+    app.view_functions['static'] = static_file
+
+    register_stats({
+        'db_pool': pool_stats,
+        'catalog_cache': catalog_cache.stats,
+        'password_hashing': password_hasher.stats,
+        'load_shed': shedding_stats,
+        'file_stat_cache': stat_cache.stats,
+        'startup': lambda: startup_times,
+    })
+
+    startup_times['create_seconds'] = time.perf_counter() - started
+    if warm:
+        warm_worker()
+    else:
+        log_startup_time()
+    return app
+
+
+def warm_worker():
+    """Warm this worker up before it accepts connections.
+
+    Called by the server entry points (``python app.py``, the gunicorn
+    ``post_worker_init`` hook and the ASGI lifespan), never on import, so
+    CLI commands, tests and spawned hashing processes start cold.
+    """
+    startup_times['warm_up_seconds'] = warm_up()
+    log_startup_time()
+
+
+def log_startup_time():
+    startup_times['total_seconds'] = sum(value for key, value in startup_times.items() if key != 'total_seconds')
+    logger.info("Started in %.0f ms (imports %.0f ms, app %.0f ms, warm-up %.0f ms)",
+                startup_times['total_seconds'] * 1000, startup_times.get('import_seconds', 0) * 1000,
+                startup_times['create_seconds'] * 1000, startup_times.get('warm_up_seconds', 0) * 1000)
+
+
+def __getattr__(name):
+    # `app:app` (gunicorn, flask, the tests) is built on first access rather
+    # than as a side effect of importing this module
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+startup_times['import_seconds'] = time.perf_counter() - STARTED
+
+if __name__ == '__main__':
+    create_app(warm=WARM_UP).run(host='0.0.0.0', port=4000)
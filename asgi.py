@@ -0,0 +1,278 @@
+"""ASGI entry point with async handlers for the catalog and user reads.
+
+Run with ``uvicorn asgi:application``. The read endpoints below run on the
+event loop with an asyncpg pool, reusing the controllers' queries and
+response shapes, so one worker keeps many database round
+trips in flight at once. Every other request (writes, streaming exports,
+search, images, payments) falls through to the regular Flask app, which
+also remains the whole service under ``flask run``/gunicorn. Set
+``ASYNC_READS=0`` to send everything through Flask. With catalog snapshots
+enabled the listing and category routes go to Flask too, which sends
+the snapshot files.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+
+from app import CORS_EXPOSE_HEADERS, CORS_ORIGIN, app as flask_app, warm_worker
+from controllers.category_controller import CATEGORIES_QUERY, categories_from_rows, categories_response
+from controllers.product_controller import (PRODUCT_BY_ID_QUERY, PRODUCTS_BY_IDS_QUERY, cached_products,
+                                            listing_response, product_batch, product_cache_keys,
+                                            product_ids_from_keys, product_page_query, product_response)
+from controllers.user_controller import USER_BY_USERNAME_QUERY, USERS_QUERY, user_response, users_response
+from models.product import Product
+from utils.async_db import async_pool_stats, close_async_pool, fetch, fetchrow, get_async_pool, request_stats
+from utils.compression import COMPRESS_MIN_SIZE, choose_encoding, compressed_body, weak_etag
+from utils.cache import MISSING, catalog_cache, catalog_version
+from utils.http_cache import catalog_etag, not_modified, validator_headers
+from utils.metrics import observe_request, register_stats
+from utils.pagination import PaginationError, parse_ids
+from utils.rate_limit import (OVERLOADED_MESSAGE, RATELIMIT_STORAGE_URI, SHED_RETRY_AFTER, check_overload,
+                              hit_default_limits)
+from utils.snapshots import enabled as snapshots_enabled
+from utils.streaming import wants_stream
+from utils.warmup import WARM_UP
+
+ASYNC_READS = os.getenv('ASYNC_READS', '1') not in ('0', 'false', 'no')
+
+logger = logging.getLogger(__name__)
+
+# Threads serving fall-through requests with the sync Flask app
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 32))
+wsgi_application = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+register_stats({'async_db_pool': async_pool_stats})
+
+
+async def cache_call(method, *args):
+    # A shared cache is a network round trip; keep it off the event loop
+    if catalog_cache.shared:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+# Loaders that fill the shared cache read the primary: a replica's lag would
+# otherwise be cached for the whole TTL
+async def get_or_load(key, loader):
+    value = await cache_call(catalog_cache.get, key)
+    if value is MISSING:
+        value = await loader()
+        if value is not None:
+            await cache_call(catalog_cache.set, key, value)
+    return value
+
+
+async def get_many_or_load(keys, loader):
+    found = await cache_call(catalog_cache.get_many, keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        loaded = await loader(missing)
+        await cache_call(catalog_cache.set_many, loaded)
+        found.update(loaded)
+    return found
+
+
+async def load_products(product_ids):
+    async def load(keys):
+        return cached_products(await fetch(PRODUCTS_BY_IDS_QUERY, (product_ids_from_keys(keys),), primary=True))
+
+    found = await get_many_or_load(product_cache_keys(product_ids), load)
+    return {product['product_id']: product for product in found.values()}
+
+
+async def product_page(args, category_id=None):
+    key, query, params, to_page = product_page_query(args, category_id)
+
+    async def load():
+        return to_page(await fetch(query, params, primary=True))
+
+    return await get_or_load(key, load)
+
+
+async def list_products(path, args, category_id=None):
+    if category_id is None and 'ids' in args:
+        product_ids = parse_ids(args['ids'])
+        return product_batch(product_ids, await load_products(product_ids)), 200, {}
+    return listing_response(*await product_page(args, category_id), path, args, category_id)
+
+
+async def product_details(path, args, product_id):
+    async def load():
+        row = await fetchrow(PRODUCT_BY_ID_QUERY, (product_id,), primary=True)
+        if row:
+            return Product.mapper()(row)
+
+    return product_response(await get_or_load(f'product:{product_id}', load))
+
+
+async def products_by_category(path, args, category_id):
+    return await list_products(path, args, category_id)
+
+
+async def categories_list(path, args):
+    async def load():
+        return categories_from_rows(await fetch(CATEGORIES_QUERY, primary=True))
+
+    return categories_response(await get_or_load('categories', load))
+
+
+async def list_users(path, args):
+    return users_response(await fetch(USERS_QUERY))
+
+
+async def user_details(path, args, username):
+    return user_response(await fetchrow(USER_BY_USERNAME_QUERY, (username,)))
+
+
+# (pattern, handler, catalog) -- catalog routes carry ETag/Last-Modified like the Flask views
+ROUTES = [
+    (re.compile(r'^/api/products$'), lambda path, args: list_products(path, args), True),
+    (re.compile(r'^/api/products/(\d+)$'), lambda path, args, pid: product_details(path, args, int(pid)), True),
+    (re.compile(r'^/api/products/category/(\d+)$'),
+     lambda path, args, cid: products_by_category(path, args, int(cid)), True),
+    (re.compile(r'^/api/categories$'), categories_list, True),
+    (re.compile(r'^/api/users$'), list_users, False),
+    (re.compile(r'^/api/users/([^/]+)$'), user_details, False),
+]
+# Routes Flask answers from catalog snapshots when they are enabled
+SNAPSHOT_ROUTES = re.compile(r'^/api/(products|products/category/\d+|categories)$')
+
+
+def match_route(path):
+    for pattern, handler, catalog in ROUTES:
+        match = pattern.match(path)
+        if match:
+            return handler, match.groups(), catalog
+    return None
+
+
+def flask_rule(path, method):
+    """The Flask ``(rule, endpoint)`` for ``path``, so metrics and limits use the same names."""
+    try:
+        rule, _ = flask_app.url_map.bind('').match(path, method, return_rule=True)
+    except HTTPException:
+        return 'unmatched', None
+    return rule.rule, rule.endpoint
+
+
+async def rate_limited(scope, endpoint):
+    client = scope['client'][0] if scope.get('client') else '127.0.0.1'
+    # Redis counters are a network round trip; keep them off the event loop
+    if RATELIMIT_STORAGE_URI.startswith('memory://'):
+        return hit_default_limits(client, endpoint)
+    return await asyncio.to_thread(hit_default_limits, client, endpoint)
+
+
+async def send_response(send, status, body, headers, request_headers, head=False):
+    payload = b'' if body is None else flask_app.json.dumps_bytes(body)
+    response_headers = Headers(headers)
+    if body is not None:
+        response_headers['Content-Type'] = 'application/json'
+        response_headers.add('Vary', 'Accept-Encoding')
+        encoding = choose_encoding(request_headers.get('Accept-Encoding'))
+        if status == 200 and encoding and len(payload) >= COMPRESS_MIN_SIZE:
+            etag = response_headers.get('ETag')
+            payload = compressed_body(payload, encoding, etag)
+            response_headers['Content-Encoding'] = encoding
+            if etag:
+                response_headers['ETag'] = weak_etag(etag)
+    response_headers['Content-Length'] = str(len(payload))
+    if request_headers.get('Origin') == CORS_ORIGIN:
+        response_headers['Access-Control-Allow-Origin'] = CORS_ORIGIN
+        response_headers['Access-Control-Expose-Headers'] = ', '.join(CORS_EXPOSE_HEADERS)
+        response_headers.add('Vary', 'Origin')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in response_headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': b'' if head else payload})
+    return len(payload)
+
+
+async def handle(scope, send, route):
+    """Answer one async read with the same rate limit, load shedding and request metrics as the Flask views."""
+    started = time.perf_counter()
+    rule, endpoint = flask_rule(scope['path'], scope['method'])
+    stats = {'queries': 0, 'db_time': 0.0, 'pool_wait': 0.0}
+    request_stats.set(stats)
+    status, size = await respond(scope, send, route, endpoint)
+    observe_request(scope['method'], rule, status, time.perf_counter() - started, size=size, **stats)
+
+
+async def respond(scope, send, route, endpoint):
+    """Send the response; returns ``(status, body size)``."""
+    handler, groups, catalog = route
+    path = scope['path']
+    query_string = scope.get('query_string', b'').decode('latin-1')
+    args = MultiDict(parse_qsl(query_string, keep_blank_values=True))
+    request_headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+    head = scope['method'] == 'HEAD'
+
+    limited = await rate_limited(scope, endpoint)
+    if limited is not None:
+        limit, retry_after = limited
+        return 429, await send_response(send, 429, {'message': f'Too many requests: {limit}'},
+                                        {'Retry-After': str(retry_after)}, request_headers, head)
+    # Shed on the asyncpg pool these handlers wait on, as shed_load does for Flask's
+    if check_overload(endpoint, async_pool_stats()) is not None:
+        return 503, await send_response(send, 503, OVERLOADED_MESSAGE, {'Retry-After': str(SHED_RETRY_AFTER)},
+                                        request_headers, head)
+
+    try:
+        validators = {}
+        if catalog:
+            version = await cache_call(catalog_version)
+            # Same validators as the Flask views (request.full_path always has a '?')
+            etag = catalog_etag(version, f'{path}?{query_string}')
+            validators = validator_headers(etag, version['modified'])
+            if not_modified(etag, version['modified'], request_headers):
+                return 304, await send_response(send, 304, None, validators, request_headers, head=True)
+
+        body, status, headers = await handler(path, args, *groups)
+        if status == 200:
+            headers = {**headers, **validators}
+    except PaginationError as e:
+        body, status, headers = {'message': str(e)}, 400, {}
+    except Exception:
+        logger.exception("Error in async handler for %s", path)
+        body, status, headers = {'message': 'Internal Server Error'}, 500, {}
+    return status, await send_response(send, status, body, headers, request_headers, head)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if WARM_UP:
+                await asyncio.to_thread(warm_worker)
+            if ASYNC_READS and WARM_UP:
+                try:
+                    await get_async_pool()
+                except Exception:
+                    logger.exception("Could not open the async database pool during warm-up")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if ASYNC_READS and scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        route = match_route(scope['path'])
+        query = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        from_snapshot = snapshots_enabled() and SNAPSHOT_ROUTES.match(scope['path'])
+        if route is not None and not wants_stream(query) and not from_snapshot:
+            return await handle(scope, send, route)
+
+    await wsgi_application(scope, receive, send)
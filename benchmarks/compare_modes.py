@@ -0,0 +1,44 @@
+"""Compare the sync (Flask) and async (ASGI) read paths under the same load.
+
+Start both servers against the same database first, e.g.::
+
+    gunicorn -w 1 --threads 32 -b 127.0.0.1:4000 app:app
+    uvicorn --workers 1 --port 4001 asgi:application
+
+then run ``python -m benchmarks.compare_modes``.
+"""
+import argparse
+import json
+
+from benchmarks.load import run_load
+
+READ_PATHS = ['/api/products?limit=50', '/api/products/1', '/api/products/category/1',
+              '/api/categories', '/api/users']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sync-url', default='http://127.0.0.1:4000')
+    parser.add_argument('--async-url', default='http://127.0.0.1:4001')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--path', action='append', dest='paths', help='Route to hit (repeatable).')
+    args = parser.parse_args()
+    paths = args.paths or READ_PATHS
+
+    def factory(worker, iteration):
+        return 'GET', paths[(worker + iteration) % len(paths)], None, None
+
+    results = {}
+    for mode, url in (('sync', args.sync_url), ('async', args.async_url)):
+        results[mode] = run_load(url, factory, args.concurrency, args.duration)
+        print(f"{mode:>5}: {results[mode]['throughput']:8.1f} req/s  "
+              f"p50 {results[mode]['p50_ms']:7.1f} ms  p95 {results[mode]['p95_ms']:7.1f} ms  "
+              f"p99 {results[mode]['p99_ms']:7.1f} ms  errors {results[mode]['errors']}")
+    if results['sync']['throughput']:
+        print(f"async/sync throughput: {results['async']['throughput'] / results['sync']['throughput']:.2f}x")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Time JSON response encoding for product listings of increasing size.
+
+Compares Flask's default provider with FastJSONProvider on the stdlib and
+orjson backends. No database or server is needed::
+
+    python -m benchmarks.json_encoding
+"""
+import argparse
+import json
+import timeit
+from decimal import Decimal
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from models.product import Product
+from utils.json_provider import FastJSONProvider
+
+
+def product_rows(count):
+    return [
+        (i, f'Product {i}', 'Hand-forged stainless steel, ' * 4, Decimal(f'{i % 500}.99'), i % 4 + 1,
+         f'/images/{i:032x}?size=card')
+        for i in range(1, count + 1)
+    ]
+
+
+def providers():
+    for name, make in [
+        ('flask default', DefaultJSONProvider),
+        ('fast (stdlib)', lambda app: FastJSONProvider(app, backend='stdlib')),
+        ('fast (orjson)', lambda app: FastJSONProvider(app, backend='orjson')),
+    ]:
+        app = Flask(__name__)
+        app.json = make(app)
+        yield name, app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='50,200,5000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        products = [Product.mapper()(row) for row in product_rows(size)]
+        number = max(1, 20000 // size)
+        for name, app in providers():
+            with app.app_context():
+                best = min(timeit.repeat(lambda: app.json.response(products), number=number, repeat=args.repeat))
+            results.append({'products': size, 'provider': name, 'us_per_response': best / number * 1e6})
+
+    for result in results:
+        print(f"{result['products']:>6} products  {result['provider']:<14} {result['us_per_response']:>10.1f} us")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
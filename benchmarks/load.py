@@ -0,0 +1,86 @@
+"""Closed-loop HTTP load generator shared by the benchmark scripts."""
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, bytes_received=0, statuses=None):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'statuses': dict(sorted((statuses or {}).items())),
+        'requests': count,
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': count / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'bytes': bytes_received,
+    }
+
+
+def run_load(base_url, request_factory, concurrency=16, duration=10.0, warmup=1.0):
+    """Drive ``concurrency`` keep-alive clients against ``base_url`` for ``duration`` seconds.
+
+    ``request_factory(worker, iteration)`` returns ``(method, path, body, headers)``.
+    Requests completed during the warm-up period are not counted.
+    """
+    parts = urlsplit(base_url)
+    lock = threading.Lock()
+    latencies, counters, statuses = [], {'errors': 0, 'bytes': 0}, {}
+    start = time.monotonic()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def client(worker):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        iteration = 0
+        local_latencies, errors, received, local_statuses = [], 0, 0, {}
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            method, path, body, headers = request_factory(worker, iteration)
+            iteration += 1
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                payload = response.read()
+                ok, status = response.status < 500, str(response.status)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+                ok, payload, status = False, b'', 'failed'
+            finished = time.monotonic()
+            if finished < measure_from:
+                continue
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+            if ok:
+                local_latencies.append(finished - now)
+                received += len(payload)
+            else:
+                errors += 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            counters['errors'] += errors
+            counters['bytes'] += received
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, counters['errors'], duration, counters['bytes'], statuses)
@@ -0,0 +1,260 @@
+"""Seed a local Postgres, start the API against it and load-test each route.
+
+Example::
+
+    createdb metal_bench
+    python -m benchmarks.suite --database-url postgresql://localhost/metal_bench \\
+        --products 20000 --users 5000 --baseline latest
+
+Every run is written to ``benchmarks/results/<timestamp>-<commit>.json``.
+With ``--baseline`` the run is compared route by route against an earlier
+result and the script exits with status 1 when p95 latency rose, or
+throughput fell, by more than ``--tolerance``.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import psycopg2
+from PIL import Image
+from werkzeug.security import generate_password_hash
+
+from benchmarks.load import run_load
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+LOCAL_HOSTS = {'', 'localhost', '127.0.0.1', '::1'}
+SERVERS = {
+    'werkzeug': [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}', '--no-reload',
+                 '--with-threads'],
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-w', '{workers}', '--threads', '16', '-b',
+                 '127.0.0.1:{port}', 'app:app'],
+    'uvicorn': [sys.executable, '-m', 'uvicorn', '--workers', '{workers}', '--port', '{port}',
+                '--log-level', 'warning', 'asgi:application'],
+}
+
+
+def seed(database_url, products, users, upload_folder):
+    """Reset products/users/jobs to a deterministic catalog of the requested size."""
+    from utils.images import store_image
+
+    # One real image so /images/<hash> serves resized variants like production
+    size = (1600, 1200)
+    image = Image.merge('RGB', [Image.linear_gradient('L').resize(size), Image.radial_gradient('L').resize(size),
+                                Image.effect_noise(size, 64)])
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    os.makedirs(upload_folder, exist_ok=True)
+    image_hash = store_image(buffer.getvalue(), upload_folder)
+    image_dir = os.path.join(upload_folder, image_hash)
+
+    password = generate_password_hash('benchmark-password')
+    conn = psycopg2.connect(database_url)
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute("TRUNCATE products, users, jobs RESTART IDENTITY CASCADE;")
+            cursor.execute("""
+                INSERT INTO products (productname, description, price, categoryid, image_url)
+                SELECT 'Product ' || i, 'Benchmark product ' || i || ' ' || repeat('forged steel ', 8),
+                       (i %% 500) + 0.99, c.categoryid, %s
+                FROM generate_series(1, %s) AS i
+                JOIN (SELECT categoryid, row_number() OVER (ORDER BY categoryid) - 1 AS n FROM categories) c
+                  ON c.n = i %% (SELECT count(*) FROM categories);
+            """, (f'images/{image_hash}', products))
+            cursor.execute("""
+                INSERT INTO users (username, email, password, is_admin)
+                SELECT 'bench_user_' || i, 'bench_user_' || i || '@example.com', %s, FALSE
+                FROM generate_series(1, %s) AS i;
+            """, (password, users))
+            cursor.execute("SELECT categoryid FROM categories ORDER BY categoryid;")
+            categories = [row[0] for row in cursor.fetchall()]
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE products, users;")
+    finally:
+        conn.close()
+    return {'image_hash': image_hash, 'image_dir': image_dir, 'categories': categories}
+
+
+def scenarios(products, categories, image_hash, run_id):
+    """Route name -> ``request_factory(worker, iteration)`` for run_load."""
+    rngs = {}
+
+    def rng(worker):
+        # Per-worker RNG so every run issues the same request sequence
+        return rngs.setdefault(worker, random.Random(worker))
+
+    json_headers = {'Content-Type': 'application/json'}
+    return {
+        'list': lambda worker, i: ('GET', '/api/products?limit=50', None, None),
+        'by_id': lambda worker, i: ('GET', f'/api/products/{rng(worker).randint(1, products)}', None, None),
+        'by_category': lambda worker, i: (
+            'GET', f'/api/products/category/{categories[i % len(categories)]}?limit=50', None, None),
+        'categories': lambda worker, i: ('GET', '/api/categories', None, None),
+        'user_creation': lambda worker, i: ('POST', '/api/users', json.dumps({
+            'username': f'bench_{run_id}_{worker}_{i}',
+            'email': f'bench_{run_id}_{worker}_{i}@example.com',
+            'password': 'benchmark-password',
+        }), json_headers),
+        'image': lambda worker, i: (
+            'GET', f'/images/{image_hash}?size=card', None, {'Accept': 'image/avif,image/webp,*/*'}),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, port, workers, env, cwd):
+    command = [part.format(port=port, workers=workers) for part in SERVERS[server]]
+    process = subprocess.Popen(command, cwd=cwd, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/categories', timeout=2) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{server} did not become ready on port {port}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_baseline(baseline):
+    if baseline == 'latest':
+        runs = sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')))
+        if not runs:
+            return None
+        baseline = runs[-1]
+    with open(baseline) as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance):
+    """Return a message for every route that regressed beyond ``tolerance`` (a fraction)."""
+    regressions = []
+    for route, result in current['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{route}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if result['errors'] > before['errors']:
+            regressions.append(f"{route}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', 'postgresql://localhost/metal_bench'))
+    parser.add_argument('--allow-remote', action='store_true',
+                        help='Allow a non-local database. The run TRUNCATEs products, users and jobs.')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--routes', default='list,by_id,by_category,categories,user_creation,image')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='werkzeug')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--catalog-cache-ttl', type=float, default=0,
+                        help='Seconds catalog reads stay cached; 0 measures the database path.')
+    parser.add_argument('--baseline', help="Result file to compare against, or 'latest'.")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    host = urlsplit(args.database_url).hostname or ''
+    if host not in LOCAL_HOSTS and not args.allow_remote:
+        parser.error(f"refusing to seed non-local database host {host!r}; pass --allow-remote to override")
+
+    # Compare before this run is written, so 'latest' means the previous run
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url,
+        CACHE_BACKEND='memory',
+        CATALOG_CACHE_TTL=str(args.catalog_cache_ttl),
+        RATELIMIT_ENABLED='0',
+        LOG_LEVEL='WARNING',
+    )
+    process = None
+    seeded = None
+    try:
+        subprocess.run([sys.executable, '-m', 'utils.migrate', 'upgrade'], cwd=ROOT, env=env, check=True)
+        # The server runs from the checkout and resolves uploads against it, so the image
+        # goes into the checkout for the run and is removed afterwards
+        seeded = seed(args.database_url, args.products, args.users, os.path.join(ROOT, 'uploads', 'images'))
+        port = free_port()
+        process = start_server(args.server, port, args.workers, env, ROOT)
+
+        factories = scenarios(args.products, seeded['categories'], seeded['image_hash'],
+                              datetime.now(timezone.utc).strftime('%H%M%S'))
+        results = {}
+        for route in args.routes.split(','):
+            results[route] = run_load(f'http://127.0.0.1:{port}', factories[route],
+                                      args.concurrency, args.duration, args.warmup)
+            r = results[route]
+            print(f"{route:<14} {r['throughput']:8.1f} req/s  p50 {r['p50_ms']:7.1f}  p95 {r['p95_ms']:7.1f}  "
+                  f"p99 {r['p99_ms']:7.1f} ms  errors {r['errors']}  {r['statuses']}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if seeded is not None:
+            shutil.rmtree(seeded['image_dir'], ignore_errors=True)
+
+    commit = git_commit()
+    run = {
+        'commit': commit,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('database_url', 'baseline')},
+        'routes': results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{commit}.json")
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {os.path.relpath(path, ROOT)}")
+
+    if baseline is not None:
+        regressions = compare(run, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions against {baseline['commit']}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions against {baseline['commit']} (tolerance {args.tolerance:.0%}).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,40 @@
-from utils.db import connection_pool
-
-def get_categories():
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM categories;")
-                categories = cursor.fetchall()
-
-        if categories:
-            result = []
-            for category in categories:
-                result.append({
-                    'category_id': category[0],
-                    'categoryname': category[1]
-                })
-
-            return {'categories': result}, 200
-        else:
-            return {'message': 'No categories found'}, 404
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
+import logging
+from models.category import Category
+from utils.db import get_connection
+from utils.cache import catalog_cache, get_or_load
+from utils import snapshots
+
+logger = logging.getLogger(__name__)
+
+# Shared with the async handlers in asgi.py
+CATEGORIES_QUERY = f"SELECT {Category.columns()} FROM categories;"
+
+
+def categories_from_rows(rows):
+    if rows:
+        to_dict = Category.mapper()
+        return [to_dict(category) for category in rows]
+
+
+def categories_response(categories):
+    if categories:
+        return {'categories': categories}, 200, {}
+    return {'message': 'No categories found'}, 404, {}
+
+
+def load_categories():
+    with get_connection() as conn:  # Cached, so from the primary
+        with conn.cursor() as cursor:
+            cursor.execute(CATEGORIES_QUERY)
+            return categories_from_rows(cursor.fetchall())
+
+def get_categories():
+    try:
+        if snapshots.enabled():
+            response = snapshots.serve_snapshot('categories.json')
+            if response is not None:
+                return response
+        return categories_response(get_or_load(catalog_cache, 'categories', load_categories))
+    except Exception as e:
+        logger.exception(f"Error in get_categories: {e}")
+        return {'message': 'Internal Server Error'}, 500
\ No newline at end of file
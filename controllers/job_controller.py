@@ -0,0 +1,16 @@
+import logging
+
+from utils.jobs import get_job
+
+logger = logging.getLogger(__name__)
+
+def get_job_status(job_id):
+    try:
+        job = get_job(job_id)
+        if job:
+            return job, 200
+        else:
+            return {'message': 'Job not found'}, 404
+    except Exception as e:
+        logger.exception(f"Error in get_job_status: {e}")
+        return {'message': 'Internal Server Error'}, 500
\ No newline at end of file
@@ -0,0 +1,94 @@
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+
+from flask import request
+
+from utils.db import get_connection
+from utils.payments import (MAX_IDEMPOTENCY_KEY_LENGTH, PAYMENT_CURRENCY, IdempotencyConflict,
+                            PaymentProviderError, create_payment_intent)
+
+MAX_CART_LINES = 100
+MAX_LINE_QUANTITY = 99
+
+logger = logging.getLogger(__name__)
+
+
+class CartError(ValueError):
+    """Raised for a malformed cart or one naming products that do not exist."""
+
+
+def parse_cart(items):
+    """``{product_id: quantity}`` from ``[{"product_id": 1, "quantity": 2}, ...]``, merging repeated products."""
+    if not isinstance(items, list) or not items:
+        raise CartError('items must be a non-empty list')
+    if len(items) > MAX_CART_LINES:
+        raise CartError(f'At most {MAX_CART_LINES} items per cart')
+    cart = {}
+    for item in items:
+        product_id = item.get('product_id') if isinstance(item, dict) else None
+        quantity = item.get('quantity', 1) if isinstance(item, dict) else None
+        if type(product_id) is not int or type(quantity) is not int:
+            raise CartError('Every item needs an integer product_id and quantity')
+        if quantity < 1:
+            raise CartError('quantity must be at least 1')
+        cart[product_id] = cart.get(product_id, 0) + quantity
+        if cart[product_id] > MAX_LINE_QUANTITY:
+            raise CartError(f'At most {MAX_LINE_QUANTITY} of one product per cart')
+    return cart
+
+
+def price_cart(cart):
+    """Total of ``cart`` in cents, priced from ``products.price`` in one query."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            # Priced on the primary so a lagging replica never serves an old price
+            cursor.execute("SELECT productid, price FROM products WHERE productid = ANY(%s);", (list(cart),))
+            prices = dict(cursor.fetchall())
+
+    missing = [product_id for product_id in cart if product_id not in prices]
+    if missing:
+        raise CartError('Unknown products: ' + ', '.join(map(str, missing)))
+    total = sum(Decimal(prices[product_id]) * quantity for product_id, quantity in cart.items())
+    return int((total * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def intent_params(cart, email):
+    amount = price_cart(cart)
+    if amount <= 0:
+        raise CartError('Cart total must be positive')
+    params = {'amount': amount, 'currency': PAYMENT_CURRENCY}
+    if email:
+        params['receipt_email'] = email
+    return params
+
+
+def create_cart_payment_intent():
+    """Create a PaymentIntent for the cart in ``items``, priced on the server.
+
+    Send an ``Idempotency-Key`` header to make retries safe: repeating a
+    request with the same key from the same client returns the same intent.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {'message': 'Expected a JSON object with an items list'}, 400
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+            return {'message': f'Idempotency-Key must be 1-{MAX_IDEMPOTENCY_KEY_LENGTH} characters'}, 400
+
+        cart = parse_cart(data.get('items'))
+        email = data.get('email') or None
+        request_data = {'cart': cart, 'email': email}
+        # There are no accounts, so the client is identified by address, as for rate limits
+        return create_payment_intent(request_data, lambda: intent_params(cart, email), idempotency_key,
+                                     scope=request.remote_addr), 200
+    except CartError as e:
+        return {'message': str(e)}, 400
+    except IdempotencyConflict:
+        return {'message': 'Idempotency-Key was already used for a different cart'}, 422
+    except PaymentProviderError as e:
+        logger.exception(f"Error creating PaymentIntent: {e}")
+        return {'message': 'Payment provider error'}, 502
+    except Exception as e:
+        logger.exception(f"Error in create_cart_payment_intent: {e}")
+        return {'message': 'Internal Server Error'}, 500
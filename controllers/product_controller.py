@@ -1,173 +1,355 @@
-from utils.db import connection_pool 
-import os
-from werkzeug.utils import secure_filename
-from flask import request
-from utils.db import connection_pool
-
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-UPLOAD_FOLDER = 'uploads/images'
-
-# Ensure the upload folder exists
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def create_product():
-    try:
-        # Retrieve form data
-        data = request.form
-        productname = data.get('productname')
-        description = data.get('description')
-        price = data.get('price')
-        category_id = data.get('category_id')
-
-        if not productname or not description or not price:
-            return {'message': 'Product name, description, and price are required'}, 400
-
-        file = request.files.get('image')
-        file_path = None
-        if file:
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = f'images/{filename}'  
-                file.save(os.path.join(UPLOAD_FOLDER, filename))
-            else:
-                return {'message': 'Invalid file type'}, 400
-
-        # Insert product data into the database
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO products (productname, description, price, categoryid, image_url)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING productid;
-                """, (productname, description, price, category_id, file_path))
-                product_id = cursor.fetchone()[0]
-                conn.commit()
-
-        return {'product_id': product_id, 'message': f'Product "{productname}" created successfully'}, 201
-
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
-
-
-def allowed_file(filename):
-    # Check if file has a valid extension
-    if '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
-        # Check if file size is within the allowed limit
-        if os.path.getsize(filename) <= app.config['MAX_CONTENT_LENGTH']:
-            return True
-    return False
-
-def create_product():
-    try:
-        # Retrieve form data
-        data = request.form
-        productname = data.get('productname')
-        description = data.get('description')
-        price = data.get('price')
-        category_id = data.get('category_id')
-
-        # Validate form data
-        if not productname or not description or not price:
-            return {'message': 'Product name, description, and price are required'}, 400
-
-        # Process uploaded file (if any)
-        file = request.files.get('image')
-        file_path = None
-        if file:
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = f'images/{filename}'  # Save the relative file path
-                file.save(os.path.join(UPLOAD_FOLDER, filename))  # Save to the server folder
-            else:
-                return {'message': 'Invalid file type or file size exceeds the maximum allowed limit'}, 400
-
-        # Insert product data into the database
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO products (productname, description, price, categoryid, image_url)
-                    VALUES (%s, %s, %s, %s, %s) RETURNING productid;
-                """, (productname, description, price, category_id, file_path))
-                product_id = cursor.fetchone()[0]
-                conn.commit()
-
-        return {'product_id': product_id, 'message': f'Product "{productname}" created successfully'}, 201
-
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
-
-def get_all_products():
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM products;")
-                products = cursor.fetchall()
-
-        if products:
-            result = []
-            for product in products:
-                result.append({
-                    'product_id': product[0],
-                    'productname': product[1],
-                    'description': product[2],
-                    'price': float(product[3]),
-                    'category_id': product[4],
-                    'image_url': product[5],
-                })
-            return result, 200
-        else:
-            return {'message': 'No products found'}, 404
-    except Exception as e:
-        print(f"Error in get_all_products: {e}")
-        return {'message': 'Internal Server Error'}, 500
-
-
-def get_product_by_id(product_id):
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM products WHERE productid = %s;", (product_id,))
-                product = cursor.fetchone()
-
-        if product:
-            return {
-                'product_id': product[0],
-                'productname': product[1],
-                'description': product[2],
-                'price': float(product[3]),
-                'category_id': product[4],
-                'image_url': product[5],
-            }, 200
-        else:
-            return {'message': 'Product not found'}, 404
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
-
-def get_products_by_category(category_id):
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM products WHERE categoryid = %s;", (category_id,))
-                products = cursor.fetchall()
-
-        if products:
-            result = []
-            for product in products:
-                result.append({
-                    'product_id': product[0],
-                    'productname': product[1],
-                    'description': product[2],
-                    'price': float(product[3]),
-                    'category_id': product[4],
-                    'image_url': product[5],
-                })
-            return result, 200
-        else:
-            return {'message': 'No products found for this category'}, 404
-    except Exception as e:
-        print(f"Error in get_products_by_category: {e}")
-        return {'message': 'Internal Server Error'}, 500
-
+import logging
+from flask import request
+from models.product import Product
+from utils.db import get_connection
+from utils.cache import catalog_cache, get_many_or_load, get_or_load, invalidate_product
+from utils.images import InvalidImage, save_original
+from utils.jobs import enqueue
+from utils.tasks import PROCESS_IMAGE, REFRESH_CATALOG_SNAPSHOT, WARM_CATALOG_CACHE
+from utils import snapshots
+from utils.streaming import stream_rows, wants_stream
+from utils.pagination import (PaginationError, decode_cursor, encode_cursor, page_headers, parse_fields, parse_ids,
+                              parse_limit)
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+logger = logging.getLogger(__name__)
+
+def allowed_file(filename):
+    # Upload size is capped by MAX_CONTENT_LENGTH before we get here
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def create_product():
+    try:
+        # Retrieve form data
+        data = request.form
+        productname = data.get('productname')
+        description = data.get('description')
+        price = data.get('price')
+        category_id = data.get('category_id')
+
+        # Validate form data
+        if not productname or not description or not price:
+            return {'message': 'Product name, description, and price are required'}, 400
+        try:
+            category_id = int(category_id) if category_id else None
+        except ValueError:
+            return {'message': 'Category ID must be an integer'}, 400
+
+        # Process uploaded file (if any) into resized variants stored by content hash
+        file = request.files.get('image')
+        file_path = None
+        image_pending = False
+        if file:
+            if not allowed_file(file.filename):
+                return {'message': 'Invalid image format'}, 400
+            try:
+                image_hash, image_pending = save_original(file.read())
+            except InvalidImage:
+                return {'message': 'Invalid image format'}, 400
+            file_path = f'images/{image_hash}'
+
+        job_id = None
+
+        # Insert product data and queue its side effects in one transaction
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO products (productname, description, price, categoryid, image_url)
+                    VALUES (%s, %s, %s, %s, %s) RETURNING productid;
+                """, (productname, description, price, category_id, file_path))
+                product_id = cursor.fetchone()[0]
+
+            if image_pending:
+                job_id = enqueue(PROCESS_IMAGE, {'image_hash': image_hash}, conn=conn)
+            if catalog_cache.shared:
+                # Delayed so it runs after the invalidation below
+                enqueue(WARM_CATALOG_CACHE, {'category_id': category_id}, conn=conn, delay=1)
+            if snapshots.enabled():
+                # Readers keep the previous snapshot until the new one is swapped in
+                enqueue(REFRESH_CATALOG_SNAPSHOT, {}, conn=conn, delay=1)
+            conn.commit()
+
+        invalidate_product(product_id, category_id)
+
+        response = {'product_id': product_id, 'message': f'Product "{productname}" created successfully'}
+        if job_id is not None:
+            response['job_id'] = job_id
+        return response, 201
+
+    except Exception as e:
+        logger.exception(f"Error in create_product: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+def product_query(fields, after_id=0, category_id=None, limit=None):
+    query = f"SELECT {Product.columns(fields)} FROM products WHERE productid > %s"
+    params = [after_id]
+    if category_id is not None:
+        query += " AND categoryid = %s"
+        params.append(category_id)
+    query += " ORDER BY productid"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query + ";", params
+
+
+# The query/result halves below are shared with the async handlers in asgi.py
+PRODUCT_BY_ID_QUERY = f"SELECT {Product.columns()} FROM products WHERE productid = %s;"
+PRODUCTS_BY_IDS_QUERY = f"SELECT {Product.columns()} FROM products WHERE productid = ANY(%s);"
+
+
+def product_page_query(args, category_id=None):
+    """``(cache key, query, params, to_page)`` for a listing page; ``to_page(rows)`` is ``(products, next_cursor)``."""
+    limit = parse_limit(args.get('limit'))
+    after_id = decode_cursor(args.get('cursor'))
+    fields = parse_fields(args.get('fields'), Product.FIELDS, required=('product_id',))
+    # One extra row tells us whether another page exists
+    query, params = product_query(fields, after_id, category_id, limit + 1)
+
+    def to_page(rows):
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][fields.index('product_id')])
+        to_dict = Product.mapper(fields)
+        return [to_dict(row) for row in rows], next_cursor
+
+    scope = 'products:list' if category_id is None else f'products:category:{category_id}'
+    return f"{scope}:{after_id}:{limit}:{','.join(fields)}", query, params, to_page
+
+
+def listing_response(products, next_cursor, path, args, category_id=None):
+    if products or args.get('cursor'):
+        return products, 200, page_headers(next_cursor, path, args)
+    if category_id is None:
+        return {'message': 'No products found'}, 404, {}
+    return {'message': 'No products found for this category'}, 404, {}
+
+
+def product_response(product):
+    if product:
+        return product, 200, {}
+    return {'message': 'Product not found'}, 404, {}
+
+
+def product_cache_keys(product_ids):
+    return [f'product:{product_id}' for product_id in product_ids]
+
+
+def product_ids_from_keys(keys):
+    return [int(key.split(':', 1)[1]) for key in keys]
+
+
+def cached_products(rows):
+    """``{cache key: product}`` for rows selected with PRODUCTS_BY_IDS_QUERY."""
+    to_dict = Product.mapper()
+    return {f"product:{product['product_id']}": product for product in map(to_dict, rows)}
+
+
+def fetch_product_page(category_id=None, args=None):
+    """Keyset-paginated product listing driven by ``limit``, ``cursor`` and ``fields``."""
+    args = request.args if args is None else args
+    key, query, params, to_page = product_page_query(args, category_id)
+
+    def load():
+        # The result is cached for every worker: read the primary, since a
+        # lagging replica would put rows from before the last write back
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return to_page(cursor.fetchall())
+
+    return get_or_load(catalog_cache, key, load)
+
+
+def stream_products(category_id=None):
+    """Stream every product after ``cursor`` as one JSON array, ignoring ``limit``."""
+    args = request.args
+    after_id = decode_cursor(args.get('cursor'))
+    fields = parse_fields(args.get('fields'), Product.FIELDS, required=('product_id',))
+    query, params = product_query(fields, after_id, category_id)
+    return stream_rows(query, params, Product.mapper(fields))
+
+
+def get_all_products():
+    try:
+        if 'ids' in request.args:
+            return product_batch(parse_ids(request.args['ids'])), 200
+        if snapshots.enabled():
+            response = snapshots.serve_snapshot(snapshots.snapshot_file('products', request.args))
+            if response is not None:
+                return response
+        if wants_stream(request.args):
+            return stream_products()
+        return listing_response(*fetch_product_page(), request.path, request.args)
+    except PaginationError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        logger.exception(f"Error in get_all_products: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+
+def get_product_by_id(product_id):
+    def load():
+        with get_connection() as conn:  # Cached, so from the primary
+            with conn.cursor() as cursor:
+                cursor.execute(PRODUCT_BY_ID_QUERY, (product_id,))
+                product = cursor.fetchone()
+
+        if product:
+            return Product.mapper()(product)
+
+    try:
+        return product_response(get_or_load(catalog_cache, f'product:{product_id}', load))
+    except Exception as e:
+        logger.exception(f"Error in get_product_by_id: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+def load_products(product_ids):
+    """``{product_id: product}`` for the ids that exist.
+
+    Cached products come from one cache lookup and the rest from a single
+    ``= ANY(...)`` query, so a whole cart costs at most one round trip each.
+    """
+    def load(keys):
+        with get_connection() as conn:  # Cached, so from the primary
+            with conn.cursor() as cursor:
+                cursor.execute(PRODUCTS_BY_IDS_QUERY, (product_ids_from_keys(keys),))
+                return cached_products(cursor.fetchall())
+
+    found = get_many_or_load(catalog_cache, product_cache_keys(product_ids), load)
+    return {product['product_id']: product for product in found.values()}
+
+
+def product_batch(product_ids, products=None):
+    """Batch response body: products in request order plus the ids that do not exist."""
+    products = load_products(product_ids) if products is None else products
+    return {
+        'products': [products[product_id] for product_id in product_ids if product_id in products],
+        'missing': [product_id for product_id in product_ids if product_id not in products],
+    }
+
+
+def get_products_batch():
+    """``POST /api/products/batch`` with ``{"ids": [...]}``; same body as ``GET /api/products?ids=``."""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return {'message': 'Expected a JSON object with an ids list'}, 400
+        return product_batch(parse_ids(data.get('ids'))), 200
+    except PaginationError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        logger.exception(f"Error in get_products_batch: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+def get_products_by_category(category_id):
+    try:
+        if snapshots.enabled():
+            response = snapshots.serve_snapshot(snapshots.snapshot_file(f'category/{category_id}', request.args))
+            if response is not None:
+                return response
+        if wants_stream(request.args):
+            return stream_products(category_id)
+        return listing_response(*fetch_product_page(category_id), request.path, request.args, category_id)
+    except PaginationError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        logger.exception(f"Error in get_products_by_category: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+
+
+def parse_price(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be a number')
+    if price < 0:
+        raise PaginationError(f'{name} must not be negative')
+    return price
+
+
+def parse_integer(value, name, default=None):
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+
+
+def search_products():
+    """Full-text and fuzzy product search with price/category filters and category facets.
+
+    Query parameters: ``q``, ``min_price``, ``max_price``, ``category_id``,
+    ``limit`` and ``offset``. Facet counts ignore the category filter so
+    the storefront can show how many matches every category has.
+    """
+    try:
+        args = request.args
+        text = args.get('q', '').strip()
+        min_price = parse_price(args.get('min_price'), 'min_price')
+        max_price = parse_price(args.get('max_price'), 'max_price')
+        category_id = parse_integer(args.get('category_id'), 'category_id')
+        limit = parse_limit(args.get('limit'))
+        offset = parse_integer(args.get('offset'), 'offset', default=0)
+        if offset < 0:
+            raise PaginationError('offset must not be negative')
+
+        conditions, params = [], {'q': text}
+        if text:
+            conditions.append("(search_vector @@ websearch_to_tsquery('english', %(q)s) OR productname %% %(q)s)")
+        if min_price is not None:
+            conditions.append("price >= %(min_price)s")
+            params['min_price'] = min_price
+        if max_price is not None:
+            conditions.append("price <= %(max_price)s")
+            params['max_price'] = max_price
+        where = ' AND '.join(conditions) or 'TRUE'
+
+        result_where = where
+        if category_id is not None:
+            result_where += " AND categoryid = %(category_id)s"
+            params['category_id'] = category_id
+        params.update(limit=limit, offset=offset)
+
+        with get_connection(readonly=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT {Product.columns()}
+                    FROM products
+                    WHERE {result_where}
+                    ORDER BY ts_rank(search_vector, websearch_to_tsquery('english', %(q)s)) DESC,
+                             similarity(productname, %(q)s) DESC,
+                             productid
+                    LIMIT %(limit)s OFFSET %(offset)s;
+                """, params)
+                rows = cursor.fetchall()
+
+                cursor.execute(f"""
+                    SELECT categoryid, COUNT(*) FROM products
+                    WHERE {where}
+                    GROUP BY categoryid ORDER BY categoryid NULLS LAST;
+                """, params)
+                facets = [{'category_id': row[0], 'count': row[1]} for row in cursor.fetchall()]
+
+        if category_id is not None:
+            total = sum(facet['count'] for facet in facets if facet['category_id'] == category_id)
+        else:
+            total = sum(facet['count'] for facet in facets)
+
+        to_dict = Product.mapper()
+        return {
+            'results': [to_dict(row) for row in rows],
+            'total': total,
+            'facets': {'categories': facets},
+        }, 200
+    except PaginationError as e:
+        return {'message': str(e)}, 400
+    except Exception as e:
+        logger.exception(f"Error in search_products: {e}")
+        return {'message': 'Internal Server Error'}, 500
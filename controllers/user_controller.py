@@ -1,155 +1,217 @@
-from flask import request
-from werkzeug.security import generate_password_hash
-import logging
-from utils.db import connection_pool
-
-# Setup logging
-logging.basicConfig(level=logging.DEBUG)
-
-def create_user():
-    try:
-        # Get the JSON data from the request
-        data = request.get_json()
-
-        # Validate that we received data
-        if not data:
-            logging.error("No input data provided.")
-            return {'message': 'No input data provided'}, 400
-
-        # Extract required fields from the request
-        username = data.get('username')
-        email = data.get('email')
-        password = data.get('password')
-        is_admin = data.get('is_admin', False)  # Default to False if not provided
-
-        # Validate required fields
-        if not username or not email or not password:
-            logging.error(f"Missing fields: username={username}, email={email}, password={password}")
-            return {'message': 'Username, email, and password are required'}, 400
-
-        # Hash the password using werkzeug security
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-
-        # Use connection pool to get a DB connection
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                # Check if the username already exists in the database
-                cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s;", (username,))
-                if cursor.fetchone()[0] > 0:
-                    logging.error(f"Username '{username}' already exists.")
-                    return {'message': 'Username already exists'}, 400
-
-                # Check if the email already exists in the database
-                cursor.execute("SELECT COUNT(*) FROM users WHERE email = %s;", (email,))
-                if cursor.fetchone()[0] > 0:
-                    logging.error(f"Email '{email}' already exists.")
-                    return {'message': 'Email already exists'}, 400
-
-                # Insert the new user into the database
-                cursor.execute("""
-                    INSERT INTO users (username, email, password, is_admin)
-                    VALUES (%s, %s, %s, %s) RETURNING userid;
-                """, (username, email, hashed_password, is_admin))
-
-                # Get the user ID of the newly created user
-                user_id = cursor.fetchone()[0]
-                conn.commit()
-
-                logging.info(f"User '{username}' created successfully with user ID {user_id}.")
-
-        # Return success response
-        return {'user_id': user_id, 'message': f'User "{username}" created successfully'}, 201
-
-    except Exception as e:
-        # Log the error for debugging purposes
-        logging.error(f"Error creating user: {str(e)}")
-        return {'message': 'Internal Server Error'}, 500
-
-
-# Get all users function
-def get_users():
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT userid, username, email, is_admin FROM users;")
-                users = cursor.fetchall()
-
-        if users:
-            user_list = []
-            for user in users:
-                user_list.append({
-                    'user_id': user[0],
-                    'username': user[1],
-                    'email': user[2],
-                    'is_admin': user[3]
-                })
-            return {'users': user_list}, 200
-        else:
-            return {'message': 'No users found'}, 404
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
-
-# Get user by username function
-def get_user_by_username(username):
-    try:
-        with connection_pool.getconn() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT userid, username, email, is_admin FROM users WHERE username = %s;", (username,))
-                user = cursor.fetchone()
-
-        if user:
-            return {
-                'user_id': user[0],
-                'username': user[1],
-                'email': user[2],
-                'is_admin': user[3]
-            }, 200
-        else:
-            return {'message': 'User not found'}, 404
-    except Exception as e:
-        return {'message': 'Internal Server Error'}, 500
-
-def create_users():
-    data = request.get_json()
-    if not data or not isinstance(data, list):
-        return {'message': 'Input data must be a list of users'}, 400
-
-    results = []  # To store the result of each user creation
-    with connection_pool.getconn() as conn:
-        with conn.cursor() as cursor:
-            for user_data in data:
-                username = user_data.get('username')
-                email = user_data.get('email')
-                password = user_data.get('password')
-                is_admin = user_data.get('is_admin', False)
-
-                # Validate required fields
-                if not username or not email or not password:
-                    results.append({'username': username, 'status': 'failed', 'message': 'Username, email, and password are required'})
-                    continue
-
-                hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
-
-                # Check for existing username
-                cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s;", (username,))
-                if cursor.fetchone()[0] > 0:
-                    results.append({'username': username, 'status': 'failed', 'message': 'Username already exists'})
-                    continue
-
-                # Check for existing email
-                cursor.execute("SELECT COUNT(*) FROM users WHERE email = %s;", (email,))
-                if cursor.fetchone()[0] > 0:
-                    results.append({'username': username, 'status': 'failed', 'message': 'Email already exists'})
-                    continue
-
-                # Insert new user
-                cursor.execute("""
-                    INSERT INTO users (username, email, password, is_admin)
-                    VALUES (%s, %s, %s, %s) RETURNING userid;
-                """, (username, email, hashed_password, is_admin))
-                user_id = cursor.fetchone()[0]
-                conn.commit()
-
-                results.append({'username': username, 'status': 'success', 'user_id': user_id})
-
+from flask import request
+from psycopg2.extras import execute_values
+import logging
+from models.user import User
+from utils.db import get_connection
+from utils.hashing import HashingBusy, password_hasher
+from utils.streaming import stream_rows, wants_stream
+
+logger = logging.getLogger(__name__)
+
+def create_user():
+    try:
+        # Get the JSON data from the request
+        data = request.get_json()
+
+        # Validate that we received data
+        if not data:
+            logger.error("No input data provided.")
+            return {'message': 'No input data provided'}, 400
+
+        # Extract required fields from the request
+        username = data.get('username')
+        email = data.get('email')
+        password = data.get('password')
+        is_admin = data.get('is_admin', False)  # Default to False if not provided
+
+        # Validate required fields
+        if not username or not email or not password:
+            logger.error(f"Missing fields: username={username}, email={email}, password={'set' if password else None}")
+            return {'message': 'Username, email, and password are required'}, 400
+
+        # Hash the password on the worker pool, shedding load when it is saturated
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HashingBusy as e:
+            logger.warning("Password hashing queue full; rejecting sign-up.")
+            return {'message': 'Server busy, please retry'}, 503, {'Retry-After': str(e.retry_after)}
+
+        # Use connection pool to get a DB connection
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                # Check if the username already exists in the database
+                cursor.execute("SELECT COUNT(*) FROM users WHERE username = %s;", (username,))
+                if cursor.fetchone()[0] > 0:
+                    logger.error(f"Username '{username}' already exists.")
+                    return {'message': 'Username already exists'}, 400
+
+                # Check if the email already exists in the database
+                cursor.execute("SELECT COUNT(*) FROM users WHERE email = %s;", (email,))
+                if cursor.fetchone()[0] > 0:
+                    logger.error(f"Email '{email}' already exists.")
+                    return {'message': 'Email already exists'}, 400
+
+                # Insert the new user into the database
+                cursor.execute("""
+                    INSERT INTO users (username, email, password, is_admin)
+                    VALUES (%s, %s, %s, %s) RETURNING userid;
+                """, (username, email, hashed_password, is_admin))
+
+                # Get the user ID of the newly created user
+                user_id = cursor.fetchone()[0]
+                conn.commit()
+
+                logger.info(f"User '{username}' created successfully with user ID {user_id}.")
+
+        # Return success response
+        return {'user_id': user_id, 'message': f'User "{username}" created successfully'}, 201
+
+    except Exception as e:
+        # Log the error for debugging purposes
+        logger.exception(f"Error creating user: {str(e)}")
+        return {'message': 'Internal Server Error'}, 500
+
+
+# Get all users function
+# Shared with the async handlers in asgi.py
+USERS_QUERY = f"SELECT {User.columns()} FROM users;"
+USER_BY_USERNAME_QUERY = f"SELECT {User.columns()} FROM users WHERE username = %s;"
+
+
+def users_response(rows):
+    if rows:
+        to_dict = User.mapper()
+        return {'users': [to_dict(user) for user in rows]}, 200, {}
+    return {'message': 'No users found'}, 404, {}
+
+
+def user_response(row):
+    if row:
+        return User.mapper()(row), 200, {}
+    return {'message': 'User not found'}, 404, {}
+
+
+def get_users():
+    try:
+        if wants_stream(request.args):
+            return stream_rows(
+                f"SELECT {User.columns()} FROM users ORDER BY userid;", (),
+                User.mapper(), prefix='{"users": [', suffix=']}',
+            )
+
+        with get_connection(readonly=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(USERS_QUERY)
+                users = cursor.fetchall()
+        return users_response(users)
+    except Exception as e:
+        logger.exception(f"Error in get_users: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+# Get user by username function
+def get_user_by_username(username):
+    try:
+        with get_connection(readonly=True) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(USER_BY_USERNAME_QUERY, (username,))
+                user = cursor.fetchone()
+        return user_response(user)
+    except Exception as e:
+        logger.exception(f"Error in get_user_by_username: {e}")
+        return {'message': 'Internal Server Error'}, 500
+
+def create_users():
+    data = request.get_json()
+    if not data or not isinstance(data, list):
+        return {'message': 'Input data must be a list of users'}, 400
+
+    results = [None] * len(data)  # One result per input row, in request order
+    candidates = []  # (index, username, email, password, is_admin)
+    batch_usernames, batch_emails = set(), set()
+
+    for index, user_data in enumerate(data):
+        if not isinstance(user_data, dict):
+            results[index] = {'username': None, 'status': 'failed', 'message': 'Each user must be an object'}
+            continue
+
+        username = user_data.get('username')
+        email = user_data.get('email')
+        password = user_data.get('password')
+        is_admin = user_data.get('is_admin', False)
+
+        # Validate required fields
+        if not username or not email or not password:
+            results[index] = {'username': username, 'status': 'failed', 'message': 'Username, email, and password are required'}
+            continue
+        if not all(isinstance(value, str) for value in (username, email, password)):
+            results[index] = {'username': username, 'status': 'failed', 'message': 'Username, email, and password must be strings'}
+            continue
+        if not isinstance(is_admin, bool):
+            results[index] = {'username': username, 'status': 'failed', 'message': 'is_admin must be true or false'}
+            continue
+
+        # Reject duplicates inside the batch itself
+        if username in batch_usernames:
+            results[index] = {'username': username, 'status': 'failed', 'message': 'Duplicate username in request'}
+            continue
+        if email in batch_emails:
+            results[index] = {'username': username, 'status': 'failed', 'message': 'Duplicate email in request'}
+            continue
+        batch_usernames.add(username)
+        batch_emails.add(email)
+        candidates.append((index, username, email, password, is_admin))
+
+    try:
+        if candidates:
+            # One set-based query finds every username and email already taken
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT username, email FROM users WHERE username = ANY(%s) OR email = ANY(%s);",
+                        ([c[1] for c in candidates], [c[2] for c in candidates]),
+                    )
+                    existing = cursor.fetchall()
+            taken_usernames = {row[0] for row in existing}
+            taken_emails = {row[1] for row in existing}
+
+            new_users = []
+            for candidate in candidates:
+                index, username, email = candidate[:3]
+                if username in taken_usernames:
+                    results[index] = {'username': username, 'status': 'failed', 'message': 'Username already exists'}
+                elif email in taken_emails:
+                    results[index] = {'username': username, 'status': 'failed', 'message': 'Email already exists'}
+                else:
+                    new_users.append(candidate)
+
+            # Hash outside the transaction so no connection is held while hashing
+            hashes = password_hasher.hash_many([password for _, _, _, password, _ in new_users])
+            values = [
+                (username, email, hashed_password, is_admin)
+                for (_, username, email, _, is_admin), hashed_password in zip(new_users, hashes)
+            ]
+
+            if values:
+                # ON CONFLICT covers rows created concurrently since the check above
+                with get_connection() as conn:
+                    with conn.cursor() as cursor:
+                        inserted = execute_values(cursor, """
+                            INSERT INTO users (username, email, password, is_admin)
+                            VALUES %s ON CONFLICT DO NOTHING RETURNING userid, username;
+                        """, values, page_size=1000, fetch=True)
+                user_ids = {username: user_id for user_id, username in inserted}
+
+                for index, username, *_ in new_users:
+                    if username in user_ids:
+                        results[index] = {'username': username, 'status': 'success', 'user_id': user_ids[username]}
+                    else:
+                        results[index] = {'username': username, 'status': 'failed', 'message': 'Username or email already exists'}
+    except HashingBusy as e:
+        logger.warning("Password hashing queue full; rejecting bulk import.")
+        return {'message': 'Server busy, please retry'}, 503, {'Retry-After': str(e.retry_after)}
+    except Exception as e:
+        logger.exception(f"Error importing users: {str(e)}")
+        return {'message': 'Internal Server Error'}, 500
+
+    logger.info(f"Bulk import: {sum(r['status'] == 'success' for r in results)} of {len(results)} users created.")
     return {'results': results}, 201
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""gunicorn settings, read from the working directory when the server starts."""
+from utils.warmup import WARM_UP
+
+
+def post_worker_init(worker):
+    # Each worker opens its own connections, so warm up after the fork even
+    # with --preload
+    if WARM_UP:
+        from app import warm_worker
+
+        warm_worker()
@@ -0,0 +1,12 @@
+from models.category import Category
+from models.product import Product
+from models.user import User
+
+# Matches the tables the app used to create at startup, so existing
+# databases take this migration as a no-op.
+statements = [
+    Category.create_table(),
+    Category.seed_categories(),
+    Product.create_table(),
+    User.create_table(),
+]
@@ -0,0 +1,9 @@
+concurrently = True
+
+# get_products_by_category filters on categoryid. The DROP clears an INVALID
+# index left behind by an interrupted earlier attempt; this migration is only
+# re-run when that attempt was never recorded.
+statements = [
+    "DROP INDEX CONCURRENTLY IF EXISTS products_categoryid_idx;",
+    "CREATE INDEX CONCURRENTLY products_categoryid_idx ON products (categoryid, productid);",
+]
@@ -0,0 +1,5 @@
+from models.product import Product
+
+statements = [
+    Product.search_schema(),
+]
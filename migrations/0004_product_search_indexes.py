@@ -0,0 +1,14 @@
+from models.product import Product
+
+concurrently = True
+
+statements = [
+    # Fill search_vector for rows that predate its trigger before indexing it
+    Product.search_backfill(),
+    "DROP INDEX CONCURRENTLY IF EXISTS products_search_vector_idx;",
+    "CREATE INDEX CONCURRENTLY products_search_vector_idx ON products USING GIN (search_vector);",
+    "DROP INDEX CONCURRENTLY IF EXISTS products_productname_trgm_idx;",
+    "CREATE INDEX CONCURRENTLY products_productname_trgm_idx ON products USING GIN (productname gin_trgm_ops);",
+    "DROP INDEX CONCURRENTLY IF EXISTS products_price_idx;",
+    "CREATE INDEX CONCURRENTLY products_price_idx ON products (price);",
+]
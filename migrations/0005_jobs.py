@@ -0,0 +1,5 @@
+from models.job import Job
+
+statements = [
+    Job.create_table(),
+]
@@ -0,0 +1,7 @@
+"""Ordered schema migrations, applied by utils.migrate.
+
+Each ``NNNN_name.py`` module defines ``statements`` (a list of SQL strings)
+and may set ``concurrently = True``. Concurrent migrations run outside a
+transaction, one statement at a time, which ``CREATE INDEX CONCURRENTLY``
+requires. Never edit a migration that has shipped; add a new one.
+"""
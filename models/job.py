@@ -0,0 +1,59 @@
+from models.row import Row
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+class Job(Row):
+    __slots__ = ('jobid', 'task', 'payload', 'status', 'attempts', 'max_attempts',
+                 'run_at', 'last_error', 'result', 'created_at', 'updated_at')
+
+    FIELDS = {
+        'job_id': 'jobid',
+        'task': 'task',
+        'status': 'status',
+        'attempts': 'attempts',
+        'max_attempts': 'max_attempts',
+        'run_at': 'run_at',
+        'result': 'result',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    CONVERTERS = {'run_at': isoformat, 'created_at': isoformat, 'updated_at': isoformat}
+
+    def __init__(self, jobid, task, payload, status='queued', attempts=0, max_attempts=5,
+                 run_at=None, last_error=None, result=None, created_at=None, updated_at=None):
+        self.jobid = jobid
+        self.task = task
+        self.payload = payload
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.run_at = run_at
+        self.last_error = last_error
+        self.result = result
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def create_table(cls):
+        return """
+        CREATE TABLE IF NOT EXISTS jobs (
+            jobid SERIAL PRIMARY KEY,
+            task VARCHAR(100) NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            last_error TEXT,
+            result JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS jobs_queued_run_at_idx ON jobs (run_at) WHERE status = 'queued';
+        """
+
+    def __repr__(self):
+        return f"Job(id={self.jobid}, task={self.task}, status={self.status})"
\ No newline at end of file
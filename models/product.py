@@ -1,21 +1,91 @@
-class Product:
-    def __init__(self, productid, productname, description, price, categoryid=None, image_url=None):
-        self.productid = productid
-        self.productname = productname
-        self.description = description
-        self.price = price
-        self.categoryid = categoryid
-        self.image_url = image_url
-
-    @classmethod
-    def create_table(cls):
-        return """
-        CREATE TABLE IF NOT EXISTS products (
-            productid SERIAL PRIMARY KEY,
-            productname VARCHAR(100) NOT NULL,
-            description TEXT NOT NULL,
-            price DECIMAL(10, 2) NOT NULL,
-            categoryid INTEGER REFERENCES categories(categoryid) ON DELETE SET NULL,
-            image_url VARCHAR(500)
-        );
-        """
+from models.row import Row
+
+
+class Product(Row):
+    __slots__ = ('productid', 'productname', 'description', 'price', 'categoryid', 'image_url')
+
+    FIELDS = {
+        'product_id': 'productid',
+        'productname': 'productname',
+        'description': 'description',
+        'price': 'price',
+        'category_id': 'categoryid',
+        'image_url': 'image_url',
+    }
+    CONVERTERS = {'price': float}
+
+    def __init__(self, productid, productname, description, price, categoryid=None, image_url=None):
+        self.productid = productid
+        self.productname = productname
+        self.description = description
+        self.price = price
+        self.categoryid = categoryid
+        self.image_url = image_url
+
+    @classmethod
+    def create_table(cls):
+        return """
+        CREATE TABLE IF NOT EXISTS products (
+            productid SERIAL PRIMARY KEY,
+            productname VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            price DECIMAL(10, 2) NOT NULL,
+            categoryid INTEGER REFERENCES categories(categoryid) ON DELETE SET NULL,
+            image_url VARCHAR(500)
+        );
+        """
+
+    @classmethod
+    def search_schema(cls):
+        # Weighted full-text vector, set by a trigger on insert and update. A
+        # GENERATED ... STORED column would rewrite the whole table under an
+        # ACCESS EXCLUSIVE lock; a nullable column is a catalog-only change.
+        # Existing rows are filled by search_backfill() and the indexes are
+        # built concurrently, both in a later migration.
+        return """
+        SET LOCAL lock_timeout = '5s';
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE OR REPLACE FUNCTION products_search_vector(name TEXT, description TEXT) RETURNS tsvector
+            LANGUAGE SQL IMMUTABLE AS $$
+                SELECT setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+                       setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            $$;
+        CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                NEW.search_vector := products_search_vector(NEW.productname, NEW.description);
+                RETURN NEW;
+            END
+            $$;
+        ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector;
+        DROP TRIGGER IF EXISTS products_search_vector_update ON products;
+        CREATE TRIGGER products_search_vector_update
+            BEFORE INSERT OR UPDATE OF productname, description ON products
+            FOR EACH ROW EXECUTE FUNCTION products_search_vector_update();
+        """
+
+    @classmethod
+    def search_backfill(cls, batch_size=1000):
+        # Committed batch by batch, so no row stays locked for long and the
+        # work is not lost if interrupted; rows the trigger already set are
+        # skipped. COMMIT inside DO needs a migration run outside a transaction.
+        return f"""
+        DO $$
+        DECLARE
+            last_id INTEGER := 0;
+            batch_end INTEGER;
+        BEGIN
+            LOOP
+                SELECT max(productid) INTO batch_end FROM (
+                    SELECT productid FROM products WHERE productid > last_id
+                    ORDER BY productid LIMIT {int(batch_size)}
+                ) AS batch;
+                EXIT WHEN batch_end IS NULL;
+                UPDATE products SET search_vector = products_search_vector(productname, description)
+                WHERE productid > last_id AND productid <= batch_end AND search_vector IS NULL;
+                last_id := batch_end;
+                COMMIT;
+            END LOOP;
+        END
+        $$;
+        """
@@ -0,0 +1,56 @@
+from functools import lru_cache
+
+
+class Row:
+    """Base for the slotted row types in ``models``.
+
+    Subclasses name their columns in ``__slots__`` and map API field names
+    to columns in ``FIELDS``. Queries select ``columns(fields)`` explicitly,
+    and ``mapper(fields)`` turns the resulting tuples into response dicts
+    with a function built once per field list, so listings never create
+    model objects or depend on the table's column order.
+    """
+    __slots__ = ()
+
+    # API field name -> column, in response order
+    FIELDS = {}
+    # API field name -> conversion applied to non-null values
+    CONVERTERS = {}
+
+    @classmethod
+    def columns(cls, fields=None):
+        """Comma-separated SQL column list for ``fields`` (default: every API field)."""
+        return ', '.join(cls.FIELDS[field] for field in (fields or cls.FIELDS))
+
+    @classmethod
+    def mapper(cls, fields=None):
+        """Row tuple -> dict function for rows selected with ``columns(fields)``."""
+        return _build_mapper(cls, tuple(fields or cls.FIELDS))
+
+    @classmethod
+    def from_row(cls, row, fields=None):
+        """Build an instance from a row selected with ``columns(fields)``."""
+        instance = cls.__new__(cls)
+        for field, value in zip(fields or cls.FIELDS, row):
+            setattr(instance, cls.FIELDS[field], value)
+        return instance
+
+    def to_dict(self, fields=None):
+        return _build_mapper(type(self), tuple(fields or self.FIELDS))(
+            [getattr(self, self.FIELDS[field]) for field in (fields or self.FIELDS)])
+
+
+@lru_cache(maxsize=None)
+def _build_mapper(cls, fields):
+    # Resolved once per field list, so each row is a single dict
+    # comprehension over precomputed (field, index, converter) entries.
+    for field in fields:
+        if field not in cls.FIELDS:
+            raise KeyError(field)
+    spec = [(field, index, cls.CONVERTERS.get(field)) for index, field in enumerate(fields)]
+    if not any(convert for _, _, convert in spec):
+        return lambda row: dict(zip(fields, row))
+    return lambda row: {
+        field: row[index] if convert is None or row[index] is None else convert(row[index])
+        for field, index, convert in spec
+    }
@@ -0,0 +1,125 @@
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+from utils.db import ManagedConnectionPool
+
+
+class FakeInfo:
+    def __init__(self):
+        self.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+    """Records queries on its connection and returns the rows its ``results`` gives for them."""
+
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = None
+        self.fetches = 0
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.executed.append((' '.join(query.split()), params))
+        self.rows = list(self.conn.results(query, params))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+class FakeConnection:
+    """A psycopg2 connection stand-in; ``results(query, params)`` supplies each query's rows."""
+
+    def __init__(self, results=None):
+        self.results = results or (lambda query, params: [])
+        self.executed = []  # (whitespace-normalized query, params)
+        self.cursors = []
+        self.closed = 0
+        self.broken = False
+        self.autocommit = False
+        self.commits = 0
+        self.rollbacks = 0
+        self.info = FakeInfo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commits += 1
+        return False
+
+    def cursor(self, name=None):
+        cursor = FakeCursor(self, name)
+        self.cursors.append(cursor)
+        return cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def fake_connection():
+    """``FakeConnection`` factory: ``fake_connection(results=None)``."""
+    return FakeConnection
+
+
+@pytest.fixture
+def use_connection(monkeypatch):
+    """Make ``module.get_connection`` hand out ``conn``."""
+    def use(module, conn):
+        @contextmanager
+        def get_connection(readonly=False):
+            yield conn
+        monkeypatch.setattr(module, 'get_connection', get_connection)
+        return conn
+    return use
+
+
+@pytest.fixture
+def make_pool():
+    """``ManagedConnectionPool`` factory over fake connections; returns ``(pool, opened)``.
+
+    Every connection answers the replica lag query with ``lag`` seconds,
+    unless ``connect`` supplies the connections instead.
+    """
+    def make(lag=0, unreachable=False, connect=None, **kwargs):
+        opened = []
+
+        def open_connection(dsn):
+            if unreachable:
+                raise psycopg2.OperationalError("could not connect to server")
+            conn = FakeConnection(lambda query, params: [(lag,)])
+            opened.append(conn)
+            return conn
+
+        options = dict(minconn=0, maxconn=2, timeout=0.2, max_idle=300, healthcheck_after=30)
+        options.update(kwargs)
+        return ManagedConnectionPool('postgresql://test', connect=connect or open_connection, **options), opened
+    return make
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+from limits import parse_many
+from prometheus_client import REGISTRY
+
+import asgi
+import utils.async_db as async_db
+import utils.cache as cache
+import utils.rate_limit as rate_limit
+from utils.cache import MemoryCache
+
+
+def call(path, query=b'', headers=(), client='127.0.0.1'):
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query,
+        'headers': [(k.encode(), v.encode()) for k, v in headers], 'client': (client, 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = messages[0]
+    return start['status'], dict((k.decode(), v.decode()) for k, v in start['headers']), messages[1]['body']
+
+
+def use_rows(monkeypatch, rows):
+    monkeypatch.setattr(cache, 'catalog_cache', MemoryCache())
+    monkeypatch.setattr(asgi, 'catalog_cache', cache.catalog_cache)
+
+    async def fetch(query, params=(), primary=False):
+        return rows
+
+    async def fetchrow(query, params=(), primary=False):
+        return rows[0] if rows else None
+
+    monkeypatch.setattr(asgi, 'fetch', fetch)
+    monkeypatch.setattr(asgi, 'fetchrow', fetchrow)
+
+
+def test_categories_are_served_with_validators(monkeypatch):
+    use_rows(monkeypatch, [(1, 'Guitars')])
+    status, headers, body = call('/api/categories')
+    assert status == 200
+    assert b'Guitars' in body
+    assert headers['cache-control'] == 'no-cache'
+
+    status, _, body = call('/api/categories', headers=[('If-None-Match', headers['etag'])])
+    assert status == 304
+    assert body == b''
+
+
+def test_product_page_sets_next_cursor(monkeypatch):
+    use_rows(monkeypatch, [(1, 'A'), (2, 'B'), (3, 'C')])
+    status, headers, _ = call('/api/products', b'limit=2&fields=product_id,productname')
+    assert status == 200
+    assert 'x-next-cursor' in headers
+
+
+def test_missing_user_is_404_and_bad_cursor_is_400(monkeypatch):
+    use_rows(monkeypatch, [])
+    assert call('/api/users/nobody')[0] == 404
+    assert call('/api/products', b'cursor=@@@')[0] == 400
+
+
+def test_cors_headers_for_frontend_origin(monkeypatch):
+    use_rows(monkeypatch, [(1, 'Guitars')])
+    _, headers, _ = call('/api/categories', headers=[('Origin', asgi.CORS_ORIGIN)])
+    assert headers['access-control-allow-origin'] == asgi.CORS_ORIGIN
+    assert 'X-Next-Cursor' in headers['access-control-expose-headers']
+
+
+def test_batch_lookup_reads_cache_then_one_query(monkeypatch):
+    use_rows(monkeypatch, [])
+    cache.catalog_cache.set('product:2', {'product_id': 2, 'productname': 'Cached'})
+    queries = []
+
+    async def fetch(query, params=(), primary=False):
+        queries.append(params)
+        return [(1, 'Axe', 'Steel', 10, 1, None)]
+
+    monkeypatch.setattr(asgi, 'fetch', fetch)
+    status, _, body = call('/api/products', b'ids=2,1,3')
+    assert status == 200
+    assert asgi.flask_app.json.loads(body) == {
+        'products': [{'product_id': 2, 'productname': 'Cached'},
+                     {'product_id': 1, 'productname': 'Axe', 'description': 'Steel', 'price': 10.0,
+                      'category_id': 1, 'image_url': None}],
+        'missing': [3],
+    }
+    assert queries == [([1, 3],)]
+
+
+def test_async_reads_record_request_metrics(monkeypatch):
+    use_rows(monkeypatch, [(1, 'Guitars')])
+    labels = {'method': 'GET', 'route': '/api/products/category/<int:category_id>', 'status': '200'}
+    before = REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) or 0
+
+    call('/api/products/category/1', b'fields=product_id,productname')
+    call('/api/products/category/2', b'fields=product_id,productname')
+
+    assert REGISTRY.get_sample_value('http_request_duration_seconds_count', labels) == before + 2
+    assert REGISTRY.get_sample_value('http_response_size_bytes_sum', {'route': labels['route']}) > 0
+
+
+def test_async_reads_share_the_default_rate_limit(monkeypatch):
+    use_rows(monkeypatch, [(1, 'Guitars')])
+    monkeypatch.setattr(rate_limit, 'DEFAULT_LIMITS', parse_many('2/minute'))
+
+    assert [call('/api/categories', client='10.1.1.1')[0] for _ in range(3)] == [200, 200, 429]
+    status, headers, body = call('/api/categories', client='10.1.1.1')
+    assert status == 429
+    assert int(headers['retry-after']) >= 1
+    assert b'2 per 1 minute' in body
+    # Limits are per client
+    assert call('/api/categories', client='10.1.1.2')[0] == 200
+
+
+def test_async_reads_are_shed_while_the_pool_is_saturated_and_resume_when_idle(monkeypatch):
+    use_rows(monkeypatch, [(1, 'Guitars')])
+    monkeypatch.setattr(async_db, '_in_use', async_db.ASYNC_DB_POOL_MAX)
+    monkeypatch.setattr(async_db, '_wait_recent', rate_limit.SHED_POOL_WAIT * 4)
+    monkeypatch.setattr(async_db, '_wait_recent_at', time.monotonic())
+    shed_before = rate_limit.shed_counts['pool']
+
+    status, headers, _ = call('/api/categories', client='10.1.2.1')
+    assert status == 503
+    assert headers['retry-after'] == str(rate_limit.SHED_RETRY_AFTER)
+    assert rate_limit.shed_counts['pool'] == shed_before + 1
+
+    # Every connection back, the slow history alone does not keep shedding
+    monkeypatch.setattr(async_db, '_in_use', 0)
+    assert call('/api/categories', client='10.1.2.1')[0] == 200
@@ -0,0 +1,90 @@
+import asyncio
+
+import utils.async_db as async_db
+from utils.async_db import AsyncReplicaSet, to_asyncpg
+
+
+class FakeAsyncConnection:
+    def __init__(self, lag, rows):
+        self.lag = lag
+        self.rows = rows
+
+    async def fetchval(self, query):
+        return self.lag
+
+    async def fetch(self, query, *params):
+        return self.rows
+
+
+class FakeAsyncPool:
+    def __init__(self, lag=0, unreachable=False, rows=()):
+        self.unreachable = unreachable
+        self.conn = FakeAsyncConnection(lag, list(rows))
+        self.in_use = 0
+
+    async def acquire(self, timeout=None):
+        if self.unreachable:
+            raise OSError('connection refused')
+        self.in_use += 1
+        return self.conn
+
+    async def release(self, conn):
+        self.in_use -= 1
+
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return 1 - self.in_use
+
+    def get_max_size(self):
+        return 1
+
+
+def test_placeholders_are_numbered():
+    assert to_asyncpg('SELECT %s, %s WHERE x LIKE %s || \'%%\'') == 'SELECT $1, $2 WHERE x LIKE $3 || \'%\''
+
+
+def test_lagging_and_unreachable_replicas_are_skipped():
+    lagging = FakeAsyncPool(lag=30)
+    down = FakeAsyncPool(unreachable=True)
+    healthy = FakeAsyncPool()
+    replicas = AsyncReplicaSet([lagging, down, healthy], max_lag=2)
+
+    async def borrow():
+        used = []
+        for _ in range(3):
+            replica, conn = await replicas.acquire()
+            used.append(replica)
+            await replica.release(conn)
+        return used
+
+    assert asyncio.run(borrow()) == [healthy] * 3
+    stats = replicas.stats()
+    assert stats['replicas'][0]['lag'] == 30
+    assert stats['replicas'][1]['healthy'] is False
+    assert stats['replicas'][2]['reads'] == 3
+
+
+def test_reads_go_to_a_replica_and_fall_back_to_primary(monkeypatch):
+    primary = FakeAsyncPool(rows=['primary'])
+    replica = FakeAsyncPool(rows=['replica'])
+    replicas = AsyncReplicaSet([replica], max_lag=2, lag_check_interval=0)
+    monkeypatch.setattr(async_db, '_pool', primary)
+    monkeypatch.setattr(async_db, '_replicas', replicas)
+
+    assert asyncio.run(async_db.fetch('SELECT 1')) == ['replica']
+    replica.conn.lag = 30
+    assert asyncio.run(async_db.fetch('SELECT 1')) == ['primary']
+    assert replicas.stats()['primary_fallbacks'] == 1
+    assert primary.in_use == replica.in_use == 0
+
+
+def test_primary_reads_skip_the_replicas(monkeypatch):
+    primary = FakeAsyncPool(rows=['fresh'])
+    replica = FakeAsyncPool(rows=['stale'])
+    monkeypatch.setattr(async_db, '_pool', primary)
+    monkeypatch.setattr(async_db, '_replicas', AsyncReplicaSet([replica], max_lag=2, lag_check_interval=0))
+
+    assert asyncio.run(async_db.fetch('SELECT 1', primary=True)) == ['fresh']
+    assert asyncio.run(async_db.fetch('SELECT 1')) == ['stale']
@@ -0,0 +1,33 @@
+from benchmarks.suite import compare
+
+
+def run(**routes):
+    return {'commit': 'abc', 'routes': routes}
+
+
+def result(p95, throughput, errors=0):
+    return {'p95_ms': p95, 'throughput': throughput, 'errors': errors}
+
+
+def test_compare_within_tolerance():
+    baseline = run(list=result(20.0, 400.0))
+    current = run(list=result(22.0, 360.0))
+
+    assert compare(current, baseline, tolerance=0.15) == []
+
+
+def test_compare_reports_latency_throughput_and_errors():
+    baseline = run(list=result(20.0, 400.0), by_id=result(10.0, 500.0))
+    current = run(list=result(30.0, 300.0), by_id=result(10.0, 500.0, errors=3))
+
+    regressions = compare(current, baseline, tolerance=0.15)
+
+    assert regressions == [
+        'list: p95 20.0 -> 30.0 ms',
+        'list: throughput 400.0 -> 300.0 req/s',
+        'by_id: errors 0 -> 3',
+    ]
+
+
+def test_compare_skips_new_routes():
+    assert compare(run(image=result(5.0, 900.0)), run(), tolerance=0.15) == []
@@ -0,0 +1,132 @@
+import time
+import pytest
+from utils.cache import MISSING, MemoryCache, RedisCache, create_cache, get_many_or_load, get_or_load
+
+
+def test_hit_and_miss_counters():
+    cache = MemoryCache(maxsize=10, ttl=60)
+    assert cache.get('a') is MISSING
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = MemoryCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire():
+    cache = MemoryCache(maxsize=10, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is MISSING
+    assert cache.stats()['size'] == 0
+
+
+def test_delete_prefix_only_drops_matching_keys():
+    cache = MemoryCache()
+    cache.set('products:list:0:50:a', 1)
+    cache.set('products:category:1:0:50:a', 2)
+    cache.set('product:7', 3)
+    cache.delete_prefix('products:list:')
+
+    assert cache.get('products:list:0:50:a') is MISSING
+    assert cache.get('products:category:1:0:50:a') == 2
+    assert cache.get('product:7') == 3
+
+
+def test_get_or_load_reads_through_and_skips_none():
+    cache = MemoryCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {'product_id': 1}
+
+    assert get_or_load(cache, 'product:1', loader) == {'product_id': 1}
+    assert get_or_load(cache, 'product:1', loader) == {'product_id': 1}
+    assert len(calls) == 1
+
+    assert get_or_load(cache, 'product:2', lambda: None) is None
+    assert cache.get('product:2') is MISSING
+
+
+def test_get_many_or_load_only_loads_misses():
+    cache = MemoryCache()
+    cache.set('product:1', 'one')
+    requested = []
+
+    def loader(keys):
+        requested.append(keys)
+        return {key: key.upper() for key in keys if key != 'product:3'}
+
+    found = get_many_or_load(cache, ['product:1', 'product:2', 'product:3'], loader)
+    assert found == {'product:1': 'one', 'product:2': 'PRODUCT:2'}
+    assert requested == [['product:2', 'product:3']]
+    assert cache.get_many(['product:2', 'product:3']) == {'product:2': 'PRODUCT:2'}
+
+
+def make_redis_worker(server):
+    fakeredis = pytest.importorskip('fakeredis')
+    return RedisCache(fakeredis.FakeRedis(server=server), ttl=60)
+
+
+def test_redis_entries_are_shared_between_workers():
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = make_redis_worker(server), make_redis_worker(server)
+
+    worker_a.set('products:list:0:50:a', [[{'product_id': 1, 'price': 1.5}], None])
+
+    assert worker_b.get('products:list:0:50:a') == [[{'product_id': 1, 'price': 1.5}], None]
+    assert worker_b.stats()['hits'] == 1
+
+
+def test_redis_invalidation_reaches_every_worker():
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = make_redis_worker(server), make_redis_worker(server)
+    worker_a.set('products:list:0:50:a', 1)
+    worker_a.set('products:list:3:50:a', 2)
+    worker_a.set('products:category:1:0:50:a', 3)
+
+    worker_b.delete_prefix('products:list:')
+
+    assert worker_a.get('products:list:0:50:a') is MISSING
+    assert worker_a.get('products:list:3:50:a') is MISSING
+    assert worker_a.get('products:category:1:0:50:a') == 3
+
+
+def test_redis_batch_reads_and_writes():
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    worker_a, worker_b = make_redis_worker(server), make_redis_worker(server)
+
+    worker_a.set_many({'product:1': {'product_id': 1}, 'product:2': {'product_id': 2}})
+
+    assert worker_b.get_many(['product:2', 'product:9', 'product:1']) == {
+        'product:2': {'product_id': 2}, 'product:1': {'product_id': 1},
+    }
+    assert worker_b.stats()['hits'] == 2
+    assert worker_b.stats()['misses'] == 1
+
+
+def test_unreachable_redis_degrades_to_misses():
+    pytest.importorskip('redis')
+    cache = create_cache('redis', ttl=60, redis_url='redis://127.0.0.1:1/0')
+
+    cache.set('categories', [1])
+    assert get_or_load(cache, 'categories', lambda: ['loaded']) == ['loaded']
+    assert cache.stats()['failures'] >= 2
@@ -0,0 +1,88 @@
+import gzip
+
+import brotli
+from flask import Flask
+import utils.cache as cache
+import utils.compression as compression
+from utils.cache import MemoryCache
+from utils.compression import choose_encoding, compress_response, precompress_directory, send_static
+from utils.http_cache import conditional_catalog
+
+PRODUCTS = [{'product_id': i, 'productname': f'Product {i}'} for i in range(200)]
+
+
+def make_app(monkeypatch, static_folder=None):
+    monkeypatch.setattr(cache, 'catalog_cache', MemoryCache())
+    monkeypatch.setattr(compression, 'compressed_cache', MemoryCache())
+    app = Flask(__name__)
+    app.after_request(compress_response)
+
+    @app.route('/api/products')
+    @conditional_catalog
+    def products():
+        return PRODUCTS, 200
+
+    @app.route('/api/small')
+    def small():
+        return {'ok': True}, 200
+
+    @app.route('/assets/<path:filename>')
+    def static_file(filename):
+        return send_static(static_folder, filename)
+
+    return app.test_client()
+
+
+def test_prefers_brotli_and_respects_quality():
+    assert choose_encoding('gzip, deflate, br') == 'br'
+    assert choose_encoding('gzip, br;q=0') == 'gzip'
+    assert choose_encoding('identity') is None
+    assert choose_encoding(None) is None
+
+
+def test_large_json_is_compressed_and_small_json_is_not(monkeypatch):
+    client = make_app(monkeypatch)
+
+    response = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).startswith(b'[{"product_id":0')
+
+    response = client.get('/api/products', headers={'Accept-Encoding': 'br'})
+    assert brotli.decompress(response.data).startswith(b'[{"product_id":0')
+
+    assert 'Content-Encoding' not in client.get('/api/small', headers={'Accept-Encoding': 'br'}).headers
+    assert 'Content-Encoding' not in client.get('/api/products').headers
+
+
+def test_compressed_catalog_body_is_reused_and_revalidates(monkeypatch):
+    client = make_app(monkeypatch)
+    calls = []
+    original = compression.compress
+    monkeypatch.setattr(compression, 'compress', lambda *args, **kwargs: calls.append(1) or original(*args, **kwargs))
+
+    first = client.get('/api/products', headers={'Accept-Encoding': 'br'})
+    second = client.get('/api/products', headers={'Accept-Encoding': 'br'})
+    assert first.data == second.data
+    assert len(calls) == 1
+    assert first.headers['ETag'].startswith('W/')
+
+    revalidated = client.get('/api/products', headers={
+        'Accept-Encoding': 'br', 'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_precompressed_static_files_are_served_from_disk(monkeypatch, tmp_path):
+    (tmp_path / 'swagger.json').write_text('{"openapi": "3.0.0"}' * 100)
+    assert len(precompress_directory(str(tmp_path))) == 2
+    client = make_app(monkeypatch, str(tmp_path))
+
+    response = client.get('/assets/swagger.json', headers={'Accept-Encoding': 'br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.mimetype == 'application/json'
+    assert brotli.decompress(response.get_data()) == (tmp_path / 'swagger.json').read_bytes()
+    response.close()
+
+    response = client.get('/assets/swagger.json')
+    assert 'Content-Encoding' not in response.headers
+    response.close()
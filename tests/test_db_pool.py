@@ -0,0 +1,165 @@
+import threading
+import pytest
+from flask import Flask
+from psycopg2 import extensions
+import utils.db as db
+from utils.db import PoolTimeout, ReplicaSet
+
+
+def test_connections_are_reused_after_putconn(make_pool):
+    pool, opened = make_pool()
+    for _ in range(10):
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+    assert len(opened) == 1
+    stats = pool.stats()
+    assert stats['checkouts'] == 10
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+
+
+def test_exhausted_pool_times_out(make_pool):
+    pool, _ = make_pool()
+    pool.getconn()
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+    assert pool.stats()['wait_time_recent'] > 0
+
+
+def test_waiter_gets_returned_connection(make_pool):
+    pool, opened = make_pool(maxconn=1, timeout=2)
+    conn = pool.getconn()
+    result = {}
+
+    def borrow():
+        result['conn'] = pool.getconn()
+
+    waiter = threading.Thread(target=borrow)
+    waiter.start()
+    pool.putconn(conn)
+    waiter.join(timeout=2)
+
+    assert result['conn'] is conn
+    assert len(opened) == 1
+
+
+def test_broken_idle_connection_is_replaced(make_pool):
+    pool, opened = make_pool(healthcheck_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+
+    fresh = pool.getconn()
+
+    assert fresh is not conn
+    assert conn.closed
+    assert pool.stats()['discarded'] == 1
+    assert pool.stats()['size'] == 1
+
+
+def test_closed_connection_is_not_pooled(make_pool):
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.close()
+    pool.putconn(conn)
+
+    assert pool.stats()['size'] == 0
+    assert pool.stats()['idle'] == 0
+
+
+def test_open_transaction_is_rolled_back_on_return(make_pool):
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+
+
+def test_idle_connections_above_minimum_are_closed(make_pool):
+    pool, _ = make_pool(minconn=1, max_idle=0)
+    first = pool.getconn()
+    second = pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+
+    assert first.closed
+    assert pool.stats()['size'] == 1
+    assert pool.stats()['idle_closed'] == 1
+
+
+def test_prefill_opens_idle_connections_up_to_max(make_pool):
+    pool, opened = make_pool(maxconn=3)
+
+    assert pool.prefill(5) == 3
+    assert pool.prefill(5) == 0
+    conn = pool.getconn()
+
+    assert len(opened) == 3
+    assert conn in opened
+    assert pool.stats()['idle'] == 2
+
+
+def test_replica_reads_are_spread_round_robin(make_pool):
+    first, _ = make_pool()
+    second, _ = make_pool()
+    replicas = ReplicaSet([first, second])
+
+    used = []
+    for _ in range(4):
+        replica, conn = replicas.getconn()
+        used.append(replica)
+        replica.putconn(conn)
+
+    assert used == [first, second, first, second]
+
+
+def test_lagging_and_unreachable_replicas_are_skipped(make_pool):
+    lagging, _ = make_pool(lag=30)
+    down, _ = make_pool(unreachable=True)
+    healthy, _ = make_pool()
+    replicas = ReplicaSet([lagging, down, healthy], max_lag=2)
+
+    for _ in range(3):
+        replica, conn = replicas.getconn()
+        assert replica is healthy
+        replica.putconn(conn)
+
+    stats = replicas.stats()
+    assert stats['replicas'][0]['lag'] == 30
+    assert stats['replicas'][1]['healthy'] is False
+
+
+def test_no_usable_replica_falls_back_to_primary(monkeypatch, make_pool):
+    primary, _ = make_pool()
+    lagging, _ = make_pool(lag=30)
+    monkeypatch.setattr(db, '_pool', primary)
+    monkeypatch.setattr(db, '_replicas', ReplicaSet([lagging], max_lag=2))
+
+    with db.get_connection(readonly=True):
+        assert primary.stats()['in_use'] == 1
+    assert db.get_replicas().stats()['primary_fallbacks'] == 1
+
+
+def test_reads_after_a_write_stay_on_primary_within_a_request(monkeypatch, make_pool):
+    primary, _ = make_pool()
+    replica, _ = make_pool()
+    monkeypatch.setattr(db, '_pool', primary)
+    monkeypatch.setattr(db, '_replicas', ReplicaSet([replica]))
+
+    with Flask(__name__).test_request_context():
+        with db.get_connection(readonly=True):
+            assert replica.stats()['in_use'] == 1
+        with db.get_connection():
+            pass
+        with db.get_connection(readonly=True):
+            assert primary.stats()['in_use'] == 1
+            assert replica.stats()['in_use'] == 0
+
+    with Flask(__name__).test_request_context():
+        with db.get_connection(readonly=True):
+            assert replica.stats()['in_use'] == 1
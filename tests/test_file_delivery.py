@@ -0,0 +1,138 @@
+import gc
+import io
+import os
+import warnings
+
+import pytest
+from PIL import Image
+
+import utils.file_delivery as file_delivery
+from app import app
+from utils.file_delivery import send_stored_file, stat_cache
+from utils.images import UPLOAD_FOLDER, process_original, save_original, store_image
+
+
+@pytest.fixture
+def image_hash(monkeypatch, tmp_path):
+    # UPLOAD_FOLDER is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    stat_cache.clear()
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), 'purple').save(buffer, 'JPEG')
+    yield store_image(buffer.getvalue())
+    stat_cache.clear()
+
+
+def test_variant_is_sent_as_a_file_with_validators(image_hash):
+    response = app.test_client().get(f'/images/{image_hash}?size=thumb', headers={'Accept': 'image/jpeg'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    with open(os.path.join(UPLOAD_FOLDER, image_hash, 'thumb.jpg'), 'rb') as f:
+        assert response.data == f.read()
+    assert response.headers['ETag'] == f'"{image_hash}-thumb.jpg"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_range_head_and_conditional_requests(image_hash):
+    client = app.test_client()
+    url = f'/images/{image_hash}?size=thumb'
+    full = client.get(url)
+
+    partial = client.get(url, headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206
+    assert partial.data == full.data[10:20]
+    assert partial.headers['Content-Range'] == f'bytes 10-19/{len(full.data)}'
+
+    head = client.head(url)
+    assert head.status_code == 200
+    assert head.data == b''
+    assert head.headers['Content-Length'] == str(len(full.data))
+
+    assert client.get(url, headers={'If-None-Match': full.headers['ETag']}).status_code == 304
+    assert client.get(url, headers={'Range': f'bytes={len(full.data)}-'}).status_code == 416
+
+
+def test_unsatisfiable_range_does_not_leak_the_file(image_hash):
+    client = app.test_client()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ResourceWarning)
+        assert client.get(f'/images/{image_hash}?size=thumb', headers={'Range': 'bytes=999999-'}).status_code == 416
+        gc.collect()
+    assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+
+def test_missing_images_are_404(image_hash):
+    client = app.test_client()
+
+    assert client.get(f'/images/{"0" * 32}').status_code == 404
+    response = client.get('/images/no-such-file.jpg')
+    assert response.status_code == 404
+    assert response.get_json() == {'message': 'Image not found'}
+
+
+def test_pending_image_is_not_served_until_its_variants_exist(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    stat_cache.clear()
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCameraMaker'
+    Image.new('RGB', (400, 300), 'teal').save(buffer, 'JPEG', exif=exif)
+    image_hash, _ = save_original(buffer.getvalue())
+    client = app.test_client()
+
+    pending = client.get(f'/images/{image_hash}')
+    assert pending.status_code == 202
+    assert pending.mimetype == 'application/json'
+    assert pending.headers['Retry-After']
+
+    process_original(image_hash)
+    response = client.get(f'/images/{image_hash}')
+    assert response.status_code == 200
+    assert not Image.open(io.BytesIO(response.data)).getexif()
+
+
+def test_names_outside_the_root_are_rejected(image_hash):
+    with app.test_request_context('/images/x'):
+        assert send_stored_file(UPLOAD_FOLDER, '../../etc/passwd', max_age=60) is None
+        assert send_stored_file(UPLOAD_FOLDER, image_hash, max_age=60) is None  # A directory
+
+
+@pytest.mark.parametrize('delivery, header', [('x-accel', 'X-Accel-Redirect'), ('x-sendfile', 'X-Sendfile')])
+def test_offloaded_delivery_only_sends_headers(image_hash, monkeypatch, delivery, header):
+    monkeypatch.setattr(file_delivery, 'IMAGE_DELIVERY', delivery)
+    response = app.test_client().get(f'/images/{image_hash}?size=card')
+
+    assert response.status_code == 200
+    assert response.data == b''
+    if delivery == 'x-accel':
+        assert response.headers[header] == f'/_uploads/{image_hash}/card.jpg'
+    else:
+        assert response.headers[header] == os.path.abspath(os.path.join(UPLOAD_FOLDER, image_hash, 'card.jpg'))
+
+
+def test_accel_redirect_path_is_url_quoted(tmp_path):
+    (tmp_path / 'a b#1.jpg').write_bytes(b'jpeg')
+    with app.test_request_context('/images/x'):
+        response = send_stored_file(str(tmp_path), 'a b#1.jpg', max_age=60, delivery='x-accel')
+    assert response.headers['X-Accel-Redirect'] == '/_uploads/a%20b%231.jpg'
+
+
+def test_missing_files_are_not_remembered(tmp_path):
+    stat_cache.clear()
+    path = tmp_path / 'late.jpg'
+    assert file_delivery.file_stat(str(path)) is None
+    path.write_bytes(b'jpeg')
+    assert file_delivery.file_stat(str(path)) == (4, path.stat().st_mtime)
+
+
+def test_stat_results_are_cached(image_hash):
+    client = app.test_client()
+    client.get(f'/images/{image_hash}?size=card')
+    before = stat_cache.stats()
+    client.get(f'/images/{image_hash}?size=card')
+
+    after = stat_cache.stats()
+    assert after['hits'] > before['hits']
+    assert after['misses'] == before['misses']
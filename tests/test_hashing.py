@@ -0,0 +1,46 @@
+import pytest
+from werkzeug.security import check_password_hash
+from utils.hashing import HashingBusy, PasswordHasher
+
+# Few iterations keep the tests fast; the algorithm and code path are the same
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_inline_hashing_produces_checkable_hashes():
+    hasher = PasswordHasher(workers=0, queue_size=4, method=FAST_METHOD)
+    pwhash = hasher.hash('secret')
+
+    assert pwhash.startswith('pbkdf2:sha256')
+    assert check_password_hash(pwhash, 'secret')
+    assert hasher.verify(pwhash, 'secret')
+    assert not hasher.verify(pwhash, 'wrong')
+    assert hasher.stats()['hashed'] == 1
+
+
+def test_process_pool_hashes_batches_in_order():
+    hasher = PasswordHasher(workers=2, queue_size=8, method=FAST_METHOD)
+    try:
+        passwords = [f'password{i}' for i in range(5)]
+        hashes = hasher.hash_many(passwords, chunk_size=2)
+    finally:
+        hasher.shutdown()
+
+    assert len(hashes) == 5
+    assert all(check_password_hash(h, p) for h, p in zip(hashes, passwords))
+    stats = hasher.stats()
+    assert stats['tasks'] == 3
+    assert stats['hashed'] == 5
+    assert stats['in_flight'] == 0
+
+
+def test_full_queue_rejects_with_hashing_busy():
+    hasher = PasswordHasher(workers=0, queue_size=1, method=FAST_METHOD)
+    hasher._slots.acquire()  # Simulate a task occupying the only slot
+    try:
+        with pytest.raises(HashingBusy):
+            hasher.hash('secret', wait=0.01)
+    finally:
+        hasher._slots.release()
+
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.hash('secret')
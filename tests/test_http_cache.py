@@ -0,0 +1,75 @@
+from flask import Flask
+import utils.cache as cache
+from utils.cache import MemoryCache, invalidate_product
+from utils.http_cache import conditional_catalog
+
+
+def make_app(monkeypatch):
+    monkeypatch.setattr(cache, 'catalog_cache', MemoryCache())
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/api/categories')
+    @conditional_catalog
+    def categories():
+        calls.append(1)
+        return {'categories': []}, 200
+
+    @app.route('/api/products/<int:product_id>')
+    @conditional_catalog
+    def product(product_id):
+        return {'message': 'Product not found'}, 404
+
+    return app.test_client(), calls
+
+
+def test_matching_etag_returns_304_without_running_view(monkeypatch):
+    client, calls = make_app(monkeypatch)
+    first = client.get('/api/categories')
+    assert first.status_code == 200
+    assert first.headers['ETag']
+    assert first.headers['Last-Modified']
+
+    second = client.get('/api/categories', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert len(calls) == 1
+
+
+def test_catalog_write_changes_the_etag(monkeypatch):
+    client, calls = make_app(monkeypatch)
+    etag = client.get('/api/categories').headers['ETag']
+
+    invalidate_product(1, 1)
+
+    response = client.get('/api/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(calls) == 2
+
+
+def test_version_is_bumped_after_the_stale_entries_are_gone(monkeypatch):
+    monkeypatch.setattr(cache, 'catalog_cache', MemoryCache())
+    cache.catalog_cache.set('products:list:first', ['stale'])
+    seen = []
+    monkeypatch.setattr(cache, 'bump_catalog_version',
+                        lambda: seen.append(cache.catalog_cache.get('products:list:first')))
+
+    invalidate_product(1, 1)
+
+    assert seen == [cache.MISSING]
+
+
+def test_etag_depends_on_query_string(monkeypatch):
+    client, _ = make_app(monkeypatch)
+    plain = client.get('/api/categories').headers['ETag']
+    paged = client.get('/api/categories?limit=5').headers['ETag']
+    assert plain != paged
+
+
+def test_errors_carry_no_validators(monkeypatch):
+    client, _ = make_app(monkeypatch)
+    response = client.get('/api/products/9999')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
@@ -0,0 +1,72 @@
+import io
+import os
+import pytest
+from PIL import Image
+from werkzeug.datastructures import MIMEAccept
+from utils.images import (
+    IMAGE_SIZES, InvalidImage, find_original, process_original, save_original, select_variant, store_image,
+)
+
+
+def make_jpeg(width=900, height=300):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'SecretCameraMaker'
+    Image.new('RGB', (width, height), 'purple').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def test_variants_are_resized_and_stripped(tmp_path):
+    image_hash = store_image(make_jpeg(), str(tmp_path))
+
+    for size, edge in IMAGE_SIZES.items():
+        with Image.open(tmp_path / image_hash / f'{size}.jpg') as variant:
+            assert max(variant.size) == min(edge, 900)
+            assert not variant.getexif()
+
+
+def test_duplicate_upload_is_stored_once(tmp_path):
+    data = make_jpeg()
+    first = store_image(data, str(tmp_path))
+    second = store_image(data, str(tmp_path))
+
+    assert first == second
+    assert os.listdir(tmp_path) == [first]
+
+
+def test_undecodable_upload_is_rejected(tmp_path):
+    with pytest.raises(InvalidImage):
+        store_image(b'fake image data', str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_variant_selection_follows_accept_header(tmp_path):
+    image_hash = store_image(make_jpeg(), str(tmp_path))
+
+    _, name = select_variant(image_hash, 'thumb', MIMEAccept([('image/webp', 1), ('*/*', 0.8)]), str(tmp_path))
+    assert name == 'thumb.webp'
+    _, name = select_variant(image_hash, 'thumb', MIMEAccept([('*/*', 1)]), str(tmp_path))
+    assert name == 'thumb.jpg'
+    assert select_variant('0' * 32, 'thumb', MIMEAccept([('*/*', 1)]), str(tmp_path)) is None
+
+
+def test_original_is_kept_until_variants_are_built(tmp_path):
+    data = make_jpeg()
+    image_hash, pending = save_original(data, str(tmp_path))
+
+    assert pending
+    assert find_original(image_hash, str(tmp_path)) == (str(tmp_path / 'originals'), f'{image_hash}.jpg')
+    assert select_variant(image_hash, 'card', MIMEAccept([('*/*', 1)]), str(tmp_path)) is None
+
+    process_original(image_hash, str(tmp_path))
+
+    assert select_variant(image_hash, 'card', MIMEAccept([('*/*', 1)]), str(tmp_path))
+    # Only the stripped variants are kept
+    assert find_original(image_hash, str(tmp_path)) is None
+    assert os.listdir(tmp_path / 'originals') == []
+    assert save_original(data, str(tmp_path)) == (image_hash, False)
+
+
+def test_save_original_rejects_non_images(tmp_path):
+    with pytest.raises(InvalidImage):
+        save_original(b'fake image data', str(tmp_path))
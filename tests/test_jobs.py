@@ -0,0 +1,116 @@
+import threading
+import time
+import pytest
+import utils.jobs as jobs
+from models.job import Job
+
+
+@pytest.fixture
+def log(fake_connection, use_connection):
+    """(query, params) of every statement the jobs module runs."""
+    return use_connection(jobs, fake_connection()).executed
+
+
+def run_job(monkeypatch, handler, attempts=1, max_attempts=3):
+    monkeypatch.setattr(jobs, 'claim_job', lambda: (7, 'test_task', {'value': 2}, attempts, max_attempts))
+    monkeypatch.setitem(jobs.TASKS, 'test_task', handler)
+    assert jobs.run_one() is True
+
+
+def test_successful_job_stores_result(monkeypatch, log):
+    run_job(monkeypatch, lambda value: {'doubled': value * 2})
+
+    query, params = log[-1]
+    assert "status = 'succeeded'" in query
+    assert params[0].adapted == {'doubled': 4}
+    assert params[1] == 7
+
+
+def test_failed_job_is_requeued_with_backoff(monkeypatch, log):
+    def handler(value):
+        raise RuntimeError('boom')
+
+    run_job(monkeypatch, handler, attempts=1, max_attempts=3)
+
+    query, (status, error, delay, job_id) = log[-1]
+    assert status == 'queued'
+    assert error == 'RuntimeError: boom'
+    assert 0 < delay <= jobs.JOB_BACKOFF_BASE
+    assert job_id == 7
+
+
+def test_job_fails_permanently_after_max_attempts(monkeypatch, log):
+    def handler(value):
+        raise RuntimeError('boom')
+
+    run_job(monkeypatch, handler, attempts=3, max_attempts=3)
+
+    _, (status, _, delay, _) = log[-1]
+    assert status == 'failed'
+    assert delay == 0
+
+
+def test_job_status_does_not_expose_errors():
+    assert 'last_error' not in Job.FIELDS
+    assert 'last_error' not in Job.columns()
+
+
+def test_heartbeat_extends_the_lease_until_stopped(log):
+    stop = threading.Event()
+    thread = threading.Thread(target=jobs.heartbeat, args=(7, stop, 0.01))
+    thread.start()
+    time.sleep(0.1)
+    stop.set()
+    thread.join(timeout=1)
+
+    assert not thread.is_alive()
+    assert log and all(query.startswith('UPDATE jobs SET updated_at = now()') and params == (7,)
+                       for query, params in log)
+
+
+def test_expired_leases_are_reclaimed_only_below_max_attempts(log):
+    assert jobs.claim_job() is None
+
+    expire, claim = (query for query, _ in log)
+    assert "SET status = 'failed'" in expire and 'attempts >= max_attempts' in expire
+    assert "status = 'running' AND attempts < max_attempts" in claim
+
+
+def test_empty_queue(monkeypatch):
+    monkeypatch.setattr(jobs, 'claim_job', lambda: None)
+    assert jobs.run_one() is False
+
+
+def test_backoff_grows_and_is_capped():
+    assert jobs.backoff_seconds(1) <= jobs.JOB_BACKOFF_BASE
+    assert jobs.backoff_seconds(4) >= jobs.JOB_BACKOFF_BASE * 4
+    assert jobs.backoff_seconds(50) <= jobs.JOB_BACKOFF_MAX
+
+
+def test_warm_task_caches_the_primary_rows_not_a_stale_replica(monkeypatch, fake_connection, make_pool):
+    import controllers.category_controller as category_controller
+    import controllers.product_controller as product_controller
+    import utils.db as db
+    import utils.tasks as tasks
+    from utils.cache import MemoryCache
+
+    def serving(categories):
+        def results(query, params):
+            if 'pg_last_wal' in query:
+                return [(0,)]
+            return categories if 'FROM categories' in query else []
+        return lambda dsn: fake_connection(results)
+
+    # The replica has not replayed the category written just before the job ran
+    primary, _ = make_pool(connect=serving([(1, 'rings'), (2, 'watches')]))
+    replica, _ = make_pool(connect=serving([(1, 'rings')]))
+    monkeypatch.setattr(db, '_pool', primary)
+    monkeypatch.setattr(db, '_replicas', db.ReplicaSet([replica], lag_check_interval=0))
+    cache = MemoryCache(maxsize=10, ttl=60)
+    for module in (tasks, category_controller, product_controller):
+        monkeypatch.setattr(module, 'catalog_cache', cache)
+
+    tasks.warm_catalog_cache(2)
+
+    assert [c['categoryname'] for c in cache.get('categories')] == ['rings', 'watches']
+    assert replica.stats()['in_use'] == 0
@@ -0,0 +1,46 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+from utils.json_provider import FastJSONProvider
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def app(request):
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app, backend=request.param)
+
+    @app.route('/product')
+    def product():
+        return {'product_id': 1, 'price': Decimal('19.99'), 'category_id': None}, 200
+
+    @app.route('/products')
+    def products():
+        return [{'product_id': 2}, {'product_id': 1}], 200
+
+    return app
+
+
+def test_decimal_is_encoded_as_number(app):
+    response = app.test_client().get('/product')
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == {'product_id': 1, 'price': 19.99, 'category_id': None}
+
+
+def test_keys_keep_controller_order(app):
+    body = app.test_client().get('/product').get_data(as_text=True)
+    assert body.index('product_id') < body.index('price') < body.index('category_id')
+
+
+def test_lists_and_request_bodies_round_trip(app):
+    client = app.test_client()
+    assert client.get('/products').get_json() == [{'product_id': 2}, {'product_id': 1}]
+    with app.app_context():
+        assert app.json.loads(app.json.dumps({'a': [1, 2]})) == {'a': [1, 2]}
+
+
+def test_datetimes_match_flask_default(app):
+    moment = datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    with app.app_context():
+        assert app.json.loads(app.json.dumps({'at': moment})) == {'at': 'Wed, 01 May 2024 12:30:00 GMT'}
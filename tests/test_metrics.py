@@ -0,0 +1,54 @@
+import logging
+
+from flask import Flask, g
+from prometheus_client import REGISTRY
+import utils.metrics as metrics
+from utils.metrics import observe_pool_wait, observe_query, record_request_metrics, start_request_timer
+
+
+def make_app():
+    app = Flask(__name__)
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+
+    @app.route('/api/things/<int:thing_id>')
+    def thing(thing_id):
+        observe_pool_wait(0.01)
+        observe_query('SELECT 1', 0.002)
+        observe_query('SELECT 2', 0.003)
+        return {'thing_id': thing_id, 'queries': g.db_queries}, 200
+
+    return app.test_client()
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_metrics_are_labelled_by_route():
+    route = '/api/things/<int:thing_id>'
+    before = sample('http_request_duration_seconds_count', method='GET', route=route, status='200')
+    queries_before = sample('db_queries_per_request_sum', route=route)
+
+    client = make_app()
+    assert client.get('/api/things/1').get_json()['queries'] == 2
+    client.get('/api/things/2')
+
+    assert sample('http_request_duration_seconds_count', method='GET', route=route, status='200') == before + 2
+    assert sample('db_queries_per_request_sum', route=route) == queries_before + 4
+    assert sample('db_time_per_request_seconds_sum', route=route) > 0
+    assert sample('db_pool_wait_per_request_seconds_sum', route=route) > 0
+    assert sample('http_response_size_bytes_count', route=route) >= 2
+
+
+def test_slow_queries_are_logged_and_counted(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_SECONDS', 0.1)
+    before = sample('db_slow_queries_total')
+
+    with caplog.at_level(logging.WARNING, logger='utils.metrics'):
+        observe_query(b'SELECT *\n    FROM products', 0.25)
+        observe_query('SELECT 1', 0.01)
+
+    assert sample('db_slow_queries_total') == before + 1
+    assert 'Slow query (0.250s): SELECT * FROM products' in caplog.text
+    assert 'SELECT 1' not in caplog.text
@@ -0,0 +1,73 @@
+import pytest
+
+import utils.migrate as migrate
+from utils.migrate import Migration, discover_migrations
+
+
+@pytest.fixture
+def migration_db(monkeypatch, fake_connection, make_pool):
+    """A pool whose one connection reports ``applied`` versions and remembers each statement's autocommit."""
+    def make(applied=()):
+        conn = fake_connection()
+        conn.autocommit_during = {}
+
+        def results(query, params):
+            conn.autocommit_during[query.strip()] = conn.autocommit
+            if query.startswith('SELECT version FROM schema_migrations'):
+                return [(version,) for version in applied]
+            return []
+
+        conn.results = results
+        pool, _ = make_pool(connect=lambda dsn: conn)
+        monkeypatch.setattr(migrate, 'get_pool', lambda: pool)
+        return pool, conn
+    return make
+
+
+def test_migrations_are_discovered_in_version_order():
+    versions = [migration.version for migration in discover_migrations()]
+    assert versions == sorted(versions)
+    assert versions[0] == 1
+
+
+def test_only_pending_migrations_run(migration_db):
+    pool, conn = migration_db(applied={1})
+
+    applied = migrate.upgrade([
+        Migration(1, 'initial', ['CREATE TABLE a ();']),
+        Migration(2, 'more', ['CREATE TABLE b ();']),
+    ])
+
+    assert [migration.version for migration in applied] == [2]
+    statements = [query for query, _ in conn.executed]
+    assert 'CREATE TABLE a ();' not in statements
+    assert 'CREATE TABLE b ();' in statements
+    assert statements[0].startswith('SELECT pg_advisory_lock')
+    assert statements[-1].startswith('SELECT pg_advisory_unlock')
+    assert pool.stats()['in_use'] == 0
+
+
+def test_concurrent_migrations_run_outside_a_transaction(migration_db):
+    _, conn = migration_db()
+
+    migrate.upgrade([
+        Migration(1, 'table', ['CREATE TABLE a ();']),
+        Migration(2, 'index', ['CREATE INDEX CONCURRENTLY a_idx ON a (id);'], concurrently=True),
+    ])
+
+    autocommit = conn.autocommit_during
+    assert autocommit['CREATE TABLE a ();'] is False
+    assert autocommit['CREATE INDEX CONCURRENTLY a_idx ON a (id);'] is True
+    assert conn.autocommit is False
+
+
+def test_search_vector_is_added_without_a_table_rewrite():
+    migrations = {migration.version: migration for migration in discover_migrations()}
+    schema = ' '.join(migrations[3].statements)
+    assert 'GENERATED' not in schema
+    assert 'CREATE TRIGGER products_search_vector_update' in schema
+
+    indexes = migrations[4]
+    assert indexes.concurrently
+    assert 'COMMIT' in indexes.statements[0]  # Batched backfill, before the GIN index is built
+    assert any('USING GIN (search_vector)' in statement for statement in indexes.statements[1:])
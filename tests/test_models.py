@@ -0,0 +1,41 @@
+import datetime
+from decimal import Decimal
+
+from models.category import Category
+from models.job import Job
+from models.product import Product
+from models.user import User
+
+
+def test_columns_follow_api_fields():
+    assert Product.columns() == 'productid, productname, description, price, categoryid, image_url'
+    assert Product.columns(['product_id', 'price']) == 'productid, price'
+    assert Category.columns() == 'categoryid, categoryname'
+
+
+def test_user_columns_never_include_password():
+    assert 'password' not in User.columns()
+    assert User.mapper()((1, 'lemmy', 'lemmy@example.com', False)) == {
+        'user_id': 1, 'username': 'lemmy', 'email': 'lemmy@example.com', 'is_admin': False,
+    }
+
+
+def test_mapper_converts_values_for_projection():
+    to_dict = Product.mapper(['product_id', 'price'])
+    assert to_dict((7, Decimal('19.99'))) == {'product_id': 7, 'price': 19.99}
+    assert Product.mapper(('product_id', 'price')) is to_dict
+
+
+def test_mapper_leaves_nulls_alone():
+    created = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    job = Job.mapper()((1, 'process_image', 'queued', 0, 5, created, None, None, created, created))
+    assert job['run_at'] == created.isoformat()
+    assert job['result'] is None
+
+
+def test_from_row_round_trips_to_dict():
+    row = (3, 'Spiked bracelet', 'Steel', Decimal('25.00'), 1, None)
+    product = Product.from_row(row)
+    assert product.price == Decimal('25.00')
+    assert product.to_dict() == Product.mapper()(row)
+    assert not hasattr(product, '__dict__')
@@ -0,0 +1,66 @@
+import pytest
+from utils.pagination import (
+    MAX_PAGE_SIZE, PaginationError, decode_cursor, encode_cursor, page_headers, parse_fields, parse_ids,
+    parse_limit,
+)
+
+PRODUCT_FIELDS = ['product_id', 'productname', 'description', 'price', 'category_id', 'image_url']
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(12345)) == 12345
+
+
+def test_missing_cursor_starts_at_beginning():
+    assert decode_cursor(None) == 0
+    assert decode_cursor('') == 0
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(PaginationError):
+        decode_cursor('not a cursor!')
+
+
+def test_limit_defaults_and_is_capped():
+    assert parse_limit(None, default=25) == 25
+    assert parse_limit('10') == 10
+    assert parse_limit(str(MAX_PAGE_SIZE * 10)) == MAX_PAGE_SIZE
+    with pytest.raises(PaginationError):
+        parse_limit('0')
+    with pytest.raises(PaginationError):
+        parse_limit('ten')
+
+
+def test_fields_keep_column_order_and_required_keys():
+    assert parse_fields('price,productname', PRODUCT_FIELDS, required=('product_id',)) == [
+        'product_id', 'productname', 'price',
+    ]
+    assert parse_fields(None, PRODUCT_FIELDS) == PRODUCT_FIELDS
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(PaginationError):
+        parse_fields('price,password', PRODUCT_FIELDS)
+
+
+def test_page_headers_replace_existing_cursor():
+    headers = page_headers('abc', '/api/products', {'limit': '20', 'cursor': 'old'})
+    assert headers['X-Next-Cursor'] == 'abc'
+    assert headers['Link'] == '</api/products?limit=20&cursor=abc>; rel="next"'
+    assert page_headers(None, '/api/products', {}) == {}
+
+
+def test_parse_ids_keeps_request_order_without_duplicates():
+    assert parse_ids('3, 1,3,2') == [3, 1, 2]
+    assert parse_ids([5, '4', 5]) == [5, 4]
+
+
+@pytest.mark.parametrize('value', [None, '', [], 'a,b', [1.5], [True], {'ids': 1}])
+def test_parse_ids_rejects_malformed_values(value):
+    with pytest.raises(PaginationError):
+        parse_ids(value)
+
+
+def test_parse_ids_caps_batch_size():
+    with pytest.raises(PaginationError):
+        parse_ids(list(range(5)), maximum=4)
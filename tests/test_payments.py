@@ -0,0 +1,129 @@
+import json
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import controllers.payment_controller as payment_controller
+import utils.payments as payments
+from app import app
+from utils.cache import MemoryCache
+
+PRICES = {1: Decimal('19.99'), 2: Decimal('5.00'), 3: Decimal('0.10')}
+
+
+class StripeStub(BaseHTTPRequestHandler):
+    """Just enough of the Stripe API to create PaymentIntents, deduped by idempotency key."""
+
+    def do_POST(self):
+        params = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        key = self.headers.get('Idempotency-Key')
+        self.server.requests.append((self.path, params, key))
+        intent = self.server.intents.get(key)
+        if intent is None:
+            number = len(self.server.intents) + 1
+            intent = {
+                'id': f'pi_{number}', 'object': 'payment_intent', 'client_secret': f'pi_{number}_secret',
+                'amount': int(params['amount'][0]), 'currency': params['currency'][0],
+            }
+            if key:
+                self.server.intents[key] = intent
+        body = json.dumps(intent).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stripe_stub(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StripeStub)
+    server.requests, server.intents = [], {}
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    client = payments.create_stripe_client('sk_test_stub', api_base=f'http://127.0.0.1:{server.server_port}',
+                                           max_retries=0)
+    monkeypatch.setattr(payments, '_client', client)
+    monkeypatch.setattr(payments, 'idempotency_cache', MemoryCache())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def price_queries(fake_connection, use_connection):
+    queries = []
+
+    def prices(query, params):
+        queries.append(params[0])
+        return [(product_id, PRICES[product_id]) for product_id in params[0] if product_id in PRICES]
+
+    use_connection(payment_controller, fake_connection(prices))
+    return queries
+
+
+def checkout(items, key=None, client='127.0.0.1', **extra):
+    headers = {'Idempotency-Key': key} if key else {}
+    return app.test_client().post('/api/create-payment-intent', json={'items': items, **extra}, headers=headers,
+                                  environ_base={'REMOTE_ADDR': client})
+
+
+def test_cart_is_priced_on_the_server(stripe_stub, price_queries):
+    response = checkout([{'product_id': 1, 'quantity': 2}, {'product_id': 3, 'quantity': 1},
+                         {'product_id': 1, 'quantity': 1}], amount=1)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'clientSecret': 'pi_1_secret', 'amount': 6007, 'currency': 'usd'}
+    assert price_queries == [[1, 3]]
+    path, params, _ = stripe_stub.requests[0]
+    assert path == '/v1/payment_intents'
+    assert params['amount'] == ['6007']
+
+
+def test_retries_with_the_same_key_reuse_the_intent(stripe_stub, price_queries):
+    first = checkout([{'product_id': 2, 'quantity': 1}], key='cart-abc')
+    second = checkout([{'product_id': 2, 'quantity': 1}], key='cart-abc')
+
+    assert first.get_json() == second.get_json()
+    assert len(stripe_stub.requests) == 1
+    assert stripe_stub.requests[0][2] == payments.scoped_key('127.0.0.1', 'cart-abc')
+    assert len(price_queries) == 1
+
+
+def test_a_key_reused_for_another_cart_is_rejected(stripe_stub, price_queries):
+    checkout([{'product_id': 2, 'quantity': 1}], key='cart-abc')
+    response = checkout([{'product_id': 2, 'quantity': 3}], key='cart-abc')
+
+    assert response.status_code == 422
+    assert len(stripe_stub.requests) == 1
+
+
+def test_the_same_key_from_another_client_gets_its_own_intent(stripe_stub, price_queries):
+    first = checkout([{'product_id': 2, 'quantity': 1}], key='cart-1', client='10.0.0.1')
+    second = checkout([{'product_id': 2, 'quantity': 1}], key='cart-1', client='10.0.0.2')
+
+    assert first.get_json()['clientSecret'] != second.get_json()['clientSecret']
+    keys = [key for _, _, key in stripe_stub.requests]
+    assert len(set(keys)) == 2
+    assert not any('cart-1' in key for key in keys)
+
+
+@pytest.mark.parametrize('items', [None, [], [{'product_id': '1'}], [{'product_id': 1, 'quantity': 0}],
+                                   [{'product_id': 1, 'quantity': 100}]])
+def test_malformed_carts_are_rejected(stripe_stub, price_queries, items):
+    assert checkout(items).status_code == 400
+    assert stripe_stub.requests == []
+
+
+def test_unknown_products_are_rejected(stripe_stub, price_queries):
+    response = checkout([{'product_id': 1}, {'product_id': 42}])
+
+    assert response.status_code == 400
+    assert '42' in response.get_json()['message']
+    assert stripe_stub.requests == []
@@ -0,0 +1,44 @@
+import pytest
+
+import controllers.product_controller as product_controller
+import utils.cache as cache
+from app import app
+from utils.cache import MemoryCache
+
+
+@pytest.fixture
+def database(monkeypatch, fake_connection, use_connection):
+    rows = [(product_id, f'Product {product_id}', 'Forged', 9.99, 1, None) for product_id in (1, 2, 3)]
+    conn = use_connection(product_controller, fake_connection(
+        lambda query, params: [row for row in rows if row[0] in params[0]]))
+    monkeypatch.setattr(product_controller, 'catalog_cache', MemoryCache())
+    monkeypatch.setattr(cache, 'catalog_cache', product_controller.catalog_cache)
+    return conn.executed
+
+
+def test_batch_keeps_request_order_and_reports_missing(database):
+    response = app.test_client().post('/api/products/batch', json={'ids': [3, 99, 1, 3]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [product['product_id'] for product in body['products']] == [3, 1]
+    assert body['missing'] == [99]
+    assert len(database) == 1
+    assert 'ANY(%s)' in database[0][0]
+
+
+def test_batch_served_from_cache_after_first_lookup(database):
+    client = app.test_client()
+    client.get('/api/products?ids=1,2')
+    response = client.get('/api/products?ids=2,1')
+
+    assert [product['product_id'] for product in response.get_json()['products']] == [2, 1]
+    assert len(database) == 1
+
+
+def test_batch_rejects_malformed_ids(database):
+    client = app.test_client()
+    assert client.post('/api/products/batch', json={'ids': 'x'}).status_code == 400
+    assert client.post('/api/products/batch', json=[1, 2]).status_code == 400
+    assert client.get('/api/products?ids=1,a').status_code == 400
+    assert database == []
@@ -0,0 +1,53 @@
+import pytest
+
+import controllers.product_controller as product_controller
+from app import app
+
+ROWS = [(1, 'Forged ring', 'Steel', 19.0, 1, None), (2, 'Ring stand', 'Oak', 9.5, 2, None)]
+FACETS = [(1, 4), (2, 1), (None, 2)]
+
+
+@pytest.fixture
+def database(fake_connection, use_connection):
+    conn = use_connection(product_controller, fake_connection(
+        lambda query, params: FACETS if 'GROUP BY categoryid' in query else ROWS))
+    return conn.executed
+
+
+def test_search_filters_and_counts_facets_without_the_category_filter(database):
+    response = app.test_client().get('/api/products/search?q=ring&min_price=5&category_id=1&limit=2&offset=4')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [product['product_id'] for product in body['results']] == [1, 2]
+    assert body['total'] == 4
+    assert body['facets'] == {'categories': [{'category_id': 1, 'count': 4}, {'category_id': 2, 'count': 1},
+                                             {'category_id': None, 'count': 2}]}
+
+    (results_query, params), (facets_query, _) = database
+    assert "websearch_to_tsquery('english', %(q)s) OR productname %% %(q)s" in results_query
+    assert 'price >= %(min_price)s' in results_query and 'price <= %(max_price)s' not in results_query
+    assert 'categoryid = %(category_id)s' in results_query
+    assert 'categoryid = %(category_id)s' not in facets_query
+    assert params == {'q': 'ring', 'min_price': 5.0, 'category_id': 1, 'limit': 2, 'offset': 4}
+
+
+def test_total_without_a_category_counts_every_facet(database):
+    body = app.test_client().get('/api/products/search').get_json()
+
+    assert body['total'] == 7
+    assert 'WHERE TRUE' in database[0][0]
+
+
+@pytest.mark.parametrize('query, message', [
+    ('category_id=rings', 'category_id must be an integer'),
+    ('offset=next', 'offset must be an integer'),
+    ('offset=-1', 'offset must not be negative'),
+    ('max_price=cheap', 'max_price must be a number'),
+])
+def test_malformed_parameters_are_rejected(database, query, message):
+    response = app.test_client().get(f'/api/products/search?{query}')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'message': message}
+    assert database == []
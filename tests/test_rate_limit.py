@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+import app as app_module
+import utils.db as db
+import utils.rate_limit as rate_limit
+from utils.db import PoolTimeout
+from utils.rate_limit import overload_reason
+
+IDLE_POOL = {'waiting': 0, 'in_use': 0, 'max_size': 20, 'wait_time_recent': 0.0}
+IDLE_HASHER = {'in_flight': 0, 'queue_size': 4}
+
+
+def client():
+    http = app_module.app.test_client()  # Builds the app, which sets up the limiter's storage
+    app_module.limiter.reset()
+    return http
+
+
+def test_signups_are_limited_per_client(monkeypatch):
+    monkeypatch.setattr(app_module, 'create_user', lambda: ({'message': 'User created'}, 201))
+    http = client()
+    limit = int(rate_limit.RATE_LIMIT_SIGNUP.split('/')[0])
+
+    statuses = [http.post('/api/users', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code
+                for _ in range(limit + 1)]
+    assert statuses[:-1] == [201] * limit
+    assert statuses[-1] == 429
+
+    limited = http.post('/api/users', environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert limited.get_json()['message'].startswith('Too many requests')
+    assert 'Retry-After' in limited.headers
+    assert http.post('/api/users', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 201
+
+
+def test_export_limit_only_counts_streamed_dumps(monkeypatch):
+    monkeypatch.setattr(app_module, 'get_users', lambda: ({'users': []}, 200))
+    http = client()
+    limit = int(rate_limit.RATE_LIMIT_EXPORT.split('/')[0])
+
+    for _ in range(limit + 5):
+        assert http.get('/api/users').status_code == 200
+    statuses = [http.get('/api/users?stream=1').status_code for _ in range(limit + 1)]
+    assert statuses[-1] == 429
+    assert 0 < int(http.get('/api/users?stream=1').headers['Retry-After']) <= 3600
+
+
+def test_no_shedding_when_idle():
+    assert overload_reason('api.list_products', IDLE_POOL, IDLE_HASHER) is None
+
+
+def test_pool_pressure_sheds_database_routes_only():
+    busy = dict(IDLE_POOL, waiting=rate_limit.SHED_POOL_WAITERS)
+    assert overload_reason('api.list_products', busy, IDLE_HASHER) == 'pool'
+    assert overload_reason('api.serve_image', busy, IDLE_HASHER) is None
+    slow = dict(IDLE_POOL, in_use=20, wait_time_recent=rate_limit.SHED_POOL_WAIT + 1)
+    assert overload_reason('api.user_details', slow, IDLE_HASHER) == 'pool'
+
+
+def test_slow_history_alone_does_not_shed_an_idle_pool():
+    slow_but_idle = dict(IDLE_POOL, wait_time_recent=rate_limit.SHED_POOL_WAIT + 1)
+    assert overload_reason('api.user_details', slow_but_idle, IDLE_HASHER) is None
+
+
+def test_shedding_stops_once_the_pool_goes_idle(monkeypatch, make_pool):
+    pool, _ = make_pool(maxconn=1, timeout=0.05)
+    held = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    monkeypatch.setattr(rate_limit, 'SHED_POOL_WAIT', 0.001)
+    assert overload_reason('api.user_details', pool.stats(), IDLE_HASHER) == 'pool'
+
+    # Nothing checks out a connection while requests are shed
+    pool.putconn(held)
+    assert overload_reason('api.user_details', pool.stats(), IDLE_HASHER) is None
+    now = time.monotonic()
+    monkeypatch.setattr(db.time, 'monotonic', lambda: now + 10 * db.WAIT_HALF_LIFE)
+    assert pool.stats()['wait_time_recent'] < rate_limit.SHED_POOL_WAIT
+
+
+def test_full_hashing_queue_sheds_signups():
+    full = {'in_flight': 4, 'queue_size': 4}
+    assert overload_reason('api.user_creation', IDLE_POOL, full) == 'hashing'
+    assert overload_reason('api.list_users', IDLE_POOL, full) is None
+
+
+def test_shed_requests_get_503_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'overload_reason', lambda *args: 'pool')
+    response = client().get('/api/products/1')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(rate_limit.SHED_RETRY_AFTER)
+    assert rate_limit.shedding_stats()['pool'] >= 1
+
+
+def test_routes_without_database_work_when_it_is_not_configured(monkeypatch):
+    monkeypatch.setattr(db, '_pool', None)
+    monkeypatch.setattr(db, 'DATABASE_URL', '')
+    http = client()
+    assert http.get('/metrics').status_code == 200
+    assert http.get('/images/missing.png').status_code == 404
+    assert http.get('/no/such/route').status_code == 404
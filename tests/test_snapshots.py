@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+import pytest
+
+import controllers.product_controller as product_controller
+import utils.cache as cache
+import utils.snapshots as snapshots
+from app import app
+from utils.cache import MemoryCache
+from utils.pagination import decode_cursor
+
+
+def product(product_id, category_id):
+    return {'product_id': product_id, 'productname': f'Product {product_id}', 'description': 'Forged',
+            'price': 9.99, 'category_id': category_id, 'image_url': None}
+
+
+@pytest.fixture
+def snapshot_dir(monkeypatch, tmp_path):
+    categories = [{'category_id': 1, 'category_name': 'Guitars'}, {'category_id': 2, 'category_name': 'Drums'}]
+    products = [product(product_id, 1 if product_id % 3 else 2) for product_id in range(1, 121)]
+    monkeypatch.setattr(snapshots, 'read_catalog', lambda: (categories, products))
+    monkeypatch.setattr(snapshots, 'CATALOG_SNAPSHOTS', 'disk')
+    monkeypatch.setattr(snapshots, 'CATALOG_SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(product_controller, 'catalog_cache', MemoryCache())
+    monkeypatch.setattr(cache, 'catalog_cache', product_controller.catalog_cache)
+
+    def no_database(*args, **kwargs):
+        raise AssertionError('snapshot reads must not query the database')
+
+    monkeypatch.setattr(product_controller, 'fetch_product_page', no_database)
+    return tmp_path
+
+
+def test_snapshot_file_covers_default_pages_and_streams():
+    assert snapshots.snapshot_file('products', {}) == 'products/0.json'
+    assert snapshots.snapshot_file('products', {'limit': '50', 'cursor': 'NTA'}) == 'products/50.json'
+    assert snapshots.snapshot_file('products', {'stream': '1'}) == 'products/all.json'
+    assert snapshots.snapshot_file('products', {'limit': '10'}) is None
+    assert snapshots.snapshot_file('products', {'fields': 'product_id'}) is None
+    assert snapshots.snapshot_file('products', {'stream': '1', 'fields': 'price'}) is None
+
+
+def test_pages_served_from_disk_with_cursor_headers(snapshot_dir):
+    snapshots.generate_snapshot()
+    client = app.test_client()
+
+    first = client.get('/api/products')
+    assert first.status_code == 200
+    assert [p['product_id'] for p in first.get_json()] == list(range(1, 51))
+    cursor = first.headers['X-Next-Cursor']
+    assert decode_cursor(cursor) == 50
+
+    last = client.get(f'/api/products?cursor={client.get(f"/api/products?cursor={cursor}").headers["X-Next-Cursor"]}')
+    assert [p['product_id'] for p in last.get_json()] == list(range(101, 121))
+    assert 'X-Next-Cursor' not in last.headers
+
+    category = client.get('/api/products/category/2').get_json()
+    assert [p['product_id'] for p in category] == list(range(3, 121, 3))
+    assert client.get('/api/categories').get_json()['categories'][1]['category_name'] == 'Drums'
+    assert len(client.get('/api/products?stream=1').get_json()) == 120
+
+
+def test_mmap_mode_serves_precompressed_copy(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(snapshots, 'CATALOG_SNAPSHOTS', 'mmap')
+    snapshots.generate_snapshot()
+    client = app.test_client()
+
+    plain = client.get('/api/products', headers={'Accept-Encoding': 'identity'})
+    encoded = client.get('/api/products', headers={'Accept-Encoding': 'gzip'})
+    assert encoded.headers['Content-Encoding'] == 'gzip'
+    assert encoded.headers['ETag'] == 'W/' + plain.headers['ETag']
+    assert encoded.headers['X-Next-Cursor'] == plain.headers['X-Next-Cursor']
+
+
+def test_mmap_mode_streams_the_mapping_in_chunks(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(snapshots, 'CATALOG_SNAPSHOTS', 'mmap')
+    monkeypatch.setattr(snapshots, 'MAPPED_CHUNK_SIZE', 1024)
+    generation = snapshots.generate_snapshot()
+    client = app.test_client()
+
+    response = client.get('/api/products?stream=1', headers={'Accept-Encoding': 'identity'}, buffered=False)
+    chunks = list(response.response)
+    with open(snapshot_dir / generation / 'products' / 'all.json', 'rb') as f:
+        assert b''.join(chunks) == f.read()
+    assert len(chunks) > 1 and max(map(len, chunks)) == 1024
+    assert response.headers['Content-Length'] == str(sum(map(len, chunks)))
+
+
+def test_etag_changes_with_each_generation(snapshot_dir):
+    snapshots.generate_snapshot()
+    client = app.test_client()
+    etag = client.get('/api/categories').headers['ETag']
+
+    assert client.get('/api/categories', headers={'If-None-Match': etag}).status_code == 304
+    snapshots.generate_snapshot()
+    response = client.get('/api/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_uncovered_requests_fall_back_to_the_database(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(product_controller, 'fetch_product_page', lambda *args, **kwargs: ([], None))
+    client = app.test_client()
+
+    # No snapshot yet
+    assert client.get('/api/products').status_code == 404
+    snapshots.generate_snapshot()
+    assert client.get('/api/products?limit=10').status_code == 404
+    assert client.get('/api/products/category/99').status_code == 404
+    assert client.get('/api/products').status_code == 200
+
+
+def test_generations_are_swapped_atomically_and_pruned(snapshot_dir):
+    generations = [snapshots.generate_snapshot() for _ in range(4)]
+
+    assert os.readlink(snapshot_dir / snapshots.CURRENT) == generations[-1]
+    assert sorted(name for name in os.listdir(snapshot_dir)
+                  if name not in (snapshots.CURRENT, snapshots.LOCK)) == sorted(generations[-2:])
+    assert (snapshot_dir / generations[-1] / 'products' / '0.json.gz').exists()
+
+
+def test_concurrent_refreshes_publish_the_newest_read(snapshot_dir, monkeypatch):
+    reads = []
+
+    def read_catalog():
+        reads.append(len(reads) + 1)
+        version = reads[-1]
+        if version == 1:
+            time.sleep(0.2)  # The first refresh reads slowly and would publish last
+        return [{'category_id': 1, 'category_name': f'v{version}'}], []
+
+    monkeypatch.setattr(snapshots, 'read_catalog', read_catalog)
+    first = threading.Thread(target=snapshots.generate_snapshot)
+    first.start()
+    time.sleep(0.05)
+    snapshots.generate_snapshot()
+    first.join()
+
+    response = app.test_client().get('/api/categories')
+    assert response.get_json()['categories'][0]['category_name'] == 'v2'
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import app as app_module
+import utils.warmup as warmup
+
+
+def test_app_imports_without_database_or_heavy_modules():
+    # WARM_UP is for the server entry points: importing or building the app ignores it
+    code = ("import sys, app; app.app; "
+            "print(sorted(m for m in ('stripe', 'requests', 'PIL.Image') if m in sys.modules))")
+    env = dict(os.environ, DATABASE_URL='', WARM_UP='1')
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == '[]'
+
+
+def test_create_app_reports_startup_times(monkeypatch):
+    monkeypatch.setattr(app_module, 'warm_up', lambda: 0.25)
+
+    app_module.create_app(warm=True)
+
+    times = app_module.startup_times
+    assert times['warm_up_seconds'] == 0.25
+    assert times['total_seconds'] >= times['import_seconds'] + times['warm_up_seconds']
+    assert b'startup_total_seconds' in app_module.app.test_client().get('/metrics').data
+
+
+def test_failed_warm_up_steps_do_not_stop_the_rest(monkeypatch):
+    calls = []
+
+    class Pool:
+        def prefill(self, count):
+            calls.append(('prefill', count))
+            raise OSError('database is down')
+
+    def warm_catalog():
+        calls.append(('catalog',))
+
+    monkeypatch.setattr(warmup, 'get_pool', lambda: Pool())
+    monkeypatch.setattr(warmup, 'warm_catalog', warm_catalog)
+    monkeypatch.setattr(warmup, 'import_lazy_modules', lambda: calls.append(('imports',)))
+
+    assert warmup.warm_up(connections=3) >= 0
+    assert calls == [('prefill', 3), ('catalog',), ('imports',)]
@@ -0,0 +1,31 @@
+import json
+from flask import Flask
+import utils.streaming as streaming
+
+
+def test_rows_are_streamed_in_batches(fake_connection, use_connection):
+    conn = use_connection(streaming, fake_connection(lambda query, params: [(i, f'user{i}') for i in range(5)]))
+    app = Flask(__name__)
+
+    with app.test_request_context():
+        response = streaming.stream_rows(
+            'SELECT ...', (), lambda row: {'id': row[0], 'name': row[1]},
+            prefix='{"users": [', suffix=']}', batch_size=2,
+        )
+        chunks = list(response.response)
+
+    body = json.loads(''.join(chunks))
+    assert [user['id'] for user in body['users']] == [0, 1, 2, 3, 4]
+    cursor = conn.cursors[-1]
+    assert cursor.name, 'streaming must use a server-side cursor'
+    assert cursor.itersize == 2
+    assert cursor.fetches == 4  # three batches plus the empty fetch that ends the stream
+
+
+def test_empty_result_is_an_empty_array(fake_connection, use_connection):
+    use_connection(streaming, fake_connection())
+    app = Flask(__name__)
+
+    with app.test_request_context():
+        response = streaming.stream_rows('SELECT ...', (), lambda row: row)
+        assert json.loads(''.join(response.response)) == []
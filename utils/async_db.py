@@ -0,0 +1,250 @@
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from utils.db import (
+    DATABASE_REPLICA_URLS,
+    DATABASE_URL,
+    DB_REPLICA_LAG_CHECK_INTERVAL,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_POOL_TIMEOUT,
+    DB_REPLICA_RETRY_AFTER,
+    WAIT_HALF_LIFE,
+    WAIT_SMOOTHING,
+    ReplicaSet,
+)
+from utils.metrics import observe_pool_wait, observe_query
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DB_POOL_MIN = int(os.getenv('ASYNC_DB_POOL_MIN', 1))
+ASYNC_DB_POOL_MAX = int(os.getenv('ASYNC_DB_POOL_MAX', 50))
+# Seconds a query waits for a pooled connection before failing
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv('ASYNC_DB_POOL_TIMEOUT', 10))
+
+_pool = None
+_replicas = None
+_pool_lock = None
+# Read path load, for load shedding: borrowed connections, coroutines
+# waiting for one, and a decaying average of recent checkout waits
+_in_use = 0
+_waiting = 0
+_wait_recent = 0.0
+_wait_recent_at = time.monotonic()
+
+# Query count, DB time and pool wait of the request being handled, for its metrics
+request_stats = ContextVar('request_stats', default=None)
+
+_PLACEHOLDER = re.compile(r'%%|%s')
+
+
+def to_asyncpg(query):
+    """Rewrite a psycopg2-style query (``%s``, ``%%``) to asyncpg's ``$n`` placeholders."""
+    counter = iter(range(1, 1_000_000))
+
+    def replace(match):
+        return '%' if match.group() == '%%' else f'${next(counter)}'
+    return _PLACEHOLDER.sub(replace, query)
+
+
+class AsyncReplicaSet:
+    """ReplicaSet for asyncpg: the same round-robin, lag check and retry-after."""
+
+    def __init__(self, pools, max_lag=2.0, lag_check_interval=5.0, retry_after=30.0):
+        self.pools = list(pools)
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self._next = itertools.count()
+        self._down_until = [0.0] * len(self.pools)
+        self._lag = [None] * len(self.pools)  # (measured_at, seconds)
+        self._reads = [0] * len(self.pools)
+        self._fallbacks = 0
+
+    async def acquire(self):
+        """Return ``(pool, connection)`` from a usable replica, or ``(None, None)``."""
+        import asyncpg
+
+        start = next(self._next)
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            if self._down_until[index] > time.monotonic():
+                continue
+            replica = self.pools[index]
+            try:
+                conn = await replica.acquire(timeout=DB_REPLICA_POOL_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue  # Busy rather than broken; try the next one
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                logger.warning("Replica %d is unreachable, skipping it for %.0fs", index, self.retry_after)
+                self._down_until[index] = time.monotonic() + self.retry_after
+                continue
+            try:
+                lagging = await self._lagging(index, conn)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                await replica.release(conn)
+                self._down_until[index] = time.monotonic() + self.retry_after
+                continue
+            if lagging:
+                await replica.release(conn)
+                continue
+            self._reads[index] += 1
+            return replica, conn
+        self._fallbacks += 1
+        return None, None
+
+    def stats(self):
+        replicas = []
+        for index, replica in enumerate(self.pools):
+            lag = self._lag[index]
+            replicas.append({
+                'healthy': self._down_until[index] <= time.monotonic(),
+                'lag': lag[1] if lag else None,
+                'reads': self._reads[index],
+                'size': replica.get_size(),
+                'idle': replica.get_idle_size(),
+                'max_size': replica.get_max_size(),
+            })
+        return {'replicas': replicas, 'primary_fallbacks': self._fallbacks}
+
+    async def close(self):
+        for replica in self.pools:
+            await replica.close()
+
+    async def _lagging(self, index, conn):
+        measured = self._lag[index]
+        now = time.monotonic()
+        if measured is None or now - measured[0] >= self.lag_check_interval:
+            lag = float(await conn.fetchval(ReplicaSet.LAG_QUERY))
+            measured = self._lag[index] = (now, lag)
+            if lag > self.max_lag:
+                logger.warning("Replica %d is %.1fs behind the primary", index, lag)
+        return measured[1] > self.max_lag
+
+
+def _create_pool(url, **kwargs):
+    import asyncpg
+
+    return asyncpg.create_pool(
+        url,
+        max_size=ASYNC_DB_POOL_MAX,
+        # The Supabase pooler runs pgbouncer in transaction mode, which
+        # cannot keep server-side prepared statements between queries
+        statement_cache_size=0,
+        **kwargs,
+    )
+
+
+async def get_async_pool():
+    """The asyncpg pool for the running event loop, created on first use."""
+    global _pool, _replicas, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                if DATABASE_REPLICA_URLS:
+                    # Replicas connect lazily, so one that is down is only skipped
+                    _replicas = AsyncReplicaSet(
+                        [await _create_pool(url, min_size=0) for url in DATABASE_REPLICA_URLS],
+                        max_lag=DB_REPLICA_MAX_LAG,
+                        lag_check_interval=DB_REPLICA_LAG_CHECK_INTERVAL,
+                        retry_after=DB_REPLICA_RETRY_AFTER,
+                    )
+                _pool = await _create_pool(DATABASE_URL, min_size=ASYNC_DB_POOL_MIN)
+    return _pool
+
+
+@asynccontextmanager
+async def read_connection(primary=False):
+    """A connection for a read: a current replica when one is configured, else the primary.
+
+    ``primary=True`` skips the replicas, for reads whose result outlives their lag.
+    """
+    global _in_use, _waiting
+    started = time.perf_counter()
+    pool = await get_async_pool()
+    source, conn = None, None
+    _waiting += 1
+    try:
+        if _replicas is not None and not primary:
+            source, conn = await _replicas.acquire()
+        if conn is None:
+            source, conn = pool, await pool.acquire(timeout=ASYNC_DB_POOL_TIMEOUT)
+    finally:
+        _waiting -= 1
+        waited = time.perf_counter() - started
+        _record_wait(waited)
+    _in_use += 1
+    observe_pool_wait(waited)
+    stats = request_stats.get()
+    if stats is not None:
+        stats['pool_wait'] += waited
+    try:
+        yield conn
+    finally:
+        _in_use -= 1
+        await source.release(conn)
+
+
+def _recent_wait(now=None):
+    now = time.monotonic() if now is None else now
+    return _wait_recent * 0.5 ** ((now - _wait_recent_at) / WAIT_HALF_LIFE)
+
+
+def _record_wait(waited):
+    # Same moving average as ManagedConnectionPool, so one shedding rule fits both
+    global _wait_recent, _wait_recent_at
+    now = time.monotonic()
+    recent = _recent_wait(now)
+    _wait_recent = recent + WAIT_SMOOTHING * (waited - recent)
+    _wait_recent_at = now
+
+
+async def _run(method, query, params, primary=False):
+    async with read_connection(primary) as conn:
+        started = time.perf_counter()
+        try:
+            return await getattr(conn, method)(to_asyncpg(query), *params)
+        finally:
+            seconds = time.perf_counter() - started
+            observe_query(query, seconds)
+            stats = request_stats.get()
+            if stats is not None:
+                stats['queries'] += 1
+                stats['db_time'] += seconds
+
+
+async def fetch(query, params=(), primary=False):
+    return await _run('fetch', query, params, primary)
+
+
+async def fetchrow(query, params=(), primary=False):
+    return await _run('fetchrow', query, params, primary)
+
+
+async def close_async_pool():
+    global _pool, _replicas
+    pool, _pool = _pool, None
+    replicas, _replicas = _replicas, None
+    if pool is not None:
+        await pool.close()
+    if replicas is not None:
+        await replicas.close()
+
+
+def async_pool_stats():
+    """Async read path stats; ``in_use``, ``waiting`` and ``max_size`` include the replicas."""
+    load = {'in_use': _in_use, 'waiting': _waiting, 'wait_time_recent': _recent_wait()}
+    if _pool is None:
+        return {'size': 0, 'idle': 0, 'max_size': ASYNC_DB_POOL_MAX, **load}
+    stats = {'size': _pool.get_size(), 'idle': _pool.get_idle_size(), 'max_size': _pool.get_max_size(), **load}
+    if _replicas is not None:
+        stats.update(_replicas.stats())
+        stats['max_size'] += sum(replica.get_max_size() for replica in _replicas.pools)
+    return stats
@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# 'memory' keeps a cache per worker process; 'redis' shares one across workers
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 1024))
+# Seconds a cached catalog entry is served before it is reloaded
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 300))
+
+MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds.
+
+    All cache backends share this interface: ``get``, ``get_many``, ``set``,
+    ``set_many``, ``delete``, ``delete_prefix``, ``clear`` and ``stats``.
+    """
+
+    shared = False  # Entries are private to this worker process
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        """Return ``{key: value}`` for the keys that are cached."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not MISSING:
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'memory',
+                'size': len(self._data),
+                'max_size': self.maxsize,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions,
+            }
+
+
+class RedisCache:
+    """Cache stored in Redis (or anything speaking its protocol).
+
+    Every worker reads and writes the same keys, so an entry loaded by one
+    worker is a hit for all of them and an invalidation issued by any worker
+    is seen by every other one. Values are stored as JSON under
+    ``namespace``. Redis errors are logged and treated as misses so an
+    unavailable cache never takes catalog reads down with it.
+    """
+
+    shared = True
+
+    def __init__(self, client, ttl=300.0, namespace='catalog:'):
+        import redis
+
+        self.client = client
+        self.ttl = ttl
+        self.namespace = namespace
+        self._errors = (redis.RedisError, OSError)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+
+    def get(self, key, default=MISSING):
+        try:
+            raw = self.client.get(self.namespace + key)
+        except self._errors:
+            logger.exception("Cache read failed for %s", key)
+            raw = None
+            self._count('_failures')
+        if raw is None:
+            self._count('_misses')
+            return default
+        self._count('_hits')
+        return json.loads(raw)
+
+    def get_many(self, keys):
+        """Return ``{key: value}`` for the keys that are cached, in one round trip."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            raws = self.client.mget([self.namespace + key for key in keys])
+        except self._errors:
+            logger.exception("Cache read failed for %d keys", len(keys))
+            raws = [None] * len(keys)
+            self._count('_failures')
+        found = {key: json.loads(raw) for key, raw in zip(keys, raws) if raw is not None}
+        with self._lock:
+            self._hits += len(found)
+            self._misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value, ttl=None):
+        expire_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        try:
+            self.client.set(self.namespace + key, json.dumps(value), px=expire_ms)
+        except self._errors:
+            logger.exception("Cache write failed for %s", key)
+            self._count('_failures')
+
+    def set_many(self, mapping, ttl=None):
+        if not mapping:
+            return
+        expire_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipeline.set(self.namespace + key, json.dumps(value), px=expire_ms)
+            pipeline.execute()
+        except self._errors:
+            logger.exception("Cache write failed for %d keys", len(mapping))
+            self._count('_failures')
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self.client.delete(*[self.namespace + key for key in keys])
+        except self._errors:
+            logger.exception("Cache invalidation failed for %s", keys)
+            self._count('_failures')
+
+    def delete_prefix(self, prefix):
+        pattern = self.namespace + re.sub(r'([*?\[\]\\])', r'\\\1', prefix) + '*'
+        try:
+            batch = []
+            for key in self.client.scan_iter(match=pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    self.client.delete(*batch)
+                    batch = []
+            if batch:
+                self.client.delete(*batch)
+        except self._errors:
+            logger.exception("Cache invalidation failed for prefix %s", prefix)
+            self._count('_failures')
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def stats(self):
+        # Counters are per worker; sum them across workers for the cluster-wide rate.
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'backend': 'redis',
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'failures': self._failures,
+            }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def create_cache(backend=CACHE_BACKEND, maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL,
+                 redis_url=CACHE_REDIS_URL):
+    if backend == 'memory':
+        return MemoryCache(maxsize=maxsize, ttl=ttl)
+    if backend == 'redis':
+        import redis
+        from redis.backoff import NoBackoff
+        from redis.retry import Retry
+
+        # Fail fast: a slow cache is worse than going straight to Postgres
+        client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5,
+                                      retry=Retry(NoBackoff(), 0))
+        return RedisCache(client, ttl=ttl)
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend!r}")
+
+
+def get_or_load(cache, key, loader):
+    """Read-through lookup: return the cached value or store ``loader()``.
+
+    ``loader`` may return None to signal "nothing to cache" (e.g. a 404);
+    that result is passed through without being stored.
+    """
+    value = cache.get(key)
+    if value is MISSING:
+        value = loader()
+        if value is not None:
+            cache.set(key, value)
+    return value
+
+
+def get_many_or_load(cache, keys, loader):
+    """Batch read-through: one cache lookup, then ``loader(missing_keys)`` for the rest.
+
+    ``loader`` returns ``{key: value}`` for the keys it could load; keys it
+    leaves out are simply absent from the result and are not cached.
+    """
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        loaded = loader(missing)
+        cache.set_many(loaded)
+        found.update(loaded)
+    return found
+
+
+catalog_cache = create_cache()
+
+
+def invalidate_product(product_id, category_id=None):
+    """Drop cache entries a product write can change."""
+    catalog_cache.delete(f'product:{product_id}')
+    catalog_cache.delete_prefix('products:list:')
+    if category_id is not None:
+        catalog_cache.delete_prefix(f'products:category:{category_id}:')
+    # Last, so a reader never pairs the new token with a stale cached page
+    bump_catalog_version()
+
+
+def catalog_version():
+    """Token identifying the current catalog state, plus when it last changed.
+
+    A new random token is minted on every write and whenever the previous
+    one expires with the rest of the cache, so validators derived from it
+    never outlive the cached data they describe. With the memory backend
+    the token lives in each process's cache, so workers hand out different
+    tokens and only a shared backend (Redis) gives one per catalog state.
+    """
+    version = catalog_cache.get('version')
+    if version is MISSING:
+        version = bump_catalog_version()
+    return version
+
+
+def bump_catalog_version():
+    version = {'token': uuid.uuid4().hex, 'modified': int(time.time())}
+    catalog_cache.set('version', version)
+    return version
@@ -0,0 +1,136 @@
+import gzip
+import mimetypes
+import os
+
+from flask import request, send_from_directory
+from werkzeug.http import parse_accept_header
+
+from utils.cache import MISSING, MemoryCache
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this are sent as-is; compression would not pay off
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+# Levels for responses compressed per request: fast rather than smallest
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+COMPRESSED_CACHE_SIZE = int(os.getenv('COMPRESSED_CACHE_SIZE', 512))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript',
+                          'application/javascript', 'image/svg+xml'}
+
+# Precompressed siblings written by `flask precompress`, best first
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# (ETag, encoding) -> compressed body. The catalog ETag changes with every
+# catalog write, so entries never go stale; they just stop being asked for.
+compressed_cache = MemoryCache(maxsize=COMPRESSED_CACHE_SIZE, ttl=3600)
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_encoding(accept_encoding):
+    """Best encoding the ``Accept-Encoding`` header allows, or None for identity."""
+    accepted = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accepted.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+
+def weak_etag(etag):
+    # A compressed body is a different representation, so it may not share a
+    # strong ETag with the identity one. Clients echo the weak tag back in
+    # If-None-Match, which is compared weakly, so 304s keep working.
+    return etag if etag is None or etag.startswith('W/') else f'W/{etag}'
+
+
+def compressed_body(body, encoding, etag=None):
+    """Compress ``body``, reusing an earlier result for the same ETag."""
+    if etag is None:
+        return compress(body, encoding)
+    key = f'{etag}:{encoding}'
+    cached = compressed_cache.get(key)
+    if cached is MISSING:
+        cached = compress(body, encoding)
+        compressed_cache.set(key, cached)
+    return cached
+
+
+def compress_response(response):
+    """``after_request`` hook: compress JSON and text bodies the client can decode."""
+    if response.direct_passthrough or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    etag = response.headers.get('ETag')
+    response.set_data(compressed_body(body, encoding, etag))
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        response.headers['ETag'] = weak_etag(etag)
+    return response
+
+
+def send_static(static_folder, filename, max_age=None):
+    """Serve a static file, preferring a precompressed ``.br``/``.gz`` copy."""
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    path = os.path.join(static_folder, filename)
+    for name, suffix in STATIC_ENCODINGS:
+        if name != encoding or not os.path.isfile(path + suffix):
+            continue
+        if os.path.getmtime(path + suffix) < os.path.getmtime(path):
+            break  # Stale copy; the original changed after `flask precompress`
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype, max_age=max_age)
+        response.headers['Content-Encoding'] = name
+        response.vary.add('Accept-Encoding')
+        return response
+    response = send_from_directory(static_folder, filename, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def precompress_directory(directory):
+    """Write maximum-effort ``.gz`` (and ``.br``) copies of compressible files.
+
+    Returns the paths written. Run at build/deploy time; the copies are
+    served straight from disk by ``send_static``.
+    """
+    written = []
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if filename.endswith(tuple(suffix for _, suffix in STATIC_ENCODINGS)):
+                continue
+            if mimetypes.guess_type(filename)[0] not in COMPRESSIBLE_MIMETYPES:
+                continue
+            path = os.path.join(root, filename)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for encoding, suffix in STATIC_ENCODINGS:
+                if encoding not in available_encodings():
+                    continue
+                level = 11 if encoding == 'br' else 9
+                with open(path + suffix, 'wb') as f:
+                    f.write(compress(data, encoding, level))
+                written.append(path + suffix)
+    return written
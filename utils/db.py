@@ -1,13 +1,435 @@
-import os
-from psycopg2 import pool
-from dotenv import load_dotenv
-
-load_dotenv()
-DATABASE_URL = os.getenv('DATABASE_URL')
-
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL is not set in the environment variables.")
-
-
-connection_pool = pool.SimpleConnectionPool(1, 20, dsn=DATABASE_URL)
-
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import psycopg2
+from psycopg2 import extensions, pool
+from dotenv import load_dotenv
+from flask import g, has_request_context
+
+from utils.metrics import TimedCursor, observe_pool_wait
+
+load_dotenv()
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 20))
+# Seconds a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+# Idle connections above DB_POOL_MIN are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv('DB_POOL_HEALTHCHECK_AFTER', 30))
+
+# Comma-separated DSNs of streaming replicas that serve read-only queries
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+# Replicas further behind the primary than this many seconds are skipped
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 2))
+# How often each replica's lag is re-measured
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', 5))
+# A replica that failed to connect is left out for this many seconds
+DB_REPLICA_RETRY_AFTER = float(os.getenv('DB_REPLICA_RETRY_AFTER', 30))
+# Short checkout timeout so a saturated replica falls back to the primary quickly
+DB_REPLICA_POOL_TIMEOUT = float(os.getenv('DB_REPLICA_POOL_TIMEOUT', 1))
+
+logger = logging.getLogger(__name__)
+
+
+# Connections report query timings to utils.metrics through their cursors
+connect_timed = partial(psycopg2.connect, cursor_factory=TimedCursor)
+
+# Weight of the newest checkout in the pool's recent-wait moving average
+WAIT_SMOOTHING = 0.2
+# Seconds over which the recent-wait average halves when nothing updates it,
+# so it drops back once load does even if no request checks out a connection
+WAIT_HALF_LIFE = 5.0
+
+
+class PoolTimeout(pool.PoolError):
+    """Raised when no connection became free within the checkout timeout."""
+
+
+class ManagedConnectionPool:
+    """Thread-safe psycopg2 connection pool.
+
+    Connections are opened lazily up to ``maxconn``. Callers that find the pool
+    exhausted wait up to ``timeout`` seconds for a connection to be returned.
+    Connections that sat idle are pinged before reuse, and idle connections
+    above ``minconn`` are closed once they exceed ``max_idle`` seconds.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=20, timeout=10.0, max_idle=300.0,
+                 healthcheck_after=30.0, connect=psycopg2.connect):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: minconn=%s maxconn=%s" % (minconn, maxconn))
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.healthcheck_after = healthcheck_after
+        self._connect = connect
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at), most recently returned last
+        self._in_use = set()
+        self._size = 0  # open connections, idle + in use + being opened
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_recent = 0.0  # moving average, so it falls again once load drops
+        self._wait_recent_at = time.monotonic()
+        self._timeouts = 0
+        self._discarded = 0
+        self._reaped = 0
+
+    def getconn(self):
+        """Check a healthy connection out of the pool."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            conn, idle_since = self._acquire(deadline)
+            if conn is None:
+                try:
+                    conn = self._connect(self.dsn)
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use.add(conn)
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                self._record_wait(waited)
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection to the pool, closing it if it is unusable."""
+        with self._cond:
+            self._in_use.discard(conn)
+
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._reap_idle()
+            self._cond.notify()
+
+    def prefill(self, count=None):
+        """Open idle connections until ``count`` (default ``minconn``) are open. Returns how many were opened."""
+        count = self.minconn if count is None else min(count, self.maxconn)
+        opened = 0
+        while True:
+            with self._cond:
+                if self._closed or self._size >= count:
+                    return opened
+                self._size += 1
+            try:
+                conn = self._connect(self.dsn)
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            opened += 1
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Snapshot of pool size, usage and checkout wait times (seconds)."""
+        with self._cond:
+            return {
+                'size': self._size,
+                'max_size': self.maxconn,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'wait_time_total': self._wait_total,
+                'wait_time_avg': self._wait_total / self._checkouts if self._checkouts else 0.0,
+                'wait_time_max': self._wait_max,
+                'wait_time_recent': self._recent_wait(),
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'idle_closed': self._reaped,
+            }
+
+    def _acquire(self, deadline):
+        # Returns (idle connection, idle since) or (None, None) when the caller
+        # has reserved a slot and should open a new connection itself.
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pool.PoolError("connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.maxconn:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._record_wait(self.timeout)
+                    raise PoolTimeout(
+                        "no connection available within %.1fs (max %d)" % (self.timeout, self.maxconn))
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _recent_wait(self, now=None):
+        # Caller holds self._cond
+        now = time.monotonic() if now is None else now
+        return self._wait_recent * 0.5 ** ((now - self._wait_recent_at) / WAIT_HALF_LIFE)
+
+    def _record_wait(self, waited):
+        # Caller holds self._cond
+        now = time.monotonic()
+        recent = self._recent_wait(now)
+        self._wait_recent = recent + WAIT_SMOOTHING * (waited - recent)
+        self._wait_recent_at = now
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _reap_idle(self):
+        # Caller holds self._cond. Oldest idle connections sit at the front.
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._reaped += 1
+            self._close_quietly(conn)
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._discarded += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class ReplicaSet:
+    """Round-robin over replica pools, skipping replicas that are down or lagging."""
+
+    # Zero when everything received has been replayed, so an idle primary
+    # does not make its replicas look stale.
+    LAG_QUERY = """
+        SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END;
+    """
+
+    def __init__(self, pools, max_lag=2.0, lag_check_interval=5.0, retry_after=30.0):
+        self.pools = list(pools)
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_after = retry_after
+        self._next = itertools.count()
+        self._down_until = [0.0] * len(self.pools)
+        self._lag = [None] * len(self.pools)  # (measured_at, seconds)
+        self._reads = [0] * len(self.pools)
+        self._fallbacks = 0
+
+    def getconn(self):
+        """Return ``(pool, connection)`` from a usable replica, or ``(None, None)``."""
+        start = next(self._next)
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            if self._down_until[index] > time.monotonic():
+                continue
+            replica = self.pools[index]
+            try:
+                conn = replica.getconn()
+            except PoolTimeout:
+                continue  # Busy rather than broken; try the next one
+            except (psycopg2.Error, pool.PoolError):
+                logger.warning("Replica %d is unreachable, skipping it for %.0fs", index, self.retry_after)
+                self._down_until[index] = time.monotonic() + self.retry_after
+                continue
+            try:
+                lagging = self._lagging(index, conn)
+            except psycopg2.Error:
+                replica.putconn(conn, close=True)
+                self._down_until[index] = time.monotonic() + self.retry_after
+                continue
+            if lagging:
+                replica.putconn(conn)
+                continue
+            self._reads[index] += 1
+            return replica, conn
+        self._fallbacks += 1
+        return None, None
+
+    def stats(self):
+        replicas = []
+        for index, replica in enumerate(self.pools):
+            lag = self._lag[index]
+            replicas.append({
+                'healthy': self._down_until[index] <= time.monotonic(),
+                'lag': lag[1] if lag else None,
+                'reads': self._reads[index],
+                **replica.stats(),
+            })
+        return {'replicas': replicas, 'primary_fallbacks': self._fallbacks}
+
+    def closeall(self):
+        for replica in self.pools:
+            replica.closeall()
+
+    def _lagging(self, index, conn):
+        measured = self._lag[index]
+        now = time.monotonic()
+        if measured is None or now - measured[0] >= self.lag_check_interval:
+            with conn.cursor() as cursor:
+                cursor.execute(self.LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+            conn.rollback()
+            measured = self._lag[index] = (now, lag)
+            if lag > self.max_lag:
+                logger.warning("Replica %d is %.1fs behind the primary", index, lag)
+        return measured[1] > self.max_lag
+
+
+# Built on first use, so importing the app needs neither a database nor DATABASE_URL
+_pool = None
+_replicas = None
+_pools_lock = threading.Lock()
+
+
+def _create_pools():
+    global _pool, _replicas
+    with _pools_lock:
+        if _pool is not None:
+            return
+        if not DATABASE_URL:
+            raise ValueError("DATABASE_URL is not set in the environment variables.")
+        _replicas = ReplicaSet(
+            [ManagedConnectionPool(
+                url,
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                timeout=DB_REPLICA_POOL_TIMEOUT,
+                max_idle=DB_POOL_MAX_IDLE,
+                healthcheck_after=DB_POOL_HEALTHCHECK_AFTER,
+                connect=connect_timed,
+            ) for url in DATABASE_REPLICA_URLS],
+            max_lag=DB_REPLICA_MAX_LAG,
+            lag_check_interval=DB_REPLICA_LAG_CHECK_INTERVAL,
+            retry_after=DB_REPLICA_RETRY_AFTER,
+        ) if DATABASE_REPLICA_URLS else None
+        _pool = ManagedConnectionPool(
+            DATABASE_URL,
+            minconn=DB_POOL_MIN,
+            maxconn=DB_POOL_MAX,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            healthcheck_after=DB_POOL_HEALTHCHECK_AFTER,
+            connect=connect_timed,
+        )
+
+
+def get_pool():
+    """The primary's connection pool, created on first use."""
+    if _pool is None:
+        _create_pools()
+    return _pool
+
+
+def get_replicas():
+    """The ReplicaSet, or None when no replicas are configured."""
+    if _pool is None:
+        _create_pools()
+    return _replicas
+
+
+def _wrote_in_request():
+    return has_request_context() and g.get('db_wrote', False)
+
+
+@contextmanager
+def get_connection(readonly=False):
+    """Borrow a pooled connection for the duration of a ``with`` block.
+
+    The transaction is committed when the block exits normally and rolled
+    back on error; the connection always goes back to the pool.
+
+    ``readonly=True`` lets the query run on a replica when one is configured
+    and current. Once a request has borrowed a primary connection for a
+    write, its later reads stay on the primary so it sees its own writes.
+    """
+    started = time.perf_counter()
+    source, conn = None, None
+    replicas = get_replicas()
+    if readonly and replicas is not None and not _wrote_in_request():
+        source, conn = replicas.getconn()
+    if conn is None:
+        primary = get_pool()
+        source, conn = primary, primary.getconn()
+        if not readonly and has_request_context():
+            g.db_wrote = True
+    observe_pool_wait(time.perf_counter() - started)
+    try:
+        with conn:
+            yield conn
+    finally:
+        source.putconn(conn)
+
+
+def pool_stats():
+    stats = get_pool().stats()
+    replicas = get_replicas()
+    if replicas is not None:
+        stats.update(replicas.stats())
+    return stats
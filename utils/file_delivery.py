@@ -0,0 +1,105 @@
+"""Sending stored uploads without pushing their bytes through Python.
+
+``IMAGE_DELIVERY`` picks who copies the file to the socket:
+
+- ``app`` (default): the response body is the open file wrapped in the
+  server's ``wsgi.file_wrapper``, which gunicorn sends with ``sendfile(2)``.
+  Range and conditional requests are answered here.
+- ``x-accel``: nginx sends it. The response only carries an
+  ``X-Accel-Redirect`` into ``IMAGE_ACCEL_PREFIX``, which must be an
+  ``internal`` location aliased to the upload folder; nginx handles Range.
+- ``x-sendfile``: the same with an absolute path in ``X-Sendfile``, for
+  Apache mod_xsendfile and lighttpd.
+
+stat() results are cached per worker, so a hot image costs one open() in
+``app`` mode and no filesystem call at all when a proxy sends it.
+"""
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from utils.cache import MISSING, MemoryCache
+
+# 'app', 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd)
+IMAGE_DELIVERY = os.getenv('IMAGE_DELIVERY', 'app')
+IMAGE_ACCEL_PREFIX = os.getenv('IMAGE_ACCEL_PREFIX', '/_uploads/')
+# Seconds a stat() result is remembered. Uploads are content-addressed and
+# never rewritten, so a stale entry can only be one that was deleted.
+FILE_STAT_TTL = float(os.getenv('FILE_STAT_TTL', 5))
+# Seconds a missing file is remembered. Off by default, so a file written by
+# another worker or process is served as soon as it exists.
+FILE_STAT_MISSING_TTL = float(os.getenv('FILE_STAT_MISSING_TTL', 0))
+FILE_STAT_CACHE_SIZE = int(os.getenv('FILE_STAT_CACHE_SIZE', 4096))
+
+# path -> (size, mtime), or None for a missing file
+stat_cache = MemoryCache(maxsize=FILE_STAT_CACHE_SIZE, ttl=FILE_STAT_TTL)
+
+
+def file_stat(path):
+    """``(size, mtime)`` of the regular file at ``path``, or None."""
+    info = stat_cache.get(path)
+    if info is MISSING:
+        try:
+            result = os.stat(path)
+            info = (result.st_size, result.st_mtime) if stat.S_ISREG(result.st_mode) else None
+        except OSError:
+            info = None
+        if info is not None:
+            stat_cache.set(path, info)
+        elif FILE_STAT_MISSING_TTL > 0:
+            stat_cache.set(path, info, ttl=FILE_STAT_MISSING_TTL)
+    return info
+
+
+def send_stored_file(root, name, max_age, etag=None, delivery=None):
+    """Response for the file ``name`` under ``root``, or None when there is none.
+
+    ``name`` may contain slashes but never leaves ``root``. Pass ``etag``
+    for content-addressed files, so every server agrees on it.
+    """
+    delivery = delivery or IMAGE_DELIVERY
+    path = safe_join(root, name)
+    info = file_stat(path) if path else None
+    if info is None:
+        return None
+    size, mtime = info
+
+    response = Response(mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                        direct_passthrough=True)
+    response.last_modified = mtime
+    response.set_etag(etag or f'{mtime:.0f}-{size}')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+
+    if delivery == 'x-accel':
+        response.headers['X-Accel-Redirect'] = IMAGE_ACCEL_PREFIX.rstrip('/') + '/' + quote(name.lstrip('/'))
+        return response.make_conditional(request.environ)
+    if delivery == 'x-sendfile':
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+        return response.make_conditional(request.environ)
+
+    # Not opened for HEAD or for a 304
+    modified = is_resource_modified(request.environ, response.get_etag()[0], last_modified=response.last_modified)
+    f = None
+    if request.method != 'HEAD' and modified:
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            # Removed since it was stat()ed
+            stat_cache.delete(path)
+            return None
+        response.response = wrap_file(request.environ, f)
+    response.content_length = size
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+    except Exception:
+        # An unsatisfiable Range raises 416; the body will never be sent
+        if f is not None:
+            f.close()
+        raise
@@ -0,0 +1,166 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256'
+# Worker processes used for hashing; 0 hashes inline on the request thread
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 2))
+# Hashing tasks allowed to be queued or running at once
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', 64))
+# Seconds a sign-up waits for a free slot before getting a 503
+HASH_QUEUE_WAIT = float(os.getenv('HASH_QUEUE_WAIT', 0.5))
+# Seconds a bulk import waits for each free slot
+HASH_BULK_WAIT = float(os.getenv('HASH_BULK_WAIT', 30))
+# Passwords hashed per task during bulk imports
+HASH_CHUNK_SIZE = int(os.getenv('HASH_CHUNK_SIZE', 16))
+RETRY_AFTER_SECONDS = 2
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+    retry_after = RETRY_AFTER_SECONDS
+
+
+def _hash_passwords(passwords, method):
+    return [generate_password_hash(password, method=method) for password in passwords]
+
+
+def _check_password(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded pool of worker processes.
+
+    Hashing is deliberately CPU-heavy; doing it in separate processes keeps
+    it off the request threads and out of the GIL. At most ``queue_size``
+    tasks are queued or running; beyond that callers get HashingBusy
+    instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, method=PASSWORD_HASH_METHOD):
+        self.workers = workers
+        self.method = method
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self.queue_size = queue_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._tasks = 0
+        self._hashed = 0
+        self._rejected = 0
+        self._seconds = 0.0
+        self._seconds_max = 0.0
+
+    def hash(self, password, wait=HASH_QUEUE_WAIT):
+        return self._run(_hash_passwords, ([password], self.method), wait)[0]
+
+    def hash_many(self, passwords, wait=HASH_BULK_WAIT, chunk_size=HASH_CHUNK_SIZE):
+        """Hash a batch in chunks spread across the pool, preserving order."""
+        if not self.workers:
+            return self._run(_hash_passwords, (list(passwords), self.method), wait)
+
+        futures = []
+        try:
+            for start in range(0, len(passwords), chunk_size):
+                chunk = list(passwords[start:start + chunk_size])
+                futures.append(self._submit(_hash_passwords, (chunk, self.method), wait))
+            hashes = []
+            for future in futures:
+                hashes.extend(future.result())
+            return hashes
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def verify(self, pwhash, password, wait=HASH_QUEUE_WAIT):
+        return self._run(_check_password, (pwhash, password), wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'tasks': self._tasks,
+                'hashed': self._hashed,
+                'rejected': self._rejected,
+                'seconds_total': self._seconds,
+                'seconds_avg': self._seconds / self._tasks if self._tasks else 0.0,
+                'seconds_max': self._seconds_max,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, func, args, wait):
+        return self._submit(func, args, wait).result()
+
+    def _submit(self, func, args, wait):
+        if not self._slots.acquire(timeout=wait):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Password hashing queue is full")
+
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight += 1
+
+        def done(future):
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._in_flight -= 1
+                self._tasks += 1
+                self._seconds += elapsed
+                self._seconds_max = max(self._seconds_max, elapsed)
+                if func is _hash_passwords and not future.cancelled() and future.exception() is None:
+                    self._hashed += len(args[0])
+            self._slots.release()
+
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = _InlineExecutor() if not self.workers else ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Forking a threaded server can deadlock; start clean interpreters instead
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+            return self._executor
+
+
+class _InlineExecutor:
+    """Executor stand-in used when HASH_WORKERS is 0."""
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.shutdown)
@@ -0,0 +1,61 @@
+import hashlib
+from functools import wraps
+from email.utils import formatdate
+
+from flask import make_response, request
+from werkzeug.http import parse_date, parse_etags, quote_etag
+
+from utils.cache import catalog_version
+
+
+def catalog_etag(version, full_path=None):
+    """Strong ETag for a URL (default: the current request's) at the given catalog version."""
+    full_path = request.full_path if full_path is None else full_path
+    return hashlib.sha1(f"{version['token']}:{full_path}".encode()).hexdigest()
+
+
+def not_modified(etag, modified, headers=None):
+    """True when If-None-Match (or, failing that, If-Modified-Since) is still current."""
+    headers = request.headers if headers is None else headers
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        # Weak comparison: compressed responses carry the weak form of the tag
+        return parse_etags(if_none_match).contains_weak(etag)
+    if_modified_since = parse_date(headers.get('If-Modified-Since'))
+    if if_modified_since:
+        return modified <= if_modified_since.timestamp()
+    return False
+
+
+def validator_headers(etag, modified):
+    return {
+        'ETag': quote_etag(etag),
+        'Last-Modified': formatdate(modified, usegmt=True),
+        # Let browsers and the CDN store responses but revalidate each use
+        'Cache-Control': 'no-cache',
+    }
+
+
+def conditional_catalog(view):
+    """Answer catalog reads with 304 when the client's validators are current.
+
+    The ETag and Last-Modified date come from the catalog version, so a
+    matching If-None-Match (or If-Modified-Since) is answered before the
+    view runs, without touching the database or serializing anything.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        version = catalog_version()
+        etag = catalog_etag(version)
+
+        if not_modified(etag, version['modified']):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            # Catalog snapshots carry validators of their own generation
+            if response.status_code != 200 or 'ETag' in response.headers:
+                return response
+
+        response.headers.update(validator_headers(etag, version['modified']))
+        return response
+    return wrapper
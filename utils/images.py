@@ -0,0 +1,185 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+
+from utils.file_delivery import file_stat, stat_cache
+
+# Pillow is imported inside the functions that decode images: it is only
+# needed on uploads and in the job worker, not to start the web app.
+
+UPLOAD_FOLDER = 'uploads/images'
+
+# Variant name -> longest edge in pixels; images are never upscaled
+IMAGE_SIZES = {'thumb': 200, 'card': 600, 'full': 1600}
+DEFAULT_IMAGE_SIZE = 'full'
+
+# (format, extension, mimetype, save options) in order of preference
+MODERN_FORMATS = [
+    ('AVIF', 'avif', 'image/avif', {'quality': 60}),
+    ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 6}),
+]
+JPEG_FALLBACK = ('JPEG', 'jpg', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True})
+PNG_FALLBACK = ('PNG', 'png', 'image/png', {'optimize': True})
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class InvalidImage(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image."""
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def is_image_hash(name):
+    return bool(HASH_PATTERN.match(name))
+
+
+def available_formats(has_alpha):
+    from PIL import features
+
+    formats = [fmt for fmt in MODERN_FORMATS if features.check(fmt[1])]
+    formats.append(PNG_FALLBACK if has_alpha else JPEG_FALLBACK)
+    return formats
+
+
+ORIGINALS_FOLDER = 'originals'
+ORIGINAL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def save_original(data, upload_folder=UPLOAD_FOLDER):
+    """Check an upload is an image and keep its bytes until variants are built.
+
+    Only the header is parsed here, so this is cheap enough for the request
+    path. Returns ``(hash, pending)``; ``pending`` is False when variants
+    for identical bytes already exist and nothing needs processing.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+            extension = ORIGINAL_EXTENSIONS.get(image.format)
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+    if extension is None:
+        raise InvalidImage("Unsupported image format")
+
+    image_hash = content_hash(data)
+    if os.path.isdir(os.path.join(upload_folder, image_hash)):
+        return image_hash, False
+
+    originals = os.path.join(upload_folder, ORIGINALS_FOLDER)
+    os.makedirs(originals, exist_ok=True)
+    path = os.path.join(originals, f'{image_hash}.{extension}')
+    if not os.path.exists(path):
+        fd, staging = tempfile.mkstemp(prefix=f'.{image_hash}-', dir=originals)
+        with os.fdopen(fd, 'wb') as staged:
+            staged.write(data)
+        os.replace(staging, path)
+        stat_cache.delete(path)
+    return image_hash, True
+
+
+def find_original(image_hash, upload_folder=UPLOAD_FOLDER):
+    """Return ``(directory, filename)`` of a stored original, or None."""
+    originals = os.path.join(upload_folder, ORIGINALS_FOLDER)
+    for extension in ORIGINAL_EXTENSIONS.values():
+        filename = f'{image_hash}.{extension}'
+        if file_stat(os.path.join(originals, filename)):
+            return originals, filename
+    return None
+
+
+def process_original(image_hash, upload_folder=UPLOAD_FOLDER):
+    """Build the variants for a previously saved original, then delete the original.
+
+    Only the stripped variants are kept: the original may carry EXIF data
+    such as the GPS position it was taken at.
+    """
+    original = find_original(image_hash, upload_folder)
+    if original is None:
+        if os.path.isdir(os.path.join(upload_folder, image_hash)):
+            return image_hash
+        raise FileNotFoundError(f"No original stored for image {image_hash}")
+    path = os.path.join(*original)
+    with open(path, 'rb') as f:
+        store_image(f.read(), upload_folder)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass  # Removed by a concurrent run of the same job
+    stat_cache.delete(path)
+    return image_hash
+
+
+def store_image(data, upload_folder=UPLOAD_FOLDER):
+    """Store resized, re-encoded variants of an upload under its content hash.
+
+    Returns the hash. Identical uploads map to the same directory, so a
+    duplicate is detected before any decoding work is done.
+    """
+    image_hash = content_hash(data)
+    target = os.path.join(upload_folder, image_hash)
+    if os.path.isdir(target):
+        return image_hash
+
+    # Build the variants next to the target and rename into place, so a
+    # half-written directory is never served.
+    os.makedirs(upload_folder, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{image_hash}-', dir=upload_folder)
+    try:
+        write_variants(data, staging)
+        os.rename(staging, target)
+        # Forget variants this worker looked for before they existed
+        stat_cache.delete_prefix(target + os.sep)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(target):  # Lost a race with an identical upload otherwise
+            raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return image_hash
+
+
+def write_variants(data, directory):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+
+    # Bake in the EXIF orientation before metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    for size, edge in IMAGE_SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((edge, edge), Image.LANCZOS)
+        variant.info = {}  # Strip EXIF, ICC, comments and other metadata
+        for fmt, extension, _, options in available_formats(has_alpha):
+            variant.save(os.path.join(directory, f'{size}.{extension}'), fmt, **options)
+
+
+def select_variant(image_hash, size, accept_mimetypes, upload_folder=UPLOAD_FOLDER):
+    """Pick the best stored file for ``size`` that the client accepts.
+
+    Returns ``(directory, filename)`` or None when nothing is stored.
+    """
+    directory = os.path.join(upload_folder, image_hash)
+    # Modern formats only when named explicitly; older browsers send */* too
+    accepted = {value for value, quality in accept_mimetypes if quality > 0}
+    for _, extension, mimetype, _ in MODERN_FORMATS + [JPEG_FALLBACK, PNG_FALLBACK]:
+        filename = f'{size}.{extension}'
+        if extension in ('jpg', 'png') or mimetype in accepted:
+            if file_stat(os.path.join(directory, filename)):
+                return directory, filename
+    return None
@@ -0,0 +1,193 @@
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import threading
+
+from psycopg2.extras import Json
+
+from models.job import Job
+from utils.db import get_connection
+
+# Seconds an idle worker sleeps between polls for new jobs
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+# A running job whose worker stopped updating it for this long is picked up again
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+# Workers refresh the lease of the job they run this often
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 3
+JOB_BACKOFF_BASE = float(os.getenv('JOB_BACKOFF_BASE', 5))
+JOB_BACKOFF_MAX = float(os.getenv('JOB_BACKOFF_MAX', 600))
+
+TASKS = {}
+
+logger = logging.getLogger(__name__)
+
+
+def task(name):
+    """Register a function as a job handler. It receives the job payload as kwargs."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def enqueue(task_name, payload=None, conn=None, delay=0, max_attempts=5):
+    """Queue a job and return its id.
+
+    Pass ``conn`` to insert the job in the caller's transaction, so the job
+    only exists if the surrounding write commits.
+    """
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown task: {task_name}")
+    query = """
+        INSERT INTO jobs (task, payload, max_attempts, run_at)
+        VALUES (%s, %s, %s, now() + %s * interval '1 second') RETURNING jobid;
+    """
+    params = (task_name, Json(payload or {}), max_attempts, delay)
+    if conn is not None:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()[0]
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()[0]
+
+
+def get_job(job_id):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {Job.columns()} FROM jobs WHERE jobid = %s;", (job_id,))
+            job = cursor.fetchone()
+
+    if job:
+        return Job.mapper()(job)
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter for the retry after ``attempts`` failures."""
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_job():
+    """Mark the next due job as running and return it, or None if the queue is empty."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            # A worker died during the last allowed attempt; don't run the job again
+            cursor.execute("""
+                UPDATE jobs SET status = 'failed', last_error = 'Worker lease expired', updated_at = now()
+                WHERE status = 'running' AND attempts >= max_attempts
+                  AND updated_at < now() - %s * interval '1 second';
+            """, (JOB_LEASE_SECONDS,))
+            # SKIP LOCKED lets any number of workers poll without blocking each other
+            cursor.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = now()
+                WHERE jobid = (
+                    SELECT jobid FROM jobs
+                    WHERE (status = 'queued' AND run_at <= now())
+                       OR (status = 'running' AND attempts < max_attempts
+                           AND updated_at < now() - %s * interval '1 second')
+                    ORDER BY run_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING jobid, task, payload, attempts, max_attempts;
+            """, (JOB_LEASE_SECONDS,))
+            return cursor.fetchone()
+
+
+def heartbeat(job_id, stop_event, interval=JOB_HEARTBEAT_SECONDS):
+    """Keep extending the lease of a running job until ``stop_event`` is set."""
+    while not stop_event.wait(interval):
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE jobs SET updated_at = now() WHERE jobid = %s AND status = 'running';",
+                                   (job_id,))
+        except Exception:
+            logger.exception("Could not extend the lease of job %s", job_id)
+
+
+def run_one():
+    """Claim and run a single job. Returns False when nothing was due."""
+    job = claim_job()
+    if job is None:
+        return False
+
+    job_id, task_name, payload, attempts, max_attempts = job
+    # Long jobs would otherwise be reclaimed and run twice once their lease expires
+    stop_heartbeat = threading.Event()
+    threading.Thread(target=heartbeat, args=(job_id, stop_heartbeat), daemon=True).start()
+    try:
+        handler = TASKS[task_name]
+        result = handler(**payload)
+    except Exception as e:
+        # The traceback goes to the logs only; job status is readable without auth
+        error = f'{type(e).__name__}: {e}'
+        if attempts >= max_attempts:
+            logger.exception("Job %s (%s) failed permanently after %s attempts", job_id, task_name, attempts)
+            status, delay = 'failed', 0
+        else:
+            delay = backoff_seconds(attempts)
+            logger.warning("Job %s (%s) failed, retrying in %.0fs", job_id, task_name, delay, exc_info=True)
+            status = 'queued'
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE jobs SET status = %s, last_error = %s, updated_at = now(),
+                        run_at = now() + %s * interval '1 second'
+                    WHERE jobid = %s;
+                """, (status, error, delay, job_id))
+        return True
+    finally:
+        stop_heartbeat.set()
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE jobs SET status = 'succeeded', result = %s, last_error = NULL, updated_at = now()
+                WHERE jobid = %s;
+            """, (Json(result), job_id))
+    logger.info("Job %s (%s) succeeded", job_id, task_name)
+    return True
+
+
+def work(stop_event=None, poll_interval=JOB_POLL_INTERVAL):
+    """Process jobs until ``stop_event`` is set, sleeping while the queue is empty."""
+    import utils.tasks  # noqa: F401  Registers the task handlers
+
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            if run_one():
+                continue
+        except Exception:
+            logger.exception("Job worker error")
+        stop_event.wait(poll_interval)
+
+
+def _worker_main():
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    logger.info("Job worker %s started", os.getpid())
+    work(stop_event)
+
+
+def run_workers(processes=1):
+    """Run ``processes`` worker processes until interrupted."""
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=_worker_main, daemon=True) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join(timeout=10)
+    return [worker.exitcode for worker in workers]
@@ -0,0 +1,70 @@
+import decimal
+import json
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder is used without it
+    orjson = None
+
+# 'auto' uses orjson when it is installed, 'stdlib' forces the json module
+JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+
+
+def _default(value):
+    # Prices come out of Postgres as Decimal; the API has always sent them as numbers
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return DefaultJSONProvider.default(value)
+
+
+def dumps_bytes(obj, indent=False, use_orjson=orjson is not None and JSON_BACKEND != 'stdlib'):
+    """Encode ``obj`` exactly as API responses are, without needing an app (snapshots, jobs)."""
+    if not use_orjson:
+        return json.dumps(obj, default=_default, separators=(',', ':'), indent=2 if indent else None).encode()
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=_default, option=option)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib encoder.
+
+    Responses keep the keys in the order controllers build them instead of
+    sorting, and encode straight to bytes. Types orjson does not handle
+    itself (Decimal, and datetimes, which Flask sends as HTTP dates) go
+    through the same ``default`` as the stdlib path, so both backends
+    produce the same values.
+    """
+
+    default = staticmethod(_default)
+    sort_keys = False
+
+    def __init__(self, app, backend=JSON_BACKEND):
+        super().__init__(app)
+        self.use_orjson = orjson is not None and backend != 'stdlib'
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson and not kwargs:
+            return self.dumps_bytes(obj).decode()
+        return super().dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj, indent=False):
+        if not self.use_orjson:
+            return super().dumps(obj, separators=(',', ':')).encode()
+        return dumps_bytes(obj, indent, use_orjson=True)
+
+    def loads(self, s, **kwargs):
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.use_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
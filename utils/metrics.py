@@ -0,0 +1,144 @@
+"""Request, database and pool instrumentation exported in Prometheus format.
+
+Set ``PROMETHEUS_MULTIPROC_DIR`` when running several worker processes
+(gunicorn -w N) so ``/metrics`` aggregates every worker's histograms.
+"""
+import logging
+import os
+import time
+
+from flask import g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from psycopg2 import extensions
+
+# Queries slower than this many seconds are logged with their SQL
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', 0.5))
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent handling a request.',
+                            ['method', 'route', 'status'])
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size as sent.', ['route'],
+                          buckets=SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram('db_queries_per_request', 'Database queries executed by one request.', ['route'],
+                            buckets=COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('db_time_per_request_seconds', 'Time one request spent in database queries.',
+                            ['route'])
+REQUEST_POOL_WAIT = Histogram('db_pool_wait_per_request_seconds',
+                              'Time one request waited for pooled connections.', ['route'])
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Time spent in cursor.execute.')
+POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent waiting to check out a connection.')
+SLOW_QUERIES = Counter('db_slow_queries', 'Queries slower than SLOW_QUERY_SECONDS.')
+
+logger = logging.getLogger(__name__)
+
+
+def observe_query(query, seconds):
+    QUERY_LATENCY.observe(seconds)
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + seconds
+    if seconds >= SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.inc()
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        logger.warning("Slow query (%.3fs): %s", seconds, ' '.join(str(query).split())[:1000])
+
+
+def observe_pool_wait(seconds):
+    POOL_WAIT.observe(seconds)
+    if has_request_context():
+        g.db_pool_wait = g.get('db_pool_wait', 0.0) + seconds
+
+
+class TimedCursor(extensions.cursor):
+    """Cursor that reports every execute to the query metrics and slow-query log."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_query(query, time.perf_counter() - started)
+
+
+def start_request_timer():
+    """``before_request`` hook."""
+    g.request_started = time.perf_counter()
+
+
+def observe_request(method, route, status, seconds, size=None, queries=0, db_time=0.0, pool_wait=0.0):
+    """Record one finished request; ``size`` is None for streamed bodies."""
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+    if size is not None:
+        RESPONSE_SIZE.labels(route).observe(size)
+    REQUEST_QUERIES.labels(route).observe(queries)
+    REQUEST_DB_TIME.labels(route).observe(db_time)
+    REQUEST_POOL_WAIT.labels(route).observe(pool_wait)
+
+
+def record_request_metrics(response):
+    """``after_request`` hook; register it first so it runs after the others."""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    observe_request(
+        request.method,
+        request.url_rule.rule if request.url_rule else 'unmatched',
+        response.status_code,
+        time.perf_counter() - started,
+        size=None if response.is_streamed else response.calculate_content_length() or 0,
+        queries=g.get('db_queries', 0),
+        db_time=g.get('db_time', 0.0),
+        pool_wait=g.get('db_pool_wait', 0.0),
+    )
+    return response
+
+
+_stats_sources = {}
+
+
+class StatsCollector:
+    """Exposes ``{name: stats function}`` snapshots (pool, cache, ...) as gauges at scrape time."""
+
+    def __init__(self, sources):
+        self.sources = sources
+
+    def collect(self):
+        for prefix, stats in self.sources.items():
+            try:
+                snapshot = stats()
+            except Exception:
+                # e.g. no DATABASE_URL: the other gauges are still worth scraping
+                logger.warning("Could not collect %s stats", prefix, exc_info=True)
+                continue
+            for key, value in snapshot.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                yield GaugeMetricFamily(f'{prefix}_{key}', f'{prefix} {key.replace("_", " ")}', value=value)
+
+
+def register_stats(sources):
+    if not _stats_sources:
+        REGISTRY.register(StatsCollector(_stats_sources))
+    _stats_sources.update(sources)
+
+
+def metrics_response(registry=REGISTRY):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # Histograms are merged across workers; the stats gauges describe
+        # only the worker that answered the scrape.
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        registry.register(StatsCollector(_stats_sources))
+    return generate_latest(registry), 200, {'Content-Type': CONTENT_TYPE_LATEST}
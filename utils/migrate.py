@@ -0,0 +1,148 @@
+"""Versioned schema migrations.
+
+Usage: ``flask db upgrade`` / ``flask db status``, or
+``python -m utils.migrate [upgrade|status]``.
+"""
+import importlib
+import logging
+import os
+import re
+import sys
+
+from utils.db import get_pool
+
+MIGRATIONS_PACKAGE = 'migrations'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), MIGRATIONS_PACKAGE)
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+# Arbitrary key for pg_advisory_lock so concurrent deploys apply migrations once
+MIGRATION_LOCK_ID = 720_514_001
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    def __init__(self, version, name, statements, concurrently=False):
+        self.version = version
+        self.name = name
+        self.statements = statements
+        self.concurrently = concurrently
+
+    def __repr__(self):
+        return f"Migration({self.version:04d}_{self.name})"
+
+
+def discover_migrations(directory=MIGRATIONS_DIR, package=MIGRATIONS_PACKAGE):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        module = importlib.import_module(f'{package}.{filename[:-3]}')
+        migrations.append(Migration(
+            int(match.group(1)), match.group(2), list(module.statements),
+            getattr(module, 'concurrently', False),
+        ))
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(conn, migration):
+    if migration.concurrently:
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                for statement in migration.statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                               (migration.version, migration.name))
+        finally:
+            conn.autocommit = False
+    else:
+        with conn:
+            with conn.cursor() as cursor:
+                for statement in migration.statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                               (migration.version, migration.name))
+
+
+def upgrade(migrations=None):
+    """Apply every pending migration in version order. Returns those applied."""
+    migrations = discover_migrations() if migrations is None else migrations
+    applied = []
+    connection_pool = get_pool()
+    conn = connection_pool.getconn()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            # Session-level lock: held across the per-migration transactions below
+            cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+            try:
+                ensure_version_table(cursor)
+                done = applied_versions(cursor)
+                conn.autocommit = False
+                for migration in migrations:
+                    if migration.version in done:
+                        continue
+                    logger.info("Applying %r", migration)
+                    apply_migration(conn, migration)
+                    applied.append(migration)
+            finally:
+                conn.autocommit = True
+                cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+    finally:
+        conn.autocommit = False
+        connection_pool.putconn(conn)
+    return applied
+
+
+def status(migrations=None):
+    """Return ``[(migration, applied)]`` for every known migration."""
+    migrations = discover_migrations() if migrations is None else migrations
+    connection_pool = get_pool()
+    conn = connection_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cursor:
+                ensure_version_table(cursor)
+                done = applied_versions(cursor)
+    finally:
+        connection_pool.putconn(conn)
+    return [(migration, migration.version in done) for migration in migrations]
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    command = (argv or sys.argv[1:] or ['upgrade'])[0]
+    if command == 'upgrade':
+        applied = upgrade()
+        print(f"Applied {len(applied)} migration(s).")
+    elif command == 'status':
+        for migration, applied in status():
+            print(f"[{'x' if applied else ' '}] {migration.version:04d}_{migration.name}")
+    else:
+        print(f"Unknown command: {command} (expected 'upgrade' or 'status')")
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
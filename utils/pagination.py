@@ -0,0 +1,86 @@
+import base64
+import binascii
+from urllib.parse import urlencode
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_IDS = 100
+
+
+class PaginationError(ValueError):
+    """Raised for malformed limit, cursor or fields query parameters."""
+
+
+def encode_cursor(last_id):
+    """Opaque token pointing just past ``last_id``."""
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be at least 1')
+    return min(limit, maximum)
+
+
+def parse_fields(value, allowed, required=()):
+    """Return the requested field names, in ``allowed`` order.
+
+    ``required`` fields are always included (e.g. the keyset column).
+    An empty value selects every allowed field.
+    """
+    if not value:
+        return list(allowed)
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise PaginationError('Unknown fields: ' + ', '.join(sorted(unknown)))
+    requested.update(required)
+    return [field for field in allowed if field in requested]
+
+
+def parse_ids(value, maximum=MAX_BATCH_IDS):
+    """Ids from a ``1,2,3`` query value or a JSON list, deduplicated in request order."""
+    if isinstance(value, str):
+        value = [part.strip() for part in value.split(',') if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise PaginationError('ids must be a non-empty list of integers')
+    ids = []
+    for item in value:
+        if isinstance(item, bool) or not isinstance(item, (int, str)):
+            raise PaginationError('ids must be a non-empty list of integers')
+        try:
+            ids.append(int(item))
+        except ValueError:
+            raise PaginationError('ids must be a non-empty list of integers')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > maximum:
+        raise PaginationError(f'At most {maximum} ids per request')
+    return ids
+
+
+def page_headers(next_cursor, path, args):
+    """Response headers advertising the next page, if there is one."""
+    if next_cursor is None:
+        return {}
+    query = {key: value for key, value in args.items() if key != 'cursor'}
+    query['cursor'] = next_cursor
+    return {
+        'X-Next-Cursor': next_cursor,
+        'Link': f'<{path}?{urlencode(query)}>; rel="next"',
+    }
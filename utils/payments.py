@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+
+from utils.cache import MISSING, MemoryCache
+
+STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
+# Point at a local stub (e.g. stripe-mock) in development and tests
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+# Seconds to connect to / wait for a response from Stripe
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 3))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 10))
+# Retries on network errors and 409/5xx; Stripe dedupes them by idempotency key
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', 2))
+PAYMENT_CURRENCY = os.getenv('PAYMENT_CURRENCY', 'usd')
+# How long a retried checkout gets the intent created by its first attempt
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+_client = None
+_client_lock = threading.Lock()
+
+# scoped idempotency key -> (request fingerprint, response body); per worker process
+idempotency_cache = MemoryCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL)
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request."""
+
+
+class PaymentProviderError(Exception):
+    """Stripe rejected the request or could not be reached."""
+
+
+def create_stripe_client(api_key=STRIPE_SECRET_KEY, api_base=STRIPE_API_BASE,
+                         timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT), max_retries=STRIPE_MAX_RETRIES):
+    # The Stripe SDK and requests take longer to import than the rest of the
+    # app together, so they are loaded with the first payment
+    import requests
+    import stripe
+
+    # One requests.Session keeps TLS connections to Stripe alive between calls
+    http_client = stripe.RequestsClient(timeout=timeout, session=requests.Session())
+    base_addresses = {'api': api_base} if api_base else None
+    return stripe.StripeClient(api_key, http_client=http_client, max_network_retries=max_retries,
+                               base_addresses=base_addresses)
+
+
+def stripe_client():
+    """The process-wide Stripe client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_stripe_client()
+    return _client
+
+
+def fingerprint(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def scoped_key(scope, idempotency_key):
+    """The key sent to Stripe and cached here for ``idempotency_key`` from the caller ``scope``.
+
+    Clients pick their own keys, so two of them may send the same one;
+    scoping keeps one client from ever receiving another's intent.
+    """
+    digest = hashlib.sha256(f'{scope}\n{idempotency_key}'.encode()).hexdigest()
+    return f'payment-intent-{digest}'
+
+
+def create_payment_intent(request_data, build_params, idempotency_key=None, scope=''):
+    """Create a PaymentIntent and return the response body for the client.
+
+    ``build_params()`` returns the Stripe parameters and is only
+    called when the request is not a known retry. With an
+    ``idempotency_key`` a retried request from the same ``scope`` (the
+    caller's identity) gets the first attempt's intent: from this worker's
+    cache when it has it, otherwise from Stripe, which receives the same
+    scoped key. Reusing a key for different ``request_data`` raises
+    IdempotencyConflict; Stripe failures raise PaymentProviderError.
+    """
+    import stripe
+
+    request_fingerprint = fingerprint(request_data)
+    if idempotency_key:
+        idempotency_key = scoped_key(scope, idempotency_key)
+        cached = idempotency_cache.get(idempotency_key)
+        if cached is not MISSING:
+            if cached[0] != request_fingerprint:
+                raise IdempotencyConflict(idempotency_key)
+            return cached[1]
+
+    params = build_params()
+    options = {'idempotency_key': idempotency_key} if idempotency_key else None
+    try:
+        intent = stripe_client().v1.payment_intents.create(params=params, options=options)
+    except stripe.IdempotencyError:
+        raise IdempotencyConflict(idempotency_key)
+    except stripe.StripeError as e:
+        raise PaymentProviderError(str(e)) from e
+
+    body = {'clientSecret': intent.client_secret, 'amount': intent.amount, 'currency': intent.currency}
+    if idempotency_key:
+        idempotency_cache.set(idempotency_key, (request_fingerprint, body))
+    return body
@@ -0,0 +1,135 @@
+import logging
+import os
+import time
+
+from flask import request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from limits import parse_many
+
+from utils import db
+from utils.cache import CACHE_BACKEND, CACHE_REDIS_URL
+from utils.hashing import password_hasher
+from utils.streaming import wants_stream
+
+# Counters must be shared by every worker process, so use Redis whenever the
+# catalog cache does; memory:// only limits per process.
+RATELIMIT_STORAGE_URI = os.getenv(
+    'RATELIMIT_STORAGE_URI', CACHE_REDIS_URL if CACHE_BACKEND == 'redis' else 'memory://')
+
+# Set to 0 to switch per-client limits off, e.g. for load tests
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', '1') not in ('0', 'false', 'no')
+# Per-client limits (flask-limiter syntax; several separated by ';')
+RATE_LIMIT_DEFAULT = os.getenv('RATE_LIMIT_DEFAULT', '600/minute')
+RATE_LIMIT_SIGNUP = os.getenv('RATE_LIMIT_SIGNUP', '10/minute;50/hour')
+RATE_LIMIT_BULK_SIGNUP = os.getenv('RATE_LIMIT_BULK_SIGNUP', '5/hour')
+RATE_LIMIT_PAYMENT = os.getenv('RATE_LIMIT_PAYMENT', '20/minute')
+RATE_LIMIT_EXPORT = os.getenv('RATE_LIMIT_EXPORT', '10/hour')
+
+# Shed database-bound requests while this many requests wait for a connection...
+SHED_POOL_WAITERS = int(os.getenv('SHED_POOL_WAITERS', 20))
+# ...or while recent connection checkouts averaged more than this many seconds
+# and every connection is still in use
+SHED_POOL_WAIT = float(os.getenv('SHED_POOL_WAIT', 1.0))
+SHED_RETRY_AFTER = int(os.getenv('SHED_RETRY_AFTER', 2))
+OVERLOADED_MESSAGE = {'message': 'Service is overloaded, please try again shortly'}
+
+# Endpoints that never borrow a database connection
+NO_DB_ENDPOINTS = {'static', 'api.serve_image', 'api.db_pool_stats', 'api.cache_stats', 'api.hashing_stats',
+                   'api.load_stats', 'api.metrics'}
+# Endpoints that queue work on the password hashing pool
+HASHING_ENDPOINTS = {'api.user_creation', 'api.bulk_user_creation'}
+
+# Clients are identified by address; behind a proxy, wrap the app in
+# werkzeug's ProxyFix so this is the client's address and not the proxy's.
+limiter = Limiter(
+    get_remote_address,
+    default_limits=[RATE_LIMIT_DEFAULT],
+    storage_uri=RATELIMIT_STORAGE_URI,
+    # Off: it would stamp Retry-After on every response, including our 503s
+    headers_enabled=False,
+    # If Redis is unreachable, keep limiting per process instead of failing requests
+    swallow_errors=True,
+    in_memory_fallback_enabled=True,
+    enabled=RATELIMIT_ENABLED,
+)
+
+# The default limits for requests served outside Flask (the async read handlers)
+DEFAULT_LIMITS = parse_many(RATE_LIMIT_DEFAULT)
+
+shed_counts = {'pool': 0, 'hashing': 0}
+
+logger = logging.getLogger(__name__)
+
+
+def not_export():
+    """``exempt_when`` for listing routes: only full streamed dumps count against the export limit."""
+    return not wants_stream(request.args)
+
+
+def overload_reason(endpoint, pool, hashing):
+    """Why a request for ``endpoint`` should be shed, given pool and hasher stats, or None."""
+    if endpoint is None or endpoint in NO_DB_ENDPOINTS:
+        return None
+    if endpoint in HASHING_ENDPOINTS and hashing['in_flight'] >= hashing['queue_size']:
+        return 'hashing'
+    if pool['waiting'] >= SHED_POOL_WAITERS:
+        return 'pool'
+    # Slow recent checkouts only count while the pool is still busy; shed
+    # requests never check out, so they cannot bring the average down
+    saturated = pool['waiting'] or pool['in_use'] >= pool['max_size']
+    if saturated and pool['wait_time_recent'] > SHED_POOL_WAIT:
+        return 'pool'
+    return None
+
+
+def check_overload(endpoint, pool):
+    """The reason to shed a request for ``endpoint`` given ``pool`` stats, counted, or None."""
+    reason = overload_reason(endpoint, pool, password_hasher.stats())
+    if reason is not None:
+        shed_counts[reason] += 1
+    return reason
+
+
+def shed_load():
+    """``before_request`` hook: refuse work up front while the service is saturated.
+
+    Answering 503 straight away is cheaper for everyone than letting the
+    request queue for a connection or hashing slot it would time out on.
+    """
+    # Before the pool is touched: these routes work without DATABASE_URL
+    if request.endpoint is None or request.endpoint in NO_DB_ENDPOINTS:
+        return None
+    if check_overload(request.endpoint, db.get_pool().stats()) is None:
+        return None
+    return OVERLOADED_MESSAGE, 503, {'Retry-After': str(SHED_RETRY_AFTER)}
+
+
+def retry_after_seconds():
+    """Seconds until the limit that was just breached resets."""
+    current = limiter.current_limit
+    return max(1, int(current.reset_at - time.time())) if current else SHED_RETRY_AFTER
+
+
+def hit_default_limits(client, endpoint):
+    """Count a request served outside Flask against ``client``'s default limits.
+
+    Uses flask-limiter's storage and keys, so a client has one budget per
+    endpoint whichever server answers it. Returns ``(limit, retry_after)``
+    for a breached limit, or None.
+    """
+    if not limiter.enabled:
+        return None
+    try:
+        for limit in DEFAULT_LIMITS:
+            if not limiter.limiter.hit(limit, client, endpoint):
+                reset_at = limiter.limiter.get_window_stats(limit, client, endpoint).reset_time
+                return limit, max(1, int(reset_at - time.time()))
+    except Exception:
+        # Like swallow_errors: an unreachable store does not fail requests
+        logger.exception("Rate limit storage failed")
+    return None
+
+
+def shedding_stats():
+    return dict(shed_counts)
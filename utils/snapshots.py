@@ -0,0 +1,263 @@
+"""Pre-serialized catalog snapshots served without touching the database.
+
+``flask snapshot`` (or the job queued by every product write) reads the
+catalog once and writes every default listing page, the full listings
+streamed by ``?stream=1`` and the category list as JSON files, each with
+``.br``/``.gz`` copies, into a new generation directory. A ``current``
+symlink is then swapped to it, so readers see either the old or the new
+generation and never a half-written one.
+
+With ``CATALOG_SNAPSHOTS=disk`` the catalog routes send those files from
+disk; with ``mmap`` each worker maps them into memory. Requests a snapshot
+does not cover (other limits, ``fields``, cursors that are not page
+boundaries) and catalogs without a snapshot yet still go to Postgres.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from itertools import groupby
+
+from flask import Response, make_response, request
+
+from models.category import Category
+from models.product import Product
+from utils.compression import STATIC_ENCODINGS, available_encodings, choose_encoding, compress, send_static, weak_etag
+from utils.db import get_connection
+from utils.http_cache import catalog_etag, not_modified, validator_headers
+from utils.json_provider import dumps_bytes
+from utils.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, page_headers, parse_limit
+from utils.streaming import wants_stream
+
+# 'off' serves the catalog from Postgres, 'disk' from snapshot files, 'mmap' from mapped snapshot files
+CATALOG_SNAPSHOTS = os.getenv('CATALOG_SNAPSHOTS', 'off')
+CATALOG_SNAPSHOT_DIR = os.getenv(
+    'CATALOG_SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'snapshots'))
+# Generations kept besides the current one, for requests still reading them
+SNAPSHOT_KEEP = 1
+# Snapshots are rewritten on every product write; quality 11 takes ~40x longer for ~6% smaller files
+SNAPSHOT_BROTLI_QUALITY = 9
+
+MANIFEST = 'manifest.json'
+CURRENT = 'current'
+LOCK = '.lock'
+# Bytes copied out of a mapped snapshot per write to the client
+MAPPED_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_manifests = {}  # generation -> manifest
+_mapped = {}  # (generation, filename) -> mmap; holds only the current generation
+
+
+def enabled():
+    return CATALOG_SNAPSHOTS != 'off'
+
+
+def snapshot_file(scope, args):
+    """The snapshot file answering a listing request in ``scope``, or None if it needs the database."""
+    if wants_stream(args):
+        return f'{scope}/all.json' if set(args) == {'stream'} else None
+    if set(args) - {'limit', 'cursor'} or parse_limit(args.get('limit')) != DEFAULT_PAGE_SIZE:
+        return None
+    return f'{scope}/{decode_cursor(args.get("cursor"))}.json'
+
+
+def read_catalog():
+    """``(categories, products)`` as the API serializes them, read in one consistent transaction."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+            cursor.execute(f"SELECT {Category.columns()} FROM categories;")
+            categories = list(map(Category.mapper(), cursor.fetchall()))
+            cursor.execute(f"SELECT {Product.columns()} FROM products ORDER BY productid;")
+            products = list(map(Product.mapper(), cursor.fetchall()))
+    return categories, products
+
+
+def listing_files(scope, products, page_size=DEFAULT_PAGE_SIZE):
+    """``{filename: (body, next_cursor)}`` for every page of ``products`` plus the full listing."""
+    files = {f'{scope}/all.json': (products, None)}
+    for start in range(0, len(products), page_size):
+        page = products[start:start + page_size]
+        after_id = products[start - 1]['product_id'] if start else 0
+        has_next = start + page_size < len(products)
+        files[f'{scope}/{after_id}.json'] = (page, encode_cursor(page[-1]['product_id']) if has_next else None)
+    return files
+
+
+@contextmanager
+def writer_lock(directory):
+    """Hold the snapshot directory's lock, shared by every thread and process writing to it."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK), 'wb') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield  # Closing the file releases it
+
+
+def generate_snapshot(directory=None):
+    """Write a new snapshot generation, make it current and return its name.
+
+    Writers take turns from reading the catalog to swapping the link, so
+    a refresh that read older rows can never replace a newer snapshot.
+    """
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    with writer_lock(directory):
+        return _write_generation(directory)
+
+
+def _write_generation(directory):
+    started = time.perf_counter()
+    created_at = int(time.time())
+    categories, products = read_catalog()
+
+    files = {}
+    if categories:
+        files['categories.json'] = ({'categories': categories}, None)
+    if products:
+        files.update(listing_files('products', products))
+    by_category = sorted((p for p in products if p['category_id'] is not None), key=lambda p: p['category_id'])
+    for category_id, group in groupby(by_category, key=lambda p: p['category_id']):
+        files.update(listing_files(f'category/{category_id}', list(group)))
+
+    generation = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(created_at))}-{uuid.uuid4().hex[:8]}"
+    staging = tempfile.mkdtemp(prefix=f'.{generation}-', dir=directory)
+    try:
+        for name, (body, _) in files.items():
+            write_file(staging, name, dumps_bytes(body) + b'\n')
+        manifest = {
+            'generation': generation,
+            'created_at': created_at,
+            'files': {name: next_cursor for name, (_, next_cursor) in files.items()},
+        }
+        with open(os.path.join(staging, MANIFEST), 'wb') as f:
+            f.write(dumps_bytes(manifest))
+        os.rename(staging, os.path.join(directory, generation))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Swapping a symlink with rename is atomic
+    link = os.path.join(directory, f'.{CURRENT}-{generation}')
+    os.symlink(generation, link)
+    os.replace(link, os.path.join(directory, CURRENT))
+    remove_old_generations(directory, generation)
+    logger.info("Catalog snapshot %s: %d files, %d products in %.0f ms", generation, len(files), len(products),
+                (time.perf_counter() - started) * 1000)
+    return generation
+
+
+def write_file(directory, name, data):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    for encoding, suffix in STATIC_ENCODINGS:
+        if encoding in available_encodings():
+            with open(path + suffix, 'wb') as f:
+                f.write(compress(data, encoding, SNAPSHOT_BROTLI_QUALITY if encoding == 'br' else 9))
+
+
+def remove_old_generations(directory, current):
+    # Oldest first; names only order generations made in different seconds
+    generations = sorted((name for name in os.listdir(directory)
+                          if not name.startswith('.') and name not in (CURRENT, current)),
+                         key=lambda name: os.stat(os.path.join(directory, name)).st_mtime_ns)
+    for name in generations[:max(0, len(generations) - SNAPSHOT_KEEP)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def current_generation(directory=CATALOG_SNAPSHOT_DIR):
+    try:
+        return os.readlink(os.path.join(directory, CURRENT))
+    except OSError:
+        return None
+
+
+def load_manifest(generation, directory=CATALOG_SNAPSHOT_DIR):
+    manifest = _manifests.get(generation)
+    if manifest is None:
+        with open(os.path.join(directory, generation, MANIFEST), 'rb') as f:
+            manifest = json.load(f)
+        with _lock:
+            _manifests.clear()
+            _manifests[generation] = manifest
+    return manifest
+
+
+def mapped_file(generation, filename, directory=CATALOG_SNAPSHOT_DIR):
+    key = (generation, filename)
+    buffer = _mapped.get(key)
+    if buffer is None:
+        with open(os.path.join(directory, generation, filename), 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with _lock:
+            if any(mapped_generation != generation for mapped_generation, _ in _mapped):
+                # The mappings stay valid after their files are removed; drop them once superseded
+                _mapped.clear()
+            _mapped[key] = buffer
+    return buffer
+
+
+def mapped_chunks(buffer):
+    # WSGI servers want bytes; slicing a chunk at a time never holds a whole copy of the file
+    for start in range(0, len(buffer), MAPPED_CHUNK_SIZE):
+        yield buffer[start:start + MAPPED_CHUNK_SIZE]
+
+
+def mapped_response(buffer):
+    response = Response(mapped_chunks(buffer), mimetype='application/json', direct_passthrough=True)
+    response.content_length = len(buffer)
+    return response
+
+
+def file_response(generation, name, mode, directory):
+    if mode == 'disk':
+        return send_static(os.path.join(directory, generation), name)
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    suffix = dict(STATIC_ENCODINGS).get(encoding)
+    if suffix and os.path.exists(os.path.join(directory, generation, name + suffix)):
+        response = mapped_response(mapped_file(generation, name + suffix, directory))
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = mapped_response(mapped_file(generation, name, directory))
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def serve_snapshot(name, mode=None, directory=None):
+    """Response for snapshot file ``name``, or None when the current snapshot does not have it.
+
+    Validators are derived from the snapshot generation, so they change
+    exactly when a new snapshot is published.
+    """
+    if name is None:
+        return None
+    mode = mode or CATALOG_SNAPSHOTS
+    directory = directory or CATALOG_SNAPSHOT_DIR
+    generation = current_generation(directory)
+    if generation is None:
+        return None
+    manifest = load_manifest(generation, directory)
+    if name not in manifest['files']:
+        return None
+
+    etag = catalog_etag({'token': generation})
+    headers = validator_headers(etag, manifest['created_at'])
+    headers.update(page_headers(manifest['files'][name], request.path, request.args))
+    if not_modified(etag, manifest['created_at']):
+        response = make_response('', 304)
+    else:
+        response = file_response(generation, name, mode, directory)
+    response.headers.update(headers)
+    if 'Content-Encoding' in response.headers:
+        response.headers['ETag'] = weak_etag(response.headers['ETag'])
+    return response
@@ -0,0 +1,4 @@
+"""Marks when loading the app began; app.py imports this before anything else."""
+import time
+
+STARTED = time.perf_counter()
@@ -0,0 +1,50 @@
+import logging
+import os
+import uuid
+
+from flask import Response, current_app, stream_with_context
+
+from utils.db import get_connection
+
+# Rows fetched from the server-side cursor per round trip
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))
+
+logger = logging.getLogger(__name__)
+
+
+def wants_stream(args):
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_rows(query, params, row_to_dict, prefix='[', suffix=']', batch_size=STREAM_BATCH_SIZE):
+    """Stream a query result as a chunked JSON array.
+
+    Rows are read through a named (server-side) cursor ``batch_size`` at a
+    time, so memory stays flat regardless of how many rows match. ``prefix``
+    and ``suffix`` wrap the array, e.g. ``'{"users": ['`` and ``']}'``.
+    """
+    def generate():
+        with get_connection(readonly=True) as conn:
+            with conn.cursor(name=f'stream_{uuid.uuid4().hex}') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                yield prefix
+                separator = ''
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    dumps = current_app.json.dumps
+                    yield separator + ','.join(dumps(row_to_dict(row)) for row in rows)
+                    separator = ','
+                yield suffix
+
+    def guarded():
+        # Headers are already sent once streaming starts, so the best we can
+        # do on failure is log it; the client sees a truncated body.
+        try:
+            yield from generate()
+        except Exception:
+            logger.exception("Error while streaming query results")
+
+    return Response(stream_with_context(guarded()), mimetype='application/json')
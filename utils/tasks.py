@@ -0,0 +1,34 @@
+"""Background job handlers. Importing this module registers them with utils.jobs."""
+from utils.cache import catalog_cache, get_or_load
+from utils.images import process_original
+from utils.jobs import task
+
+PROCESS_IMAGE = 'process_image'
+WARM_CATALOG_CACHE = 'warm_catalog_cache'
+REFRESH_CATALOG_SNAPSHOT = 'refresh_catalog_snapshot'
+
+
+@task(PROCESS_IMAGE)
+def process_image(image_hash):
+    process_original(image_hash)
+    return {'image_hash': image_hash}
+
+
+@task(WARM_CATALOG_CACHE)
+def warm_catalog_cache(category_id=None):
+    # Imported here to avoid a cycle: the controllers enqueue these tasks
+    from controllers.category_controller import load_categories
+    from controllers.product_controller import fetch_product_page
+
+    get_or_load(catalog_cache, 'categories', load_categories)
+    fetch_product_page(args={})
+    if category_id is not None:
+        fetch_product_page(category_id, args={})
+    return {'category_id': category_id}
+
+
+@task(REFRESH_CATALOG_SNAPSHOT)
+def refresh_catalog_snapshot():
+    from utils.snapshots import generate_snapshot
+
+    return {'generation': generate_snapshot()}
@@ -0,0 +1,54 @@
+"""Optional worker warm-up, run by the server entry points before a worker takes traffic.
+
+Set ``WARM_UP=1`` to open ``WARM_UP_CONNECTIONS`` database connections,
+fill the catalog cache and import the modules the app otherwise loads on
+first use. A failed warm-up is logged and the app starts cold instead.
+Under gunicorn it runs in each worker after the fork (``gunicorn.conf.py``),
+so it also works with ``--preload``.
+"""
+import logging
+import os
+import time
+
+from utils.db import DB_POOL_MIN, get_pool
+
+WARM_UP = os.getenv('WARM_UP', '0') not in ('0', 'false', 'no')
+# Connections opened ahead of the first request
+WARM_UP_CONNECTIONS = int(os.getenv('WARM_UP_CONNECTIONS', max(DB_POOL_MIN, 4)))
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(connections=WARM_UP_CONNECTIONS):
+    """Prepare this worker for traffic and return the seconds it took."""
+    started = time.perf_counter()
+    steps = [
+        ('connections', lambda: get_pool().prefill(connections)),
+        ('catalog cache', warm_catalog),
+        ('lazy imports', import_lazy_modules),
+    ]
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %r failed", name)
+        else:
+            logger.debug("Warm-up step %r took %.0f ms", name, (time.perf_counter() - step_started) * 1000)
+    return time.perf_counter() - started
+
+
+def warm_catalog():
+    from utils.tasks import warm_catalog_cache
+
+    warm_catalog_cache()
+
+
+def import_lazy_modules():
+    # Pillow for uploads and image variants; Stripe's SDK and client for payments
+    import PIL.Image  # noqa: F401
+    import stripe  # noqa: F401
+    from utils.payments import STRIPE_SECRET_KEY, stripe_client
+
+    if STRIPE_SECRET_KEY:
+        stripe_client()